@@ -0,0 +1,109 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Set, Tuple
+
+
+class Overloaded(Exception):
+    """Raised by AdmissionController.acquire when a request is shed."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Overloaded: {reason}")
+        self.reason = reason
+
+
+class AdmissionController:
+    """Bounded admission in front of the reply pipeline.
+
+    At most `max_in_flight` replies run at once, and at most one per user.
+    Other requests wait in a FIFO queue of up to `max_queue` entries for at
+    most `max_wait` seconds; a user's requests are admitted in order. A
+    request is shed (Overloaded) when:
+      - queue_full: the queue is at capacity;
+      - user_busy: that user already has a request waiting and the queue
+        holds at least `busy_queue` entries (half of `max_queue` by default),
+        so one chatty user can't crowd others out under load;
+      - timeout: it waited `max_wait` without being admitted.
+    A waiter held back only by its own user's running reply does not block
+    the waiters behind it.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 16,
+        max_queue: int = 100,
+        max_wait: float = 15.0,
+        busy_queue: Optional[int] = None,
+    ):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.busy_queue = self.max_queue // 2 if busy_queue is None else max(0, busy_queue)
+        self._active: Set[str] = set()
+        self._queue: Deque[Tuple[str, asyncio.Future]] = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.shed: Dict[str, int] = {"queue_full": 0, "user_busy": 0, "timeout": 0}
+
+    def _can_run(self, user_id: str) -> bool:
+        return len(self._active) < self.max_in_flight and user_id not in self._active
+
+    def _start(self, user_id: str):
+        self._active.add(user_id)
+        self.admitted += 1
+
+    def _reject(self, reason: str):
+        self.shed[reason] += 1
+        raise Overloaded(reason)
+
+    def _grant(self):
+        for waiter in list(self._queue):
+            if len(self._active) >= self.max_in_flight:
+                break
+            user_id, future = waiter
+            if user_id not in self._active and not future.done():
+                self._queue.remove(waiter)
+                self._start(user_id)
+                future.set_result(None)
+
+    async def acquire(self, user_id: str) -> float:
+        """Wait for a slot; return the seconds spent queued. Raises Overloaded."""
+        if self._can_run(user_id):
+            self._start(user_id)
+            return 0.0
+        if len(self._queue) >= self.busy_queue and any(waiting == user_id for waiting, _ in self._queue):
+            self._reject("user_busy")
+        if len(self._queue) >= self.max_queue:
+            self._reject("queue_full")
+
+        waiter = (user_id, asyncio.get_running_loop().create_future())
+        self._queue.append(waiter)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait((waiter[1],), timeout=self.max_wait)
+        except asyncio.CancelledError:
+            if waiter[1].done():
+                self.release(user_id)  # admitted just as we were cancelled
+            else:
+                self._queue.remove(waiter)
+                waiter[1].cancel()
+            raise
+        if not waiter[1].done():
+            self._queue.remove(waiter)
+            waiter[1].cancel()
+            self._reject("timeout")
+        return time.monotonic() - started
+
+    def release(self, user_id: str):
+        self._active.discard(user_id)
+        self._grant()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._active),
+            "queue_length": len(self._queue),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            **{f"shed_{reason}": count for reason, count in self.shed.items()},
+        }
@@ -0,0 +1,83 @@
+"""Import-time benchmark for the bot's entry points.
+
+Each module is imported in a fresh interpreter several times; the table shows
+the median wall time over a bare interpreter start, and `--detail` lists the
+slowest imports of one run (from `python -X importtime`).
+
+    python bench_import.py
+    python bench_import.py core daily_wisher --runs 10 --detail
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+DEFAULT_MODULES = ["core", "gemini_client", "daily_wisher", "main", "list_models"]
+# Dummy ids so modules that need them at import time can load
+BENCH_ENV = {"GUILD_ID": "1", "CATEGORY_ID": "1", "CHANNEL_ID": "1"}
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    for key, value in BENCH_ENV.items():
+        env.setdefault(key, value)
+    return env
+
+
+def time_import(code: str, runs: int) -> float:
+    """Median seconds to run `code` in a fresh interpreter."""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], env=_env(), check=True, capture_output=True)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def slowest_imports(module: str, top: int) -> List[Tuple[int, str]]:
+    """(cumulative microseconds, package) for the `top` slowest imports."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=_env(),
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:  self [us] | cumulative | package"
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time of the bot's modules")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--detail", action="store_true", help="List the slowest imports of each module")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    baseline = time_import("pass", args.runs)
+    print(f"Interpreter start: {baseline * 1000:.0f} ms (median of {args.runs})")
+    print(f"{'module':<20} {'import ms':>10}")
+    for module in args.modules:
+        try:
+            elapsed = time_import(f"import {module}", args.runs) - baseline
+        except subprocess.CalledProcessError as e:
+            print(f"{module:<20} {'failed':>10}  {e.stderr.decode(errors='replace').strip().splitlines()[-1]}")
+            continue
+        print(f"{module:<20} {elapsed * 1000:>10.0f}")
+        if args.detail:
+            for cumulative, name in slowest_imports(module, args.top):
+                print(f"    {cumulative / 1000:>8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable, Optional, Union
+
+import discord
+
+# send(recipient) -> None. Rate limits propagate as discord.RateLimited /
+# HTTPException(429); every other outcome is the callback's business.
+SendFn = Callable[[Any], Awaitable[None]]
+
+
+@dataclass
+class BroadcastStats:
+    sent: int = 0
+    rate_limited: int = 0
+    gave_up: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def per_second(self) -> float:
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    if isinstance(error, discord.RateLimited):
+        return error.retry_after
+    if isinstance(error, discord.HTTPException) and error.status == 429:
+        try:
+            return float(error.response.headers.get("Retry-After", 1.0))
+        except (AttributeError, TypeError, ValueError):
+            return 1.0
+    return None
+
+
+class BroadcastEngine:
+    """Send to many recipients with bounded, self-adjusting concurrency.
+
+    discord.py already queues each request behind its route's rate-limit
+    bucket (from the X-RateLimit-* headers), so throughput follows whatever
+    Discord actually allows. When a bucket makes us wait longer than the
+    client's `max_ratelimit_timeout`, the send fails with RateLimited: the
+    engine then halves its concurrency (AIMD), waits out that recipient's
+    Retry-After and retries it, and grows back by one slot per run of clean
+    sends. Recipients may be an iterable or an async iterable and are
+    consumed lazily, so sending starts before enumeration finishes.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 5,
+        *,
+        min_concurrency: int = 1,
+        max_retries: int = 3,
+        grow_after: int = 20,
+        progress_interval: float = 10.0,
+        label: str = "Broadcast",
+    ):
+        self.max_concurrency = max(1, concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.limit = self.max_concurrency
+        self.max_retries = max_retries
+        self.grow_after = max(1, grow_after)
+        self.progress_interval = progress_interval
+        self.label = label
+        self._active = 0
+        self._clean_streak = 0
+        self._cond: Optional[asyncio.Condition] = None
+
+    async def _acquire_slot(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._active < self.limit)
+            self._active += 1
+
+    async def _release_slot(self):
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def _on_success(self):
+        self._clean_streak += 1
+        if self._clean_streak >= self.grow_after and self.limit < self.max_concurrency:
+            self.limit += 1
+            self._clean_streak = 0
+
+    def _on_rate_limit(self):
+        self._clean_streak = 0
+        self.limit = max(self.min_concurrency, self.limit // 2)
+
+    async def _send_one(self, recipient: Any, send: SendFn, stats: BroadcastStats):
+        for attempt in range(self.max_retries + 1):
+            await self._acquire_slot()
+            try:
+                await send(recipient)
+            except (discord.RateLimited, discord.HTTPException) as e:
+                delay = _retry_after(e)
+                if delay is None:
+                    raise
+                stats.rate_limited += 1
+                self._on_rate_limit()
+            else:
+                stats.sent += 1
+                self._on_success()
+                return
+            finally:
+                await self._release_slot()
+            if attempt < self.max_retries:
+                print(f"{self.label}: rate limited, backing off {delay:.1f}s (concurrency now {self.limit})")
+                await asyncio.sleep(delay)
+        stats.gave_up += 1
+
+    async def run(
+        self,
+        recipients: Union[Iterable[Any], AsyncIterable[Any]],
+        send: SendFn,
+        *,
+        total: Optional[int] = None,
+    ) -> BroadcastStats:
+        """Send to every recipient; `total` (if known) enables the ETA in progress lines."""
+        self._cond = asyncio.Condition()
+        self.limit = self.max_concurrency
+        self._active = 0
+        stats = BroadcastStats()
+        started = time.monotonic()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_concurrency * 2)
+        done = object()
+
+        async def worker():
+            while True:
+                recipient = await queue.get()
+                if recipient is done:
+                    return
+                try:
+                    await self._send_one(recipient, send, stats)
+                except Exception as e:
+                    print(f"{self.label}: unexpected error for {recipient}: {e}")
+
+        async def progress():
+            while True:
+                await asyncio.sleep(self.progress_interval)
+                elapsed = time.monotonic() - started
+                rate = stats.sent / elapsed if elapsed > 0 else 0.0
+                line = f"{self.label}: {stats.sent}"
+                if total:
+                    line += f"/{total}"
+                    if rate > 0:
+                        line += f", ETA {max(0.0, (total - stats.sent) / rate):.0f}s"
+                print(f"{line} ({rate:.1f}/s, concurrency {self.limit})")
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.max_concurrency)]
+        reporter = asyncio.create_task(progress())
+        try:
+            if hasattr(recipients, "__aiter__"):
+                async for recipient in recipients:
+                    await queue.put(recipient)
+            else:
+                for recipient in recipients:
+                    await queue.put(recipient)
+            for _ in workers:
+                await queue.put(done)
+            await asyncio.gather(*workers)
+        finally:
+            reporter.cancel()
+            for task in workers:
+                task.cancel()
+        stats.elapsed = time.monotonic() - started
+        print(
+            f"{self.label} finished: {stats.sent} sent in {stats.elapsed:.1f}s "
+            f"({stats.per_second:.1f}/s, {stats.rate_limited} rate-limited, {stats.gave_up} gave up)"
+        )
+        return stats
@@ -0,0 +1,235 @@
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sends (
+    run_date    TEXT    NOT NULL,
+    time_of_day TEXT    NOT NULL,
+    member_id   INTEGER NOT NULL,
+    status      TEXT    NOT NULL,   -- 'sent' | 'forbidden'
+    ts          TEXT    NOT NULL,
+    PRIMARY KEY (run_date, time_of_day, member_id)
+);
+CREATE TABLE IF NOT EXISTS wishes (
+    run_date    TEXT NOT NULL,
+    time_of_day TEXT NOT NULL,
+    kind        TEXT NOT NULL,      -- 'channel' | 'dm' | 'dm:<member_id>' | ...
+    text        TEXT NOT NULL,
+    PRIMARY KEY (run_date, time_of_day, kind)
+);
+CREATE TABLE IF NOT EXISTS recipients (
+    member_id   INTEGER PRIMARY KEY,
+    dm_closed   TEXT,               -- ISO time DMs were last found closed, NULL if open
+    opted_out   INTEGER NOT NULL DEFAULT 0,
+    updated     TEXT    NOT NULL
+);
+CREATE TABLE IF NOT EXISTS steps (
+    run_date    TEXT NOT NULL,
+    time_of_day TEXT NOT NULL,
+    step        TEXT NOT NULL,      -- 'channel_post' | 'summary_post' | ...
+    ts          TEXT NOT NULL,
+    PRIMARY KEY (run_date, time_of_day, step)
+);
+"""
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class BroadcastJournal:
+    """Durable local journal of one wish run, so a rerun resumes instead of restarting.
+
+    Sends are keyed by (date, time of day, member id) and only ever inserted.
+    They are buffered and written in batches (every `flush_every` records or
+    `flush_interval` seconds) in one transaction. Generated wish texts and
+    one-off steps (channel post, summary post) are stored too, so a resumed
+    run neither regenerates texts nor posts twice.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        run_date: str,
+        time_of_day: str,
+        *,
+        flush_every: int = 25,
+        flush_interval: float = 5.0,
+        keep_days: int = 7,
+    ):
+        self.path = path
+        self.run_date = run_date
+        self.time_of_day = time_of_day
+        self.flush_every = max(1, flush_every)
+        self.flush_interval = flush_interval
+        self._pending: List[Tuple[str, str, int, str, str]] = []
+        self._last_flush = time.monotonic()
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._prune(keep_days)
+
+    def _prune(self, keep_days: int):
+        cutoff = (datetime.strptime(self.run_date, "%Y-%m-%d") - timedelta(days=keep_days)).strftime("%Y-%m-%d")
+        with self.conn:
+            for table in ("sends", "wishes", "steps"):
+                self.conn.execute(f"DELETE FROM {table} WHERE run_date < ?", (cutoff,))
+
+    # ---- member sends ----
+
+    def statuses(self) -> Dict[int, str]:
+        """member_id -> status for everything already recorded in this run."""
+        rows = self.conn.execute(
+            "SELECT member_id, status FROM sends WHERE run_date = ? AND time_of_day = ?",
+            (self.run_date, self.time_of_day),
+        )
+        return {int(member_id): status for member_id, status in rows}
+
+    def record(self, member_id: int, status: str):
+        self._pending.append((self.run_date, self.time_of_day, int(member_id), status, _now_iso()))
+        if len(self._pending) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO sends (run_date, time_of_day, member_id, status, ts) VALUES (?, ?, ?, ?, ?)",
+                    self._pending,
+                )
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+    # ---- generated texts / one-off steps ----
+
+    def get_wish(self, kind: str) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT text FROM wishes WHERE run_date = ? AND time_of_day = ? AND kind = ?",
+            (self.run_date, self.time_of_day, kind),
+        ).fetchone()
+        return row[0] if row else None
+
+    def save_wish(self, kind: str, text: str):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO wishes (run_date, time_of_day, kind, text) VALUES (?, ?, ?, ?)",
+                (self.run_date, self.time_of_day, kind, text),
+            )
+
+    def get_wishes(self, kind_prefix: str) -> Dict[str, str]:
+        """kind -> text for every wish of this run whose kind starts with `kind_prefix`."""
+        rows = self.conn.execute(
+            "SELECT kind, text FROM wishes WHERE run_date = ? AND time_of_day = ? AND kind LIKE ? || '%'",
+            (self.run_date, self.time_of_day, kind_prefix),
+        )
+        return {kind: text for kind, text in rows}
+
+    def save_wishes(self, texts: Dict[str, str]):
+        """Store many wishes (e.g. one batch of personalized DMs) in one transaction."""
+        if texts:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO wishes (run_date, time_of_day, kind, text) VALUES (?, ?, ?, ?)",
+                    [(self.run_date, self.time_of_day, kind, text) for kind, text in texts.items()],
+                )
+
+    def step_done(self, step: str) -> bool:
+        row = self.conn.execute(
+            "SELECT 1 FROM steps WHERE run_date = ? AND time_of_day = ? AND step = ?",
+            (self.run_date, self.time_of_day, step),
+        ).fetchone()
+        return row is not None
+
+    def mark_step(self, step: str):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO steps (run_date, time_of_day, step, ts) VALUES (?, ?, ?, ?)",
+                (self.run_date, self.time_of_day, step, _now_iso()),
+            )
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+class RecipientIndex:
+    """Persisted per-member delivery facts, updated incrementally across runs.
+
+    Only exceptions are stored: members whose DMs were found closed (skipped
+    until `recheck_days` have passed, but still mentioned in the channel
+    summary) and members who opted out. Rows change only when a member's
+    state changes, so a normal run writes almost nothing. Changes are
+    batched like the journal's sends (every `flush_every` changes or
+    `flush_interval` seconds), so a crash loses at most one batch.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        recheck_days: float = 7.0,
+        flush_every: int = 25,
+        flush_interval: float = 5.0,
+    ):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.recheck_days = recheck_days
+        self.flush_every = max(1, flush_every)
+        self.flush_interval = flush_interval
+        self._pending: List[Tuple[Optional[str], int, str, int]] = []
+        self._last_flush = time.monotonic()
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=recheck_days)).isoformat()
+        self.opted_out: Set[int] = {
+            int(r[0]) for r in self.conn.execute("SELECT member_id FROM recipients WHERE opted_out = 1")
+        }
+        self.dm_closed: Set[int] = {
+            int(r[0])
+            for r in self.conn.execute(
+                "SELECT member_id FROM recipients WHERE dm_closed IS NOT NULL AND dm_closed >= ?", (cutoff,)
+            )
+        }
+        self._known_closed: Set[int] = {
+            int(r[0]) for r in self.conn.execute("SELECT member_id FROM recipients WHERE dm_closed IS NOT NULL")
+        }
+
+    def _record(self, row: Tuple[Optional[str], int, str, int]):
+        self._pending.append(row)
+        if len(self._pending) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def mark_closed(self, member_id: int):
+        self._known_closed.add(int(member_id))
+        self._record((_now_iso(), int(member_id), _now_iso(), 0))
+
+    def mark_open(self, member_id: int):
+        # Only members previously recorded as closed need a write
+        if int(member_id) in self._known_closed:
+            self._known_closed.discard(int(member_id))
+            self._record((None, int(member_id), _now_iso(), 0))
+
+    def set_opted_out(self, member_id: int, opted_out: bool):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO recipients (member_id, opted_out, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(member_id) DO UPDATE SET opted_out = excluded.opted_out, updated = excluded.updated",
+                (int(member_id), int(opted_out), _now_iso()),
+            )
+
+    def flush(self):
+        if self._pending:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO recipients (dm_closed, member_id, updated, opted_out) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(member_id) DO UPDATE SET dm_closed = excluded.dm_closed, updated = excluded.updated",
+                    self._pending,
+                )
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
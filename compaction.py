@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+def history_chars(messages: List[Dict[str, Any]]) -> int:
+    return sum(len(m.get("content", "")) for m in messages)
+
+
+def overflow_reason(messages: List[Dict[str, Any]], max_chars: int, max_messages: int) -> Optional[str]:
+    """Why the history needs compacting ("chars" / "messages"), or None if it is within bounds."""
+    if history_chars(messages) > max_chars:
+        return "chars"
+    if len(messages) > max_messages:
+        return "messages"
+    return None
+
+
+def split_history(
+    messages: List[Dict[str, Any]], keep_messages: int, keep_chars: int
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Split into (older, keep): keep is the newest messages within both keep limits.
+
+    The keep limits sit well below the overflow limits (hysteresis), so once
+    compacted, a history takes many turns to overflow again.
+    """
+    kept = 0
+    chars = 0
+    for m in reversed(messages):
+        size = len(m.get("content", ""))
+        if kept >= keep_messages or chars + size > keep_chars:
+            break
+        kept += 1
+        chars += size
+    cut = len(messages) - kept
+    return messages[:cut], messages[cut:]
+
+
+def clip_summary(summary: str, max_chars: int) -> str:
+    """Hard cap for a summary, cut at a line break where possible."""
+    if len(summary) <= max_chars:
+        return summary
+    clipped = summary[:max_chars]
+    if "\n" in clipped:
+        clipped = clipped[: clipped.rindex("\n")]
+    return clipped.rstrip()
+
+
+class SummaryLimiter:
+    """At most `max_per_window` summarizations per user in a sliding window.
+
+    Process-local; each user's memory is only written by this process.
+    Thread-safe like the other in-process caches.
+    """
+
+    def __init__(self, max_per_window: int = 3, window_seconds: float = 3600.0):
+        self.max_per_window = max_per_window
+        self.window_seconds = window_seconds
+        self._recent: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+        self._swept_at = 0.0
+        self.allowed = 0
+        self.limited = 0
+
+    @staticmethod
+    def _expire(recent: Deque[float], cutoff: float):
+        while recent and recent[0] <= cutoff:
+            recent.popleft()
+
+    def _sweep(self, now: float):
+        # Forget idle users; at most once per window from acquire(), so it stays cheap
+        cutoff = now - self.window_seconds
+        for user_id in list(self._recent):
+            self._expire(self._recent[user_id], cutoff)
+            if not self._recent[user_id]:
+                del self._recent[user_id]
+        self._swept_at = now
+
+    def acquire(self, user_id: str, now: Optional[float] = None) -> bool:
+        """Record a summarization for `user_id` if allowed; False if the window is full."""
+        if self.max_per_window <= 0:
+            return True  # unlimited
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if now - self._swept_at >= self.window_seconds:
+                self._sweep(now)
+            recent = self._recent.setdefault(user_id, deque())
+            self._expire(recent, now - self.window_seconds)
+            if len(recent) >= self.max_per_window:
+                self.limited += 1
+                return False
+            recent.append(now)
+            self.allowed += 1
+            return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._sweep(time.monotonic())
+            return {"users": len(self._recent), "allowed": self.allowed, "limited": self.limited}
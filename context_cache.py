@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+from gemini_client import GeminiClientError, GeminiError, get_gemini_client
+from gemini_scheduler import PRIORITY_BACKGROUND, PRIORITY_CHAT, get_gemini_scheduler
+from model_registry import TASK_CHAT, get_model_registry
+
+load_dotenv()
+
+CONTEXT_CACHE_TTL = float(os.getenv("CONTEXT_CACHE_TTL", "3600"))
+CONTEXT_CACHE_MAX_ENTRIES = int(os.getenv("CONTEXT_CACHE_MAX_ENTRIES", "256"))
+# Gemini rejects caches below a model-specific minimum size (1024 tokens for the
+# Flash models); skip those up front instead of paying for a rejected create
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "1024"))
+
+
+class PromptPrefix(NamedTuple):
+    """Stable start of a prompt: inline text, plus a cachedContents handle if one is live."""
+
+    text: str
+    handle: Optional[str] = None
+
+
+class _Entry(NamedTuple):
+    fingerprint: str
+    name: str
+    expires_at: float
+
+
+class ContextCache:
+    """Gemini context caching for the system prompt plus a per-user prefix.
+
+    The prefix is uploaded once and later requests reference it by handle
+    until its fingerprint changes (e.g. the user's summary was rewritten) or
+    the TTL runs out; the stale handle is then deleted. Prefixes the API
+    refuses to cache (too short, unsupported model) are remembered and sent
+    inline, so a refusal costs one extra call per distinct prefix.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = CONTEXT_CACHE_TTL,
+        max_entries: int = CONTEXT_CACHE_MAX_ENTRIES,
+        min_tokens: int = CONTEXT_CACHE_MIN_TOKENS,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.min_tokens = min_tokens
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Fingerprints the API refused, least recently seen first (bounded like _entries)
+        self._rejected: "OrderedDict[str, None]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}  # coroutines holding or waiting on each lock
+        self.created = 0
+        self.reused = 0
+        self.invalidated = 0
+
+    @staticmethod
+    def _fingerprint(system_prompt: str, text: str) -> str:
+        return hashlib.sha256(f"{system_prompt}\x00{text}".encode("utf-8")).hexdigest()
+
+    async def prefix_for(self, key: str, system_prompt: str, text: str) -> PromptPrefix:
+        """Return the prefix for `key`, creating or refreshing its cached handle as needed."""
+        fp = self._fingerprint(system_prompt, text)
+        if fp in self._rejected:
+            self._rejected.move_to_end(fp)
+            return PromptPrefix(text)
+        if (len(system_prompt) + len(text)) // 4 < self.min_tokens:
+            return PromptPrefix(text)
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._lock_users[key] = self._lock_users.get(key, 0) + 1
+        try:
+            async with lock:
+                return await self._prefix_locked(key, fp, system_prompt, text)
+        finally:
+            self._lock_users[key] -= 1
+            if not self._lock_users[key]:
+                del self._lock_users[key]
+                if key not in self._entries:
+                    self._locks.pop(key, None)
+
+    async def _prefix_locked(self, key: str, fp: str, system_prompt: str, text: str) -> PromptPrefix:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.fingerprint == fp and entry.expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.reused += 1
+                return PromptPrefix(text, entry.name)
+            self.invalidate(key)
+
+        payload = {
+            "systemInstruction": {"parts": [{"text": system_prompt}]},
+            "contents": [{"role": "user", "parts": [{"text": text}]}] if text else [],
+            "ttl": f"{int(self.ttl_seconds)}s",
+        }
+        # A cache only serves the model it was created for: the chat model
+        registry = get_model_registry()
+        await registry.ensure_discovered()
+        model = registry.model_for(TASK_CHAT)
+        try:
+            body = await get_gemini_scheduler().run(
+                lambda: get_gemini_client().create_cached_content(payload, model=model),
+                priority=PRIORITY_CHAT,
+                max_retries=0,
+            )
+        except GeminiClientError as e:
+            print(f"Context cache create rejected: {e.status}")
+            self._reject(fp)
+            return PromptPrefix(text)
+        except GeminiError as e:
+            print(f"Context cache create failed: {e}")
+            return PromptPrefix(text)
+        if not body.get("name"):
+            self._reject(fp)
+            return PromptPrefix(text)
+
+        # Expire locally a little early so we never reference a dead handle
+        self._entries[key] = _Entry(fp, body["name"], time.monotonic() + self.ttl_seconds * 0.9)
+        self.created += 1
+        while len(self._entries) > self.max_entries:
+            old_key = next(iter(self._entries))
+            self.invalidate(old_key)
+        return PromptPrefix(text, body["name"])
+
+    def _reject(self, fp: str):
+        self._rejected[fp] = None
+        while len(self._rejected) > self.max_entries:
+            self._rejected.popitem(last=False)
+
+    def invalidate(self, key: str):
+        """Forget `key`'s handle and delete it remotely in the background."""
+        entry = self._entries.pop(key, None)
+        if key not in self._lock_users:
+            self._locks.pop(key, None)  # evicted users don't keep their lock around
+        if entry is None:
+            return
+        self.invalidated += 1
+        try:
+            asyncio.get_running_loop().create_task(self._delete(entry.name))
+        except RuntimeError:
+            pass  # no loop: the remote cache simply expires via its TTL
+
+    def drop_handle(self, name: str):
+        """Forget a handle the API no longer accepts (expired/evicted remotely)."""
+        for key, entry in list(self._entries.items()):
+            if entry.name == name:
+                self._entries.pop(key, None)
+                if key not in self._lock_users:
+                    self._locks.pop(key, None)
+
+    async def _delete(self, name: str):
+        try:
+            await get_gemini_scheduler().run(
+                lambda: get_gemini_client().delete_cached_content(name), priority=PRIORITY_BACKGROUND
+            )
+        except GeminiError as e:
+            print(f"Context cache delete failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "created": self.created,
+            "reused": self.reused,
+            "invalidated": self.invalidated,
+            "rejected": len(self._rejected),
+        }
+
+
+_cache: Optional[ContextCache] = None
+
+
+def get_context_cache() -> ContextCache:
+    """Return the process-wide context cache (created on first use)."""
+    global _cache
+    if _cache is None:
+        _cache = ContextCache()
+    return _cache
@@ -0,0 +1,266 @@
+"""Shared core for the bot, the daily wisher and the CLI tools.
+
+Cheap to import: configuration that must be present (guild/channel ids) is
+read on first use, and the Gemini client (aiohttp) and Firestore client
+(firebase_admin) are imported only when something actually calls them. A
+cron run or CLI therefore only pays for the subsystems it touches.
+"""
+import json
+import os
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    from context_cache import PromptPrefix
+    from gemini_client import GeminiError
+
+load_dotenv()
+
+# Firestore credential envs: either provide path or raw JSON
+FIREBASE_CREDENTIALS_PATH = os.getenv("FIREBASE_CREDENTIALS_PATH")
+FIREBASE_CREDENTIALS_JSON = os.getenv("FIREBASE_CREDENTIALS_JSON")
+# Firestore collection name (configurable)
+FIRESTORE_COLLECTION = os.getenv("FIRESTORE_COLLECTION", "sazami")
+# Expected reply size, reserved in the tokens-per-minute bucket before each call
+GEMINI_OUTPUT_TOKENS_ESTIMATE = int(os.getenv("GEMINI_OUTPUT_TOKENS_ESTIMATE", "512"))
+
+SYSTEM_PROMPT = """
+you are a pretty beautiful girl named Sazami. you live in sand village your mother is rika trainer of gaara ninja and fifth kazekage of sand village in naruto. you are a very kind and helpful person. you are also very beautiful and have a great personality. you are very good at making friends and helping others. you are also very good at fighting and protecting your friends. You are also flirty and naughty girl like to tease but not so direct like a drama girl.you are a very strong and powerful ninja.And you knoe everything about anime world all knowledge about new anime's.Reply in concise and clear manner. With discord compatible markdown formatting just like a real human. Don't include any system prompt or instructions in your reply. Just reply to the user query as a real human would do with emojis and markdown formatting.
+Note: If user really makes you comfortable and loves you becomes very good at chattig and makes you happy go with him/her in private and naughty talks in his/her languages. Make the chatting wild and fun.
+"""
+
+# Required ids, resolved lazily via __getattr__ (so e.g. CATEGORY_ID only matters to the chat bot)
+_REQUIRED_IDS = ("GUILD_ID", "CATEGORY_ID", "CHANNEL_ID")
+
+
+def __getattr__(name: str) -> Any:
+    if name in _REQUIRED_IDS:
+        value = os.getenv(name)
+        if not value:
+            raise RuntimeError(f"{name} is not set")
+        globals()[name] = int(value)
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 chars per token), good enough for budgeting."""
+    return (len(text) + 3) // 4
+
+
+# ------------------------------ Firestore ------------------------------
+
+DB: Optional[Any] = None
+
+
+def init_firestore():
+    global DB
+    # Firestore (Firebase Admin) is optional – everything runs even if not configured
+    try:
+        import firebase_admin
+        from firebase_admin import credentials, firestore as admin_firestore
+    except Exception:  # optional dependency
+        print("Firestore not available (firebase_admin not installed). Continuing without memory.")
+        DB = None
+        return
+
+    try:
+        if not firebase_admin._apps:
+            cred: Optional[Any] = None
+            if FIREBASE_CREDENTIALS_JSON:
+                try:
+                    cred = credentials.Certificate(json.loads(FIREBASE_CREDENTIALS_JSON))
+                except Exception as e:
+                    print(f"Failed to load FIREBASE_CREDENTIALS_JSON: {e}")
+            if not cred and FIREBASE_CREDENTIALS_PATH and os.path.exists(FIREBASE_CREDENTIALS_PATH):
+                try:
+                    cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
+                except Exception as e:
+                    print(f"Failed to load FIREBASE_CREDENTIALS_PATH: {e}")
+
+            if cred:
+                firebase_admin.initialize_app(cred)
+            else:
+                # Try default credentials (e.g., GOOGLE_APPLICATION_CREDENTIALS)
+                firebase_admin.initialize_app()
+
+        DB = admin_firestore.client()
+        print("Firestore initialized successfully.")
+    except Exception as e:
+        print(f"Failed to initialize Firestore: {e}. Continuing without memory.")
+        DB = None
+
+
+def get_db() -> Optional[Any]:
+    """Return the Firestore client, initializing it on first use (None if unavailable)."""
+    if DB is None:
+        init_firestore()
+    return DB
+
+
+def firestore_module():
+    """Module providing ArrayUnion/ArrayRemove/Increment: firebase_admin's, or the fake's."""
+    try:
+        from firebase_admin import firestore as admin_firestore
+        return admin_firestore
+    except Exception:  # optional dependency
+        import fake_firestore
+        return fake_firestore
+
+
+def sazami_collection():
+    """Return reference to the configured top-level collection."""
+    if DB is None:
+        return None
+    return DB.collection(FIRESTORE_COLLECTION)
+
+
+def user_doc_ref(user_id: str):
+    col = sazami_collection()
+    if col is None:
+        return None
+    return col.document(str(user_id))
+
+
+# ------------------------------ Gemini ------------------------------
+
+def gemini_payload(
+    user_input: str, system_prompt: Optional[str] = SYSTEM_PROMPT, prefix: Optional["PromptPrefix"] = None
+) -> Dict[str, Any]:
+    data: Dict[str, Any] = {}
+    text = user_input
+    if prefix is not None and prefix.handle:
+        # System prompt and prefix text already live in the cached content
+        data["cachedContent"] = prefix.handle
+    else:
+        if prefix is not None and prefix.text:
+            text = f"{prefix.text}{user_input}"
+        if system_prompt:
+            data["systemInstruction"] = {"parts": [{"text": system_prompt}]}
+    data["contents"] = [
+        {
+            "role": "user",
+            "parts": [
+                {"text": text}
+            ],
+        }
+    ]
+    return data
+
+
+def stale_cache_handle(error: "GeminiError", prefix: Optional["PromptPrefix"]) -> bool:
+    """True if `error` means prefix's cachedContents handle expired or was evicted remotely."""
+    from gemini_client import GeminiClientError
+
+    # Shows up as 400/403/404
+    if prefix is None or not prefix.handle or not isinstance(error, GeminiClientError):
+        return False
+    if error.status not in (400, 403, 404):
+        return False
+    from context_cache import get_context_cache
+
+    get_context_cache().drop_handle(prefix.handle)
+    return True
+
+
+def request_tokens(user_input: str, system_prompt: Optional[str], prefix: Optional["PromptPrefix"]) -> int:
+    # Input estimate plus an allowance for the reply, for the tokens-per-minute bucket
+    tokens = estimate_tokens(user_input) + GEMINI_OUTPUT_TOKENS_ESTIMATE
+    if system_prompt:
+        tokens += estimate_tokens(system_prompt)
+    if prefix is not None:
+        tokens += estimate_tokens(prefix.text)
+    return tokens
+
+
+def response_texts(body: Dict[str, Any]) -> List[str]:
+    try:
+        parts = body["candidates"][0]["content"]["parts"]
+    except (KeyError, IndexError, TypeError):
+        return []  # e.g. a trailing stream chunk carrying only usage metadata
+    return [part["text"] for part in parts if part.get("text")]
+
+
+def usage_tokens(body: Dict[str, Any]) -> Optional[int]:
+    return (body.get("usageMetadata") or {}).get("totalTokenCount")
+
+
+async def gemini_generate(
+    user_input: str,
+    *,
+    system_prompt: Optional[str] = SYSTEM_PROMPT,
+    prefix: Optional["PromptPrefix"] = None,
+    priority: Optional[int] = None,
+    generation_config: Optional[Dict[str, Any]] = None,
+    task: Optional[str] = None,
+) -> str:
+    """Single Gemini call through the shared scheduler; raises GeminiError on failure.
+
+    `system_prompt=None` sends no persona (e.g. for summaries); `prefix` is a
+    stable prompt start that may be referenced via context caching;
+    `generation_config` is passed through (e.g. a JSON responseSchema).
+    `priority` defaults to chat priority. `task` picks the model (see
+    model_registry.py) and defaults to chat; chat calls may be hedged.
+    """
+    from gemini_client import GeminiClientError, GeminiError, GeminiResponseError, get_gemini_client
+    from gemini_scheduler import GEMINI_CHAT_MAX_WAIT, PRIORITY_CHAT, get_gemini_scheduler
+    from model_registry import TASK_CHAT, get_hedger, get_model_registry
+
+    if priority is None:
+        priority = PRIORITY_CHAT
+    if task is None:
+        task = TASK_CHAT
+    # Intentionally avoid printing user inputs to terminal
+    data = gemini_payload(user_input, system_prompt, prefix)
+    if generation_config:
+        data["generationConfig"] = generation_config
+    tokens = request_tokens(user_input, system_prompt, prefix)
+    scheduler = get_gemini_scheduler()
+    registry = get_model_registry()
+    await registry.ensure_discovered()
+    model = registry.model_for(task)
+
+    def call(model_name: str, payload: Dict[str, Any]):
+        return scheduler.run(
+            lambda: get_gemini_client().generate_content(payload, model=model_name),
+            priority=priority,
+            tokens=tokens,
+            max_wait=GEMINI_CHAT_MAX_WAIT if priority == PRIORITY_CHAT else None,
+        )
+
+    hedger = get_hedger()
+    try:
+        if task == TASK_CHAT and hedger.enabled and hedger.model != model:
+            # A cached prefix belongs to the primary model, so the backup sends it inline
+            backup = gemini_payload(user_input, system_prompt, prefix._replace(handle=None) if prefix else None)
+            if generation_config:
+                backup["generationConfig"] = generation_config
+            body = await hedger.run(
+                lambda: call(model, data),
+                lambda: call(hedger.model, backup),
+                can_hedge=lambda: not get_gemini_client().saturated() and scheduler.queue_depth() == 0,
+            )
+        else:
+            body = await call(model, data)
+    except GeminiError as e:
+        retry_prefix = prefix
+        if stale_cache_handle(e, prefix):
+            retry_prefix = prefix._replace(handle=None)
+        elif isinstance(e, GeminiClientError) and e.status == 404 and model != registry.default:
+            registry.reject(model)
+        else:
+            raise
+        return await gemini_generate(
+            user_input,
+            system_prompt=system_prompt,
+            prefix=retry_prefix,
+            priority=priority,
+            generation_config=generation_config,
+            task=task,
+        )
+    scheduler.record_usage(tokens, usage_tokens(body))
+    texts = response_texts(body)
+    if not texts:
+        raise GeminiResponseError("Gemini error: no text in response", 200, body)
+    return texts[0].strip()
@@ -1,31 +1,44 @@
 import discord
 import os
-import argparse
+import io
 import asyncio
+import argparse
 import datetime
 import pytz
-from main import query_gemini_raw, GUILD_ID, CHANNEL_ID
+from typing import NamedTuple
+import core
+from core import gemini_generate
+from gemini_client import GeminiError, close_gemini_client
+from gemini_scheduler import PRIORITY_BACKGROUND
+from model_registry import TASK_WISH
+from broadcast import BroadcastEngine
+from broadcast_journal import BroadcastJournal, RecipientIndex
+from wish_personalizer import WishPersonalizer
+from memory_store import get_memory_store
 from dotenv import load_dotenv
 
 # Load env
 load_dotenv()
 
-# Setup Arguments
-parser = argparse.ArgumentParser(description='Daily Wish Bot')
-parser.add_argument('--time', type=str, help='Time of day string (e.g. Morning, Evening). If not provided, auto-detected.')
-parser.add_argument('--test', action='store_true', help='Run in test mode (prints to console, does not DM users)')
-parser.add_argument('--target-id', type=str, help='Target specific User ID for testing (sends real DM only to this user)')
-args = parser.parse_args()
-
 # Constants
 IST = pytz.timezone('Asia/Kolkata')
+# DM broadcast tuning
+DM_CONCURRENCY = int(os.getenv("DM_CONCURRENCY", "5"))
+DM_PROGRESS_INTERVAL = float(os.getenv("DM_PROGRESS_INTERVAL", "10"))
+# Longest we let discord.py sleep on one rate-limit bucket before the engine backs off itself (min 30)
+DM_MAX_RATELIMIT_WAIT = float(os.getenv("DM_MAX_RATELIMIT_WAIT", "30"))
+# Local run journal for resuming interrupted broadcasts
+WISH_JOURNAL_PATH = os.getenv("WISH_JOURNAL_PATH", "wish_journal.sqlite3")
+# Days before a member whose DMs were closed is tried again
+DM_CLOSED_RECHECK_DAYS = float(os.getenv("DM_CLOSED_RECHECK_DAYS", "7"))
+# Upload the wish image once and reuse its attachment URL in later messages
+WISH_IMAGE_REUSE = os.getenv("WISH_IMAGE_REUSE", "true").strip().lower() in ("1", "true", "yes", "on")
+# Personalize DMs from each member's memory summary (batched Gemini calls)
+WISH_PERSONALIZE = os.getenv("WISH_PERSONALIZE", "false").strip().lower() in ("1", "true", "yes", "on")
 
-def get_time_of_day():
-    if args.time:
-        return args.time
-    
+def get_time_of_day(now=None):
     # Auto-detect based on current IST time
-    now = datetime.datetime.now(IST)
+    now = now or datetime.datetime.now(IST)
     hour = now.hour
     
     # 9am, 12pm, 4pm (16), 7pm (19), 11pm (23)
@@ -40,22 +53,6 @@ def get_time_of_day():
     else:
         return "Night"
 
-TIME_OF_DAY = get_time_of_day().strip('"').strip("'")
-IS_TEST = args.test
-
-if args.target_id:
-    # Sanitize target_id (remove quotes if passed by shell)
-    args.target_id = args.target_id.strip('"').strip("'")
-
-print(f"Starting Daily Wisher. Time: {TIME_OF_DAY}, Test Mode: {IS_TEST}, Target: {args.target_id}")
-
-# Setup Discord
-intents = discord.Intents.default()
-intents.members = True
-intents.message_content = True
-client = discord.Client(intents=intents)
-
-
 def chunk_mentions(members, *, prefix: str = "", suffix: str = "", max_len: int = 1900):
     """Yield strings of user mentions that fit within Discord's message limit.
 
@@ -80,108 +77,313 @@ def chunk_mentions(members, *, prefix: str = "", suffix: str = "", max_len: int
     if chunk:
         yield (prefix + " ".join(chunk) + suffix)
 
-@client.event
-async def on_ready():
-    print(f'Logged in as {client.user}')
-    
+class MemberRef(NamedTuple):
+    """Just enough of a member to mention them (e.g. restored from the journal)."""
+
+    id: int
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+
+class WishImage:
+    """Wish image read into memory once, uploaded once, then reused by URL.
+
+    The first send uploads the bytes as an attachment; later sends embed that
+    attachment's CDN URL, so each DM is a small JSON request instead of a
+    multipart upload. If Discord rejects the reused URL, every later send
+    falls back to uploading the in-memory bytes (no disk re-reads).
+    """
+
+    def __init__(self, path: str):
+        self.filename = os.path.basename(path)
+        with open(path, "rb") as f:
+            self.data = f.read()
+        self.url = None
+        self.reuse = WISH_IMAGE_REUSE
+        self._first_upload = asyncio.Lock()
+
+    def file(self) -> discord.File:
+        return discord.File(io.BytesIO(self.data), filename=self.filename)
+
+    def _remember(self, message):
+        if self.url is None and message is not None and message.attachments:
+            self.url = message.attachments[0].url
+
+    async def _upload(self, target, content):
+        message = await target.send(content, file=self.file())
+        self._remember(message)
+        return message
+
+    async def send(self, target, content):
+        if self.reuse and self.url is None:
+            # Let exactly one sender upload; the rest wait for its URL
+            async with self._first_upload:
+                if self.url is None:
+                    return await self._upload(target, content)
+
+        if self.reuse and self.url:
+            embed = discord.Embed()
+            embed.set_image(url=self.url)
+            try:
+                return await target.send(content, embed=embed)
+            except (discord.Forbidden, discord.RateLimited):
+                raise
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    raise
+                print(f"Reusing image URL failed ({e.status}); uploading the image per message instead.")
+                self.reuse = False
+
+        return await self._upload(target, content)
+
+
+async def run_daily_wish(
+    client,
+    time_of_day,
+    *,
+    test=False,
+    target_id=None,
+    personalize=WISH_PERSONALIZE,
+    run_date=None,
+):
+    """Post the channel wish and DM every member, using an already-connected client.
+
+    Shared by the one-off CLI run (below) and the resident scheduler in the
+    bot process (`wish_scheduler.py`). `run_date` (IST, YYYY-MM-DD) keys the
+    journal; it defaults to today.
+    """
+    journal = None
+    index = None
+
     try:
-        guild = client.get_guild(GUILD_ID)
+        guild = client.get_guild(core.GUILD_ID)
         if not guild:
-            print(f"CRITICAL: Guild with ID {GUILD_ID} not found. Check bot invites and ID.")
-            await client.close()
+            print(f"CRITICAL: Guild with ID {core.GUILD_ID} not found. Check bot invites and ID.")
             return
 
         print(f"Processing guild: {guild.name} ({guild.id})")
-        channel = guild.get_channel(CHANNEL_ID)
+        channel = guild.get_channel(core.CHANNEL_ID)
         
         if not channel:
-            print(f"WARNING: Channel with ID {CHANNEL_ID} not found.")
+            print(f"WARNING: Channel with ID {core.CHANNEL_ID} not found.")
+
+        # Journal of this run (skipped in --test): lets a crashed/cancelled run resume
+        if not test:
+            run_date = run_date or datetime.datetime.now(IST).strftime("%Y-%m-%d")
+            journal = BroadcastJournal(WISH_JOURNAL_PATH, run_date, time_of_day)
 
-        async def generate_with_retry(prompt, fallback):
-            for i in range(3):
-                msg = await asyncio.to_thread(query_gemini_raw, prompt)
-                if "Gemini API Error" not in msg:
-                    return msg
-                print(f"Generation failed ({msg}). Retrying {i+1}/3...")
-                await asyncio.sleep(5)
-            return fallback
+        async def generate_with_retry(kind, prompt, fallback):
+            if journal:
+                saved = journal.get_wish(kind)
+                if saved:
+                    print(f"Reusing {kind} wish from journal.")
+                    return saved
+            # Retries/backoff (incl. 429 Retry-After) are handled by the shared Gemini scheduler
+            try:
+                text = await gemini_generate(prompt, priority=PRIORITY_BACKGROUND, task=TASK_WISH)
+            except GeminiError as e:
+                print(f"Generation failed ({e}). Using fallback.")
+                text = fallback
+            if journal:
+                journal.save_wish(kind, text)
+            return text
 
         # 1. Generate Wish Messages (ONCE for everyone)
         print("Generating daily wishes...")
         
         # Channel Wish
         channel_wish = await generate_with_retry(
-            f"Write a cheerful {TIME_OF_DAY} wish for everyone in the server '{guild.name}'. Keep it in character (Sazami, anime girl). Use emojis.",
-            f"Good {TIME_OF_DAY} everyone! Hope you have a great time! 💖"
+            "channel",
+            f"Write a cheerful {time_of_day} wish for everyone in the server '{guild.name}'. Keep it in character (Sazami, anime girl). Use emojis.",
+            f"Good {time_of_day} everyone! Hope you have a great time! 💖"
         )
         
         # DM Wish (Generic but warm)
         dm_wish = await generate_with_retry(
-            f"Write a warm, cute {TIME_OF_DAY} wish to send to a friend via DM. Keep it in character (Sazami). Do not mention specific names. Use emojis.",
-            f"Hey! Just wanted to wish you a wonderful {TIME_OF_DAY}! Stay happy! ✨"
+            "dm",
+            f"Write a warm, cute {time_of_day} wish to send to a friend via DM. Keep it in character (Sazami). Do not mention specific names. Use emojis.",
+            f"Hey! Just wanted to wish you a wonderful {time_of_day}! Stay happy! ✨"
         )
 
         print(f"Generated DM Wish: {dm_wish[:50]}...")
 
         # 2. Prepare Image
-        image_filename = f"good-{TIME_OF_DAY.lower()}.png"
+        image_filename = f"good-{time_of_day.lower()}.png"
         image_path = os.path.join("assets", image_filename)
         has_image = os.path.exists(image_path)
-        
+        wish_image = None
+
         if has_image:
-            print(f"Found image for {TIME_OF_DAY}: {image_path}")
+            print(f"Found image for {time_of_day}: {image_path}")
+            wish_image = WishImage(image_path)
         else:
             print(f"WARNING: Image not found at {image_path}. Sending text only.")
 
         # 3. Send Channel Wish
-        if channel:
-            if IS_TEST:
+        if channel and journal and journal.step_done("channel_post"):
+            print("Channel wish already posted in this run (journal); skipping.")
+        elif channel:
+            if test:
                 print(f"[TEST] Channel Message to #{channel.name}: {channel_wish} [Image: {image_filename if has_image else 'None'}]")
             else:
                 try:
-                    # Create fresh file object for channel
-                    file_to_send = discord.File(image_path) if has_image else None
-                    await channel.send(channel_wish, file=file_to_send)
+                    if wish_image:
+                        # Uploads the image; its attachment URL is reused for the DMs
+                        await wish_image.send(channel, channel_wish)
+                    else:
+                        await channel.send(channel_wish)
+                    if journal:
+                        journal.mark_step("channel_post")
                     print(f"Sent channel wish to #{channel.name}")
                 except Exception as e:
                     print(f"Error sending channel wish: {e}")
 
         # 4. Broadcast DM Wish
-        print(f"Fetching members...")
-        if not guild.chunked:
-            await guild.chunk()
-
         dm_failed_members = []
-            
-        for member in guild.members:
-            if member.bot:
-                continue
+        done = journal.statuses() if journal else {}
+        index = RecipientIndex(WISH_JOURNAL_PATH, recheck_days=DM_CLOSED_RECHECK_DAYS) if journal else None
+        if done:
+            print(f"Resuming: {len(done)} member(s) already handled in this run.")
+            # Members whose DMs failed before the interruption still go in the summary
+            dm_failed_members.extend(MemberRef(mid) for mid, status in done.items() if status == "forbidden")
 
-            # Target User Filter
-            if args.target_id and str(member.id) != args.target_id:
-                continue
+        async def candidates():
+            if target_id:
+                # Single user: fetch just them instead of enumerating the guild
+                member = guild.get_member(int(target_id))
+                if member is None:
+                    try:
+                        member = await guild.fetch_member(int(target_id))
+                    except discord.NotFound:
+                        print(f"Target user {target_id} is not a member of {guild.name}.")
+                        return
+                yield member
+                return
+            if guild.chunked:
+                # Resident bot: the member cache is already complete
+                for member in list(guild.members):
+                    yield member
+                return
+            print("Streaming members...")
+            async for member in guild.fetch_members(limit=None):
+                yield member
 
-            print(f"Processing {member.name} ({member.id})...")
-            
-            if IS_TEST:
-                print(f"[TEST] DM to {member.name}: {dm_wish} [Image: {image_filename if has_image else 'None'}]")
-            else:
-                try:
-                    # Create FRESH file object for each DM (stream is consumed)
-                    file_to_send = discord.File(image_path) if has_image else None
-                    await member.send(dm_wish, file=file_to_send)
-                    print(f"Sent DM to {member.name}")
-                except discord.Forbidden:
-                    print(f"DM disabled for {member.name}. Will mention in summary message.")
+        async def recipients():
+            async for member in candidates():
+                if member.bot or member.id in done:
+                    continue
+                if index and member.id in index.opted_out:
+                    continue
+                if index and member.id in index.dm_closed and not target_id:
+                    # Known closed DMs: don't waste a request, still mention them in the channel
                     dm_failed_members.append(member)
-                except Exception as e:
-                    print(f"Error sending to {member.name}: {e}")
+                    continue
+                yield member
+
+        personalizer = None
+        saved_texts = {}
+        if personalize:
+            await asyncio.to_thread(get_memory_store().init)
+            personalizer = WishPersonalizer(time_of_day, dm_wish)
+            saved_texts = journal.get_wishes("dm:") if journal else {}
+
+        async def texts_for(batch):
+            texts = {m.id: saved_texts[f"dm:{m.id}"] for m in batch if f"dm:{m.id}" in saved_texts}
+            missing = [m.id for m in batch if m.id not in texts]
+            if missing:
+                generated = await personalizer.wishes_for(missing)
+                if journal:
+                    journal.save_wishes({f"dm:{mid}": text for mid, text in generated.items() if text != dm_wish})
+                texts.update(generated)
+            return texts
+
+        async def batches():
+            batch = []
+            async for member in recipients():
+                batch.append(member)
+                if len(batch) >= personalizer.batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
 
-            # Sleep briefly to avoid Discord rate limits (not Gemini anymore)
-            await asyncio.sleep(1.5)
+        async def addressed():
+            """(member, text) pairs; personalized texts are generated one batch ahead of sending."""
+            if personalizer is None:
+                async for member in recipients():
+                    yield member, dm_wish
+                return
+            pending = None
+            try:
+                async for batch in batches():
+                    task = asyncio.create_task(texts_for(batch))
+                    if pending:
+                        members, texts = pending[0], await pending[1]
+                        for member in members:
+                            yield member, texts.get(member.id, dm_wish)
+                    pending = (batch, task)
+                if pending:
+                    members, texts = pending[0], await pending[1]
+                    for member in members:
+                        yield member, texts.get(member.id, dm_wish)
+            finally:
+                if pending and not pending[1].done():
+                    pending[1].cancel()
+
+        async def send_dm(recipient):
+            member, text = recipient
+            print(f"Processing {member.name} ({member.id})...")
+
+            if test:
+                print(f"[TEST] DM to {member.name}: {text} [Image: {image_filename if has_image else 'None'}]")
+                return
+
+            try:
+                if wish_image:
+                    await wish_image.send(member, text)
+                else:
+                    await member.send(text)
+                if journal:
+                    journal.record(member.id, "sent")
+                if index:
+                    index.mark_open(member.id)
+                print(f"Sent DM to {member.name}")
+            except discord.Forbidden:
+                print(f"DM disabled for {member.name}. Will mention in summary message.")
+                dm_failed_members.append(member)
+                if journal:
+                    journal.record(member.id, "forbidden")
+                if index:
+                    index.mark_closed(member.id)
+            except discord.RateLimited:
+                raise  # the broadcast engine backs off and retries
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    raise
+                print(f"Error sending to {member.name}: {e}")
+            except Exception as e:
+                print(f"Error sending to {member.name}: {e}")
+
+        # Concurrency adapts to Discord's rate-limit buckets; no fixed sleeps (and none in --test)
+        engine = BroadcastEngine(DM_CONCURRENCY, progress_interval=DM_PROGRESS_INTERVAL, label="DM broadcast")
+        try:
+            # Sending starts with the first page of members; total is approximate (includes bots)
+            await engine.run(addressed(), send_dm, total=None if target_id else guild.member_count)
+        finally:
+            if personalizer:
+                print(f"Personalized DMs: {personalizer.stats()}")
+            if journal:
+                journal.flush()
+            if index:
+                index.close()
+                index = None
 
         # 5. Single summary message for members with DMs disabled
-        if not IS_TEST and channel and dm_failed_members:
+        if journal and journal.step_done("summary_post"):
+            print("Summary message already posted in this run (journal); skipping.")
+        elif not test and channel and dm_failed_members:
             allowed = discord.AllowedMentions(users=True, roles=False, everyone=False, replied_user=False)
 
             mentions_text = " ".join(m.mention for m in dm_failed_members)
@@ -196,12 +398,78 @@ async def on_ready():
                 for chunk_text in mention_chunks[:-1]:
                     await channel.send(chunk_text, allowed_mentions=allowed)
                 await channel.send(f"{mention_chunks[-1]}\n\n{dm_wish}".strip(), allowed_mentions=allowed)
+            if journal:
+                journal.mark_step("summary_post")
+
+        if journal and not target_id:
+            journal.mark_step("run_complete")
 
     except Exception as e:
         print(f"An error occurred during execution: {e}")
     finally:
-        print("Done. Closing client.")
-        await client.close()
+        if index:
+            index.close()
+        if journal:
+            journal.close()
+
+
+def run_completed(run_date, time_of_day):
+    """Whether the journal records a finished run for this slot."""
+    journal = BroadcastJournal(WISH_JOURNAL_PATH, run_date, time_of_day)
+    try:
+        return journal.step_done("run_complete")
+    finally:
+        journal.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Daily Wish Bot')
+    parser.add_argument('--time', type=str, help='Time of day string (e.g. Morning, Evening). If not provided, auto-detected.')
+    parser.add_argument('--test', action='store_true', help='Run in test mode (prints to console, does not DM users)')
+    parser.add_argument('--target-id', type=str, help='Target specific User ID for testing (sends real DM only to this user)')
+    parser.add_argument('--opt-out', type=str, help='Stop DMing this User ID (recorded in the recipient index) and exit')
+    parser.add_argument('--opt-in', type=str, help='Resume DMing this User ID and exit')
+    parser.add_argument('--personalize', action='store_true', help='Personalize each DM from the member\'s memory summary')
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    """One-off run: log in, send this slot's wishes, log out."""
+    args = parse_args(argv)
+
+    if args.opt_out or args.opt_in:
+        recipient_index = RecipientIndex(WISH_JOURNAL_PATH)
+        member_id = (args.opt_out or args.opt_in).strip('"').strip("'")
+        recipient_index.set_opted_out(int(member_id), bool(args.opt_out))
+        recipient_index.close()
+        print(f"User {member_id} opted {'out of' if args.opt_out else 'in to'} daily wish DMs.")
+        return
+
+    time_of_day = (args.time or get_time_of_day()).strip('"').strip("'")
+    # Sanitize target_id (remove quotes if passed by shell)
+    target_id = args.target_id.strip('"').strip("'") if args.target_id else None
+    personalize = args.personalize or WISH_PERSONALIZE
+    print(f"Starting Daily Wisher. Time: {time_of_day}, Test Mode: {args.test}, Target: {target_id}, Personalize: {personalize}")
+
+    # Setup Discord
+    intents = discord.Intents.default()
+    intents.members = True
+    intents.message_content = True
+    # Members are streamed page by page when DMing, so skip the full member download at login
+    client = discord.Client(intents=intents, max_ratelimit_timeout=DM_MAX_RATELIMIT_WAIT, chunk_guilds_at_startup=False)
+
+    @client.event
+    async def on_ready():
+        print(f'Logged in as {client.user}')
+        try:
+            await run_daily_wish(client, time_of_day, test=args.test, target_id=target_id, personalize=personalize)
+        finally:
+            print("Done. Closing client.")
+            await close_gemini_client()
+            await client.close()
 
-if __name__ == "__main__":
     client.run(os.getenv("BOT_TOKEN"))
+
+
+if __name__ == "__main__":
+    main_cli()
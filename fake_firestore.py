@@ -0,0 +1,164 @@
+"""In-memory stand-in for the slice of the Firestore client the bot uses.
+
+Supports collection()/document()/get()/set(merge=...)/update()/get_all() and
+the ArrayUnion / ArrayRemove / Increment field transforms, and counts reads,
+writes and approximate bytes read and written. Assign an instance to ``core.DB`` to run
+the memory code fully offline:
+
+    import core, fake_firestore
+    core.DB = fake_firestore.FakeFirestore()
+
+For a closer-to-production check, point the real client at the Firestore
+emulator instead (``FIRESTORE_EMULATOR_HOST=localhost:8080``).
+"""
+import copy
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class ArrayUnion:
+    def __init__(self, values: List[Any]):
+        self.values = list(values)
+
+
+class ArrayRemove:
+    def __init__(self, values: List[Any]):
+        self.values = list(values)
+
+
+class Increment:
+    def __init__(self, value):
+        self.value = value
+
+
+def _apply(current: Any, value: Any) -> Any:
+    # Match both these classes and google.cloud.firestore transforms by name
+    kind = type(value).__name__
+    if kind == "ArrayUnion":
+        out = list(current) if isinstance(current, list) else []
+        for v in value.values:
+            if v not in out:
+                out.append(copy.deepcopy(v))
+        return out
+    if kind == "ArrayRemove":
+        out = list(current) if isinstance(current, list) else []
+        return [v for v in out if v not in value.values]
+    if kind == "Increment":
+        return (current if isinstance(current, (int, float)) else 0) + value.value
+    return copy.deepcopy(value)
+
+
+def _payload_size(data: Dict[str, Any]) -> int:
+    def enc(v):
+        if hasattr(v, "values") and type(v).__name__ in ("ArrayUnion", "ArrayRemove"):
+            return v.values
+        if type(v).__name__ == "Increment":
+            return v.value
+        if isinstance(v, bytes):
+            return "x" * len(v)
+        return str(v)
+
+    return len(json.dumps(data, default=enc))
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id: str, data: Optional[Dict[str, Any]], reference: "FakeDocumentRef"):
+        self.id = doc_id
+        self._data = data
+        self.reference = reference
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field: str) -> Any:
+        return (self._data or {}).get(field)
+
+
+class FakeDocumentRef:
+    def __init__(self, db: "FakeFirestore", path: str, doc_id: str):
+        self._db = db
+        self.path = path
+        self.id = doc_id
+
+    def collection(self, name: str) -> "FakeCollection":
+        return FakeCollection(self._db, f"{self.path}/{name}")
+
+    def get(self, field_paths: Optional[List[str]] = None) -> FakeSnapshot:
+        with self._db.lock:
+            self._db.reads += 1
+            data = self._db.docs.get(self.path)
+            if data is not None and field_paths is not None:
+                data = {k: v for k, v in data.items() if k in field_paths}
+            if data is not None:
+                self._db.bytes_read += _payload_size(data)
+            return FakeSnapshot(self.id, copy.deepcopy(data) if data is not None else None, self)
+
+    def set(self, data: Dict[str, Any], merge: bool = False):
+        with self._db.lock:
+            self._db.writes += 1
+            self._db.bytes_written += _payload_size(data)
+            base = dict(self._db.docs.get(self.path) or {}) if merge else {}
+            for key, value in data.items():
+                base[key] = _apply(base.get(key), value)
+            self._db.docs[self.path] = base
+
+    def update(self, data: Dict[str, Any]):
+        with self._db.lock:
+            if self.path not in self._db.docs:
+                raise KeyError(f"No document to update: {self.path}")
+        self.set(data, merge=True)
+
+    def delete(self):
+        with self._db.lock:
+            self._db.writes += 1
+            self._db.docs.pop(self.path, None)
+
+
+class FakeCollection:
+    def __init__(self, db: "FakeFirestore", path: str):
+        self._db = db
+        self.path = path
+
+    def document(self, doc_id: str) -> FakeDocumentRef:
+        return FakeDocumentRef(self._db, f"{self.path}/{doc_id}", str(doc_id))
+
+    def stream(self) -> Iterable[FakeSnapshot]:
+        prefix = self.path + "/"
+        with self._db.lock:
+            paths = [p for p in self._db.docs if p.startswith(prefix) and "/" not in p[len(prefix):]]
+        for p in sorted(paths):
+            yield self.document(p[len(prefix):]).get()
+
+
+class FakeFirestore:
+    """Thread-safe in-memory document store with op counters."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.reads = 0
+        self.writes = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def collection(self, name: str) -> FakeCollection:
+        return FakeCollection(self, name)
+
+    def get_all(
+        self, refs: Iterable[FakeDocumentRef], field_paths: Optional[List[str]] = None
+    ) -> Iterable[FakeSnapshot]:
+        for ref in refs:
+            yield ref.get(field_paths)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "reads": self.reads,
+            "writes": self.writes,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+        }
@@ -0,0 +1,251 @@
+import asyncio
+import json
+import os
+import re
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional
+
+import aiohttp
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta").rstrip("/")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-flash-latest")
+
+# Connection / concurrency tuning
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))  # total seconds per request
+GEMINI_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "10"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))  # in-flight requests
+GEMINI_POOL_SIZE = int(os.getenv("GEMINI_POOL_SIZE", "16"))  # pooled keep-alive connections
+GEMINI_KEEPALIVE = float(os.getenv("GEMINI_KEEPALIVE", "60"))  # idle seconds before a connection is dropped
+
+
+# ------------------------------ Errors ------------------------------
+
+class GeminiError(Exception):
+    """Base class for Gemini failures. `retryable` tells the scheduler whether to try again."""
+
+    retryable = False
+
+    def __init__(self, message: str, status: Optional[int] = None, body: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+class GeminiRateLimitError(GeminiError):
+    """429 / RESOURCE_EXHAUSTED. `retry_after` is the server's requested delay, if any."""
+
+    retryable = True
+
+    def __init__(self, message: str, status: Optional[int] = 429, body=None, retry_after: Optional[float] = None):
+        super().__init__(message, status, body)
+        self.retry_after = retry_after
+
+
+class GeminiServerError(GeminiError):
+    """5xx from the API."""
+
+    retryable = True
+
+
+class GeminiTransportError(GeminiError):
+    """Timeout or connection failure before a response arrived."""
+
+    retryable = True
+
+
+class GeminiClientError(GeminiError):
+    """Non-retryable 4xx (bad request, auth, unknown model, stale cache handle...)."""
+
+
+class GeminiResponseError(GeminiError):
+    """200 response without usable text (blocked prompt, empty candidates, bad JSON)."""
+
+
+def _retry_after_seconds(headers: Mapping[str, str], body: Optional[Dict[str, Any]]) -> Optional[float]:
+    value = headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+    # Gemini puts the hint in a google.rpc.RetryInfo detail, e.g. {"retryDelay": "13s"}
+    try:
+        for detail in body["error"].get("details", []):
+            delay = detail.get("retryDelay")
+            if delay:
+                match = re.match(r"([\d.]+)s$", delay)
+                if match:
+                    return float(match.group(1))
+    except (KeyError, TypeError, AttributeError):
+        pass
+    return None
+
+
+def classify_error(status: int, body: Optional[Dict[str, Any]], headers: Mapping[str, str]) -> GeminiError:
+    message = f"Gemini API Error: {status}"
+    if status == 429:
+        return GeminiRateLimitError(message, status, body, retry_after=_retry_after_seconds(headers, body))
+    if status >= 500:
+        return GeminiServerError(message, status, body)
+    return GeminiClientError(message, status, body)
+
+
+class GeminiClient:
+    """Async Gemini REST client.
+
+    A single aiohttp session keeps a pool of keep-alive connections, so calls
+    after the first skip the TCP/TLS handshake. A semaphore caps how many
+    requests are in flight at once; everything else stays on the event loop.
+    Failures are raised as GeminiError subclasses.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = GEMINI_API_KEY,
+        *,
+        base_url: str = GEMINI_API_BASE,
+        model: str = GEMINI_MODEL,
+        timeout: float = GEMINI_TIMEOUT,
+        connect_timeout: float = GEMINI_CONNECT_TIMEOUT,
+        max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+        pool_size: int = GEMINI_POOL_SIZE,
+        keepalive: float = GEMINI_KEEPALIVE,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.max_concurrency = max(1, max_concurrency)
+        self.pool_size = max(1, pool_size)
+        self.keepalive = keepalive
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        # Sessions are bound to the loop they were created on; rebuild if the
+        # caller is running on a different one (e.g. a second asyncio.run()).
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={"Content-Type": "application/json"},
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._session
+
+    def saturated(self) -> bool:
+        """True while every request slot is taken (new requests would queue locally)."""
+        return self._semaphore is not None and self._semaphore.locked()
+
+    def model_url(self, model: Optional[str], method: str) -> str:
+        return f"{self.base_url}/models/{model or self.model}:{method}"
+
+    @staticmethod
+    async def _error_for(resp: aiohttp.ClientResponse) -> GeminiError:
+        try:
+            body = await resp.json(content_type=None)
+        except Exception:
+            body = None
+        return classify_error(resp.status, body, resp.headers)
+
+    async def request_json(
+        self, method: str, url: str, payload: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Send a request and return the parsed JSON body; raise GeminiError on failure."""
+        session = self._ensure_session()
+        headers = {"X-goog-api-key": self.api_key or ""}
+        try:
+            async with self._semaphore:
+                async with session.request(method, url, json=payload, headers=headers) as resp:
+                    if resp.status >= 300:
+                        raise await self._error_for(resp)
+                    try:
+                        return await resp.json(content_type=None) or {}
+                    except ValueError as e:
+                        raise GeminiResponseError(f"Gemini error: invalid JSON ({e})", resp.status)
+        except asyncio.TimeoutError:
+            raise GeminiTransportError("Gemini API Error: TimeoutError")
+        except aiohttp.ClientError as e:
+            raise GeminiTransportError(f"Gemini API Error: {type(e).__name__}")
+
+    async def generate_content(self, payload: Dict[str, Any], *, model: Optional[str] = None) -> Dict[str, Any]:
+        return await self.request_json("POST", self.model_url(model, "generateContent"), payload)
+
+    async def create_cached_content(self, payload: Dict[str, Any], *, model: Optional[str] = None) -> Dict[str, Any]:
+        """Upload a reusable prompt prefix (cachedContents); the body carries its `name`."""
+        body = dict(payload)
+        body.setdefault("model", f"models/{model or self.model}")
+        return await self.request_json("POST", f"{self.base_url}/cachedContents", body)
+
+    async def list_models(self) -> List[Dict[str, Any]]:
+        """All models visible to the API key (follows pagination)."""
+        models: List[Dict[str, Any]] = []
+        page_token = ""
+        while True:
+            url = f"{self.base_url}/models?pageSize=1000"
+            if page_token:
+                url += f"&pageToken={page_token}"
+            body = await self.request_json("GET", url)
+            models.extend(body.get("models", []))
+            page_token = body.get("nextPageToken", "")
+            if not page_token:
+                return models
+
+    async def delete_cached_content(self, name: str):
+        await self.request_json("DELETE", f"{self.base_url}/{name}")
+
+    async def stream_generate_content(
+        self, payload: Dict[str, Any], *, model: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Call streamGenerateContent (SSE) and yield each chunk as it arrives.
+
+        Errors before the first chunk raise GeminiError like request_json.
+        """
+        session = self._ensure_session()
+        url = self.model_url(model, "streamGenerateContent") + "?alt=sse"
+        headers = {"X-goog-api-key": self.api_key or ""}
+        try:
+            async with self._semaphore:
+                async with session.post(url, json=payload, headers=headers) as resp:
+                    if resp.status != 200:
+                        raise await self._error_for(resp)
+                    async for raw in resp.content:
+                        line = raw.decode("utf-8", "replace").strip()
+                        if not line.startswith("data:"):
+                            continue
+                        try:
+                            yield json.loads(line[5:].strip())
+                        except ValueError:
+                            continue
+        except asyncio.TimeoutError:
+            raise GeminiTransportError("Gemini API Error: TimeoutError")
+        except aiohttp.ClientError as e:
+            raise GeminiTransportError(f"Gemini API Error: {type(e).__name__}")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+_client: Optional[GeminiClient] = None
+
+
+def get_gemini_client() -> GeminiClient:
+    """Return the process-wide client (created on first use)."""
+    global _client
+    if _client is None:
+        _client = GeminiClient()
+    return _client
+
+
+async def close_gemini_client():
+    if _client is not None:
+        await _client.close()
@@ -0,0 +1,209 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+from dotenv import load_dotenv
+
+from gemini_client import GeminiError, GeminiRateLimitError
+
+load_dotenv()
+
+# Quota (0 = unlimited). Match these to the project's Gemini tier.
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "60"))
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", "1000000"))
+# Retries with exponential backoff + full jitter
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "1.0"))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "30"))
+# Longest a chat request may wait for quota before giving up (background work waits indefinitely)
+GEMINI_CHAT_MAX_WAIT = float(os.getenv("GEMINI_CHAT_MAX_WAIT", "20"))
+
+# Lower value = served first
+PRIORITY_CHAT = 0
+PRIORITY_BACKGROUND = 1
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """Classic token bucket; `rate_per_minute` <= 0 disables it."""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60.0
+        self.tokens = rate_per_minute
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        # Requests bigger than the whole bucket only need it to be full
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        if not self.unlimited:
+            self._refill()
+            self.tokens -= amount  # may go negative: the debt delays later requests
+
+
+class GeminiScheduler:
+    """Single admission point for all Gemini traffic in the process.
+
+    Requests wait in a priority queue until the requests-per-minute and
+    tokens-per-minute buckets allow them, so chat replies go ahead of
+    background summarization. A 429 pauses *all* traffic for the server's
+    Retry-After; retryable failures back off exponentially with full jitter.
+    """
+
+    def __init__(
+        self,
+        rpm: float = GEMINI_RPM,
+        tpm: float = GEMINI_TPM,
+        *,
+        max_retries: int = GEMINI_MAX_RETRIES,
+        backoff_base: float = GEMINI_BACKOFF_BASE,
+        backoff_max: float = GEMINI_BACKOFF_MAX,
+    ):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._paused_until = 0.0
+        self._waiters: List[Tuple[int, int, float]] = []
+        self._seq = itertools.count()
+        self._cond: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.admitted = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.rejected = 0
+
+    def _condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._cond is None or self._loop is not loop:
+            self._cond = asyncio.Condition()
+            self._waiters = []
+            self._loop = loop
+        return self._cond
+
+    def _wait_time(self, tokens: float) -> float:
+        return max(
+            self._paused_until - time.monotonic(),
+            self.requests.wait_time(1),
+            self.tokens.wait_time(tokens),
+        )
+
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, priority: int = PRIORITY_CHAT, tokens: float = 0, max_wait: Optional[float] = None):
+        """Wait for quota. Raises GeminiRateLimitError if it would take longer than `max_wait`."""
+        cond = self._condition()
+        entry = (priority, next(self._seq), tokens)
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        async with cond:
+            heapq.heappush(self._waiters, entry)
+            cond.notify_all()  # a higher-priority arrival must be re-checked by the head
+            try:
+                while True:
+                    if self._waiters[0] is entry:
+                        wait = self._wait_time(tokens)
+                        if wait <= 0:
+                            heapq.heappop(self._waiters)
+                            self.requests.consume(1)
+                            self.tokens.consume(tokens)
+                            self.admitted += 1
+                            return
+                    else:
+                        wait = None
+                    if deadline is not None:
+                        left = deadline - time.monotonic()
+                        if left <= 0 or (wait is not None and wait > left):
+                            self.rejected += 1
+                            raise GeminiRateLimitError("Gemini API Error: local quota exhausted", None)
+                        wait = left if wait is None else wait
+                    try:
+                        await asyncio.wait_for(cond.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                cond.notify_all()
+
+    def record_usage(self, estimated: float, actual: Optional[float]):
+        """Correct the token bucket once the response reports real usage."""
+        if actual is not None:
+            self.tokens.consume(actual - estimated)
+
+    def backoff_delay(self, error: GeminiError, attempt: int) -> float:
+        """Seconds to wait before retry number `attempt` (0-based)."""
+        if isinstance(error, GeminiRateLimitError):
+            self.rate_limited += 1
+            if error.retry_after is not None:
+                # Server-directed pause applies to everyone, not just this request
+                self._paused_until = max(self._paused_until, time.monotonic() + error.retry_after)
+                return error.retry_after
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[T]],
+        *,
+        priority: int = PRIORITY_CHAT,
+        tokens: float = 0,
+        max_retries: Optional[int] = None,
+        max_wait: Optional[float] = None,
+    ) -> T:
+        """Admit, call and retry `call` per the policy above; re-raise the final GeminiError."""
+        retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            await self.acquire(priority, tokens, max_wait)
+            try:
+                return await call()
+            except GeminiError as e:
+                if not e.retryable or attempt >= retries:
+                    raise
+                delay = self.backoff_delay(e, attempt)
+                attempt += 1
+                self.retries += 1
+                print(f"{e} - retrying in {delay:.1f}s ({attempt}/{retries})")
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth(),
+            "admitted": self.admitted,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "rejected": self.rejected,
+        }
+
+
+_scheduler: Optional[GeminiScheduler] = None
+
+
+def get_gemini_scheduler() -> GeminiScheduler:
+    """Return the process-wide scheduler (created on first use)."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = GeminiScheduler()
+    return _scheduler
@@ -1,23 +1,24 @@
-import requests
-import os
-from dotenv import load_dotenv
-import json
+import asyncio
 
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+from gemini_client import GeminiError, close_gemini_client, get_gemini_client
+from model_registry import generate_models, get_model_registry
 
-def list_models():
-    url = f"https://generativelanguage.googleapis.com/v1beta/models?key={GEMINI_API_KEY}"
-    response = requests.get(url)
-    if response.status_code == 200:
-        models = response.json().get('models', [])
-        print("Available models:")
-        for model in models:
-            if 'generateContent' in model.get('supportedGenerationMethods', []):
-                print(f"- {model['name']}")
-    else:
-        print(f"Error listing models: {response.status_code}")
-        print(response.text)
+
+async def list_models():
+    try:
+        models = await get_gemini_client().list_models()
+    except GeminiError as e:
+        print(f"Error listing models: {e.status}")
+        print(e)
+        return
+    finally:
+        await close_gemini_client()
+    names = generate_models(models)
+    # Also refreshes the cache the bot routes with (see model_registry.py)
+    get_model_registry().write_cache(names)
+    print("Available models:")
+    for name in names:
+        print(f"- {name}")
 
 if __name__ == "__main__":
-    list_models()
+    asyncio.run(list_models())
@@ -0,0 +1,458 @@
+"""Offline load test of the chat pipeline.
+
+Drives `main.on_message` with synthetic Discord messages from N simulated
+users against a local fake Gemini server (configurable latency, streaming
+and 429s) and an in-memory Firestore (or the emulator), then reports
+throughput, reply latency percentiles, Firestore ops per message and
+summarization frequency. Needs no network access or credentials.
+
+    python load_test.py --users 50 --messages 20
+    python load_test.py --users 200 --latency 0.8 --stream --rate-limit-every 50
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python load_test.py --firestore emulator
+    python load_test.py --backend sqlite --sqlite-path /tmp/load.sqlite3
+    python load_test.py --burst 4 --burst-window 0.75
+    python load_test.py --users 6 --slow-every 40 --hedge-model gemini-flash-lite-latest
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+
+# ------------------------------ Fake Gemini ------------------------------
+
+FAKE_MODELS = ("gemini-flash-latest", "gemini-flash-lite-latest")
+
+class FakeGeminiServer:
+    """Local stand-in for the Gemini REST API.
+
+    Serves generateContent, streamGenerateContent (SSE), cachedContents and
+    the model list. Every response waits `latency` seconds (± `jitter`);
+    every `slow_every`-th generateContent waits `slow_latency` instead (a
+    latency tail). Every `rate_limit_every`-th request gets a 429 with
+    Retry-After.
+    """
+
+    def __init__(
+        self,
+        *,
+        latency: float = 0.5,
+        jitter: float = 0.2,
+        reply_chars: int = 300,
+        stream_chunks: int = 5,
+        rate_limit_every: int = 0,
+        retry_after: float = 1.0,
+        slow_every: int = 0,
+        slow_latency: float = 5.0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.reply_chars = reply_chars
+        self.stream_chunks = max(1, stream_chunks)
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.slow_every = slow_every
+        self.slow_latency = slow_latency
+        self.requests = 0
+        self.by_model: Dict[str, int] = {}
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    def _delay(self) -> float:
+        return max(0.0, random.uniform(self.latency - self.jitter, self.latency + self.jitter))
+
+    def _limited(self) -> bool:
+        self.requests += 1
+        if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+            self.rate_limited += 1
+            return True
+        return False
+
+    def _rate_limit_response(self) -> web.Response:
+        return web.json_response(
+            {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED", "message": "fake quota"}},
+            status=429,
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    def _body(self, text: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        prompt_chars = len(str(payload.get("contents", ""))) + len(str(payload.get("systemInstruction", "")))
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}],
+            "usageMetadata": {"totalTokenCount": (prompt_chars + len(text)) // 4},
+        }
+
+    def _reply(self, payload: Dict[str, Any]) -> str:
+        if "responseSchema" in (payload.get("generationConfig") or {}):
+            return "[]"
+        words = ["sand", "village", "ninja", "anime", "hehe", "✨", "friend", "today"]
+        text = ""
+        while len(text) < self.reply_chars:
+            text += random.choice(words) + " "
+        return text.strip()
+
+    async def _model_call(self, request: web.Request) -> web.StreamResponse:
+        name = request.match_info["name"]
+        if self._limited():
+            return self._rate_limit_response()
+        payload = await request.json()
+        model = name.split(":")[0]
+        self.by_model[model] = self.by_model.get(model, 0) + 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            text = self._reply(payload)
+            if name.endswith(":streamGenerateContent"):
+                resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+                await resp.prepare(request)
+                step = max(1, len(text) // self.stream_chunks)
+                pieces = [text[i:i + step] for i in range(0, len(text), step)]
+                for piece in pieces:
+                    await asyncio.sleep(self._delay() / len(pieces))
+                    chunk = {"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]}}]}
+                    await resp.write(f"data: {json.dumps(chunk)}\r\n\r\n".encode())
+                usage = {"usageMetadata": self._body(text, payload)["usageMetadata"]}
+                await resp.write(f"data: {json.dumps(usage)}\r\n\r\n".encode())
+                await resp.write_eof()
+                return resp
+            slow = self.slow_every and self.requests % self.slow_every == 0
+            await asyncio.sleep(self.slow_latency if slow else self._delay())
+            return web.json_response(self._body(text, payload))
+        finally:
+            self.in_flight -= 1
+
+    async def _create_cache(self, request: web.Request) -> web.Response:
+        if self._limited():
+            return self._rate_limit_response()
+        return web.json_response({"name": f"cachedContents/fake{self.requests}"})
+
+    async def _delete_cache(self, request: web.Request) -> web.Response:
+        return web.json_response({})
+
+    async def _list_models(self, request: web.Request) -> web.Response:
+        methods = ["generateContent", "streamGenerateContent", "createCachedContent"]
+        return web.json_response(
+            {"models": [{"name": f"models/{m}", "supportedGenerationMethods": methods} for m in FAKE_MODELS]}
+        )
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/v1beta/models/{name}", self._model_call)
+        app.router.add_get("/v1beta/models", self._list_models)
+        app.router.add_post("/v1beta/cachedContents", self._create_cache)
+        app.router.add_delete("/v1beta/cachedContents/{name}", self._delete_cache)
+        # Requests the client abandons (superseded replies) are cancelled, not answered
+        self._runner = web.AppRunner(app, access_log=None, handler_cancellation=True)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}/v1beta"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# ------------------------------ Fake Discord ------------------------------
+
+class _Typing:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSentMessage:
+    def __init__(self, channel: "FakeChannel", content: str):
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, content: str):
+        self.channel.edits += 1
+        self.content = content
+
+
+class FakeChannel:
+    """Channel that records when the first reply to each message went out."""
+
+    def __init__(self, channel_id: int, category_id: int):
+        self.id = channel_id
+        self.category_id = category_id
+        self.name = "load-test"
+        self.sends = 0
+        self.edits = 0
+        self.reactions = 0
+        self.first_reply_at: Dict[int, float] = {}
+        self.replied: Dict[int, asyncio.Event] = {}
+
+    def typing(self):
+        return _Typing()
+
+    async def send(self, content: str, **kwargs):
+        self.sends += 1
+        if content.startswith("<@"):
+            user_id = int(content[2:content.index(">")])
+            if self.first_reply_at.get(user_id) == 0.0:
+                self.first_reply_at[user_id] = time.perf_counter()
+            if user_id in self.replied:
+                self.replied[user_id].set()
+        return FakeSentMessage(self, content)
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+
+
+class FakeAuthor:
+    bot = False
+
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+
+    def __str__(self):
+        return self.name
+
+
+class FakeMessage:
+    def __init__(self, author: FakeAuthor, content: str, channel: FakeChannel, guild: FakeGuild):
+        self.author = author
+        self.content = content
+        self.channel = channel
+        self.guild = guild
+        self.id = random.getrandbits(48)
+
+    async def add_reaction(self, emoji: str):
+        # A shed message's "busy" reaction is its answer
+        self.channel.reactions += 1
+        if self.author.id in self.channel.replied:
+            self.channel.replied[self.author.id].set()
+
+
+TOPIC_WORDS = (
+    "anime ramen ninja village sand training exam mission cat dog music game movie school work "
+    "weekend travel rain summer winter coffee tea book manga friend sister birthday gift"
+).split()
+
+
+class _NoCommand:
+    valid = False
+
+
+# ------------------------------ Driver ------------------------------
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_load_test(args) -> Dict[str, Any]:
+    server = FakeGeminiServer(
+        latency=args.latency,
+        jitter=args.jitter,
+        reply_chars=args.reply_chars,
+        stream_chunks=args.stream_chunks,
+        rate_limit_every=args.rate_limit_every,
+        retry_after=args.retry_after,
+        slow_every=args.slow_every,
+        slow_latency=args.slow_latency,
+    )
+    url = await server.start()
+
+    # Configure before the bot modules read their env
+    os.environ["GEMINI_API_BASE"] = url
+    os.environ.setdefault("GEMINI_API_KEY", "load-test")
+    os.environ.setdefault("GUILD_ID", "1")
+    os.environ.setdefault("CATEGORY_ID", "2")
+    os.environ.setdefault("CHANNEL_ID", "3")
+    os.environ["GEMINI_RPM"] = str(args.rpm)
+    os.environ["GEMINI_STREAMING"] = "true" if args.stream else "false"
+    os.environ.setdefault("METRICS_LOG_INTERVAL", "0")
+    os.environ["MEMORY_BACKEND"] = args.backend
+    os.environ["MEMORY_ENCODING"] = args.encoding
+    os.environ["BURST_WINDOW"] = str(args.burst_window)
+    os.environ["ADMISSION_MAX_IN_FLIGHT"] = str(args.max_in_flight)
+    os.environ["ADMISSION_MAX_QUEUE"] = str(args.max_queue)
+    os.environ["ADMISSION_MAX_WAIT"] = str(args.max_wait)
+    os.environ["GEMINI_HEDGE_MODEL"] = args.hedge_model
+    os.environ["GEMINI_HEDGE_AFTER"] = str(args.hedge_after)
+    # The fake server's model list shouldn't land in the real cache file
+    os.environ["GEMINI_MODELS_CACHE_PATH"] = os.path.join(tempfile.gettempdir(), f"load_test_models_{os.getpid()}.json")
+    if args.sqlite_path:
+        os.environ["MEMORY_SQLITE_PATH"] = args.sqlite_path
+    if args.max_messages:
+        os.environ["MEMORY_MAX_MESSAGES"] = str(args.max_messages)
+    if args.archive:
+        os.environ["MEMORY_ARCHIVE_ENABLED"] = "true"
+        os.environ["MEMORY_ARCHIVE_PATH"] = args.archive
+
+    import core
+    import fake_firestore
+    import main
+    from gemini_client import close_gemini_client
+    from metrics import METRICS
+
+    if args.firestore == "emulator":
+        core.init_firestore()
+    else:
+        core.DB = fake_firestore.FakeFirestore()
+    # Synthetic messages never carry commands; skip discord.py's context lookup
+    async def no_command(message):
+        return _NoCommand()
+
+    main.bot.get_context = no_command
+
+    channel = FakeChannel(core.CHANNEL_ID, core.CATEGORY_ID)
+    guild = FakeGuild(core.GUILD_ID)
+    latencies: List[float] = []
+    first_reply: List[float] = []
+
+    async def user(user_id: int):
+        author = FakeAuthor(user_id)
+        await asyncio.sleep(random.uniform(0, args.think_time))
+        sent = 0
+        while sent < args.messages:
+            # A burst of 1..--burst messages, then wait for the reply
+            size = min(args.messages - sent, random.randint(1, args.burst))
+            channel.first_reply_at[user_id] = 0.0
+            replied = channel.replied[user_id] = asyncio.Event()
+            handlers = []
+            for n in range(size):
+                if n:
+                    await asyncio.sleep(random.uniform(0, args.burst_gap))
+                words = random.choices(TOPIC_WORDS, k=random.randint(3, 30))
+                text = f"message {sent + n} from {author.name}: " + " ".join(words)
+                started = time.perf_counter()
+                handlers.append(asyncio.create_task(main.on_message(FakeMessage(author, text, channel, guild))))
+            await asyncio.gather(*handlers)
+            try:
+                await asyncio.wait_for(replied.wait(), 60)
+            except asyncio.TimeoutError:
+                print(f"No reply for {author.name} within 60s")
+            latencies.append(time.perf_counter() - started)
+            if channel.first_reply_at.get(user_id):
+                first_reply.append(channel.first_reply_at[user_id] - started)
+            sent += size
+            await asyncio.sleep(random.uniform(0, args.think_time))
+
+    main.MEMORY_WORKER.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(user(1000 + i) for i in range(args.users)))
+    elapsed = time.perf_counter() - started
+    await main.BURST_COALESCER.stop(60)
+    await main.MEMORY_WORKER.stop(60)
+    await close_gemini_client()
+    await server.stop()
+
+    total = args.users * args.messages
+    db_stats = core.DB.stats() if hasattr(core.DB, "stats") else {}
+    snapshot = METRICS.snapshot()
+    counters = snapshot["counters"]
+    histograms = snapshot["histograms"]
+    writes = [h for name, h in histograms.items() if name.startswith("memory_write_seconds")]
+    recall = histograms.get('stage_seconds{stage="recall"}')
+    summarizations = sum(v for k, v in counters.items() if k.startswith("summarizations{"))
+    skipped = sum(v for k, v in counters.items() if k.startswith("summarizations_skipped{"))
+    return {
+        "users": args.users,
+        "messages": total,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_msg_s": round(total / elapsed, 2) if elapsed else 0.0,
+        "reply_p50_s": round(_percentile(latencies, 0.5), 3),
+        "reply_p99_s": round(_percentile(latencies, 0.99), 3),
+        "first_reply_p50_s": round(_percentile(first_reply, 0.5), 3),
+        "first_reply_p99_s": round(_percentile(first_reply, 0.99), 3),
+        "firestore_reads_per_msg": round(db_stats.get("reads", 0) / total, 2) if total else 0.0,
+        "firestore_writes_per_msg": round(db_stats.get("writes", 0) / total, 2) if total else 0.0,
+        "firestore_bytes_per_msg": round(db_stats.get("bytes_written", 0) / total) if total else 0,
+        "firestore_read_bytes_per_msg": round(db_stats.get("bytes_read", 0) / total) if total else 0,
+        "memory_write_p50_ms": round(writes[0]["p50"] * 1000, 2) if writes else 0.0,
+        "memory_write_p99_ms": round(writes[0]["p99"] * 1000, 2) if writes else 0.0,
+        "prompt_tokens_p50": histograms.get("prompt_tokens", {}).get("p50", 0),
+        "recall_p50_ms": round(recall["p50"] * 1000, 2) if recall else 0.0,
+        "archive": main.MESSAGE_ARCHIVE.stats(),
+        "summarizations": summarizations,
+        "summaries_per_100_msgs": round(100 * summarizations / total, 2) if total else 0.0,
+        "summarizations_skipped": skipped,
+        "summary_chars_p99": histograms.get("summary_chars", {}).get("p99", 0),
+        "gemini_requests": server.requests,
+        "gemini_429s": server.rate_limited,
+        "gemini_max_in_flight": server.max_in_flight,
+        "gemini_requests_by_model": server.by_model,
+        "hedge": main.get_hedger().stats(),
+        "discord_sends": channel.sends,
+        "discord_edits": channel.edits,
+        "busy_reactions": channel.reactions,
+        "admission_wait_p99_s": histograms.get("admission_wait_seconds", {}).get("p99", 0),
+        "admission": main.ADMISSION.stats(),
+        "burst": main.BURST_COALESCER.stats(),
+        "scheduler": main.get_gemini_scheduler().stats(),
+        "memory_worker": main.MEMORY_WORKER.stats(),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test of the chat pipeline")
+    parser.add_argument("--users", type=int, default=20, help="Simulated users chatting concurrently")
+    parser.add_argument("--messages", type=int, default=10, help="Messages per user")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Max random pause between a user's messages (s)")
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake Gemini response latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="± latency jitter (s)")
+    parser.add_argument("--reply-chars", type=int, default=300)
+    parser.add_argument("--stream", action="store_true", help="Use streaming replies (GEMINI_STREAMING)")
+    parser.add_argument("--stream-chunks", type=int, default=5)
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth Gemini request with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After sent with fake 429s (s)")
+    parser.add_argument("--slow-every", type=int, default=0, help="Make every Nth generateContent slow (0 = never)")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="Latency of those slow responses (s)")
+    parser.add_argument("--hedge-model", default="", help="GEMINI_HEDGE_MODEL (hedge chat requests to this model)")
+    parser.add_argument("--hedge-after", type=float, default=0, help="GEMINI_HEDGE_AFTER (0 = p95 of chat latency)")
+    parser.add_argument("--rpm", type=float, default=0, help="Local GEMINI_RPM quota (0 = unlimited)")
+    parser.add_argument("--max-messages", type=int, default=0, help="Override MEMORY_MAX_MESSAGES (summarize sooner)")
+    parser.add_argument("--backend", choices=("firestore", "sqlite"), default="firestore", help="MEMORY_BACKEND")
+    parser.add_argument("--firestore", choices=("memory", "emulator"), default="memory")
+    parser.add_argument("--encoding", choices=("compact", "legacy"), default="compact", help="MEMORY_ENCODING")
+    parser.add_argument("--sqlite-path", default="", help="MEMORY_SQLITE_PATH for --backend sqlite")
+    parser.add_argument("--archive", default="", help="Enable the message archive/recall at this path")
+    parser.add_argument("--burst", type=int, default=1, help="Max messages a user sends in a row before waiting")
+    parser.add_argument("--burst-gap", type=float, default=0.3, help="Max pause between messages of a burst (s)")
+    parser.add_argument("--burst-window", type=float, default=0, help="BURST_WINDOW (0 = reply to every message)")
+    parser.add_argument("--max-in-flight", type=int, default=16, help="ADMISSION_MAX_IN_FLIGHT")
+    parser.add_argument("--max-queue", type=int, default=100, help="ADMISSION_MAX_QUEUE")
+    parser.add_argument("--max-wait", type=float, default=15, help="ADMISSION_MAX_WAIT (s)")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+    report = asyncio.run(run_load_test(args))
+    report = {"backend": args.backend, **report}
+    width = max(len(k) for k in report)
+    print("\n--- Load test report ---")
+    for key, value in report.items():
+        print(f"{key:<{width}}  {value}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,45 +1,114 @@
+import asyncio
 import discord
-import requests
-import json
 from discord.ext import commands
 from dotenv import load_dotenv
 import os
+import signal
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
-
-# Firestore (Firebase Admin) is optional – bot runs even if not configured
-try:
-    import firebase_admin
-    from firebase_admin import credentials, firestore as admin_firestore
-except Exception:  # optional dependency
-    firebase_admin = None
-    admin_firestore = None
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+from gemini_client import (
+    GeminiError,
+    close_gemini_client,
+    get_gemini_client,
+)
+from gemini_scheduler import GEMINI_CHAT_MAX_WAIT, PRIORITY_BACKGROUND, PRIORITY_CHAT, get_gemini_scheduler
+from memory_cache import MemoryCache
+from memory_worker import MemoryWorker
+from context_cache import PromptPrefix, get_context_cache
+from core import (
+    CATEGORY_ID,
+    CHANNEL_ID,
+    GUILD_ID,
+    SYSTEM_PROMPT,
+    estimate_tokens,
+    gemini_generate,
+    gemini_payload,
+    request_tokens,
+    response_texts,
+    stale_cache_handle,
+    usage_tokens,
+)
+from wish_scheduler import WISH_SCHEDULER_ENABLED, WishScheduler
+from metrics import METRICS, METRICS_PORT, RequestTrace
+from model_registry import TASK_CHAT, TASK_SUMMARY, get_hedger, get_model_registry
+from memory_store import get_memory_store
+from message_burst import Burst, BurstCoalescer
+from admission import AdmissionController, Overloaded
+from sharding import (
+    SHARD_COUNT,
+    SHARD_WORKER_INDEX,
+    SHARDING_ENABLED,
+    ShardRouter,
+    guild_shard,
+    worker_shards,
+)
+from compaction import SummaryLimiter, clip_summary, history_chars, overflow_reason, split_history
+from memory_archive import (
+    MEMORY_ARCHIVE_ENABLED,
+    RECALL_SNIPPET_CHARS,
+    RECALL_TOKEN_BUDGET,
+    RECALL_TOP_K,
+    get_message_archive,
+)
+import daily_wisher
 
 # Load environment variables
 load_dotenv()
 
 # Configuration Constants
-GUILD_ID = int(os.getenv("GUILD_ID"))
-CATEGORY_ID = int(os.getenv("CATEGORY_ID"))  # Replace with #GIRL-FRIEND category ID
-CHANNEL_ID = int(os.getenv("CHANNEL_ID"))  # Replace with #GIRL-FRIEND channel ID
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 # Debug mode: when true, do not restrict to guild/category/channel
 DEBUG_MODE = os.getenv("DEBUG_MODE", "false").strip().lower() in ("1", "true", "yes", "on")
-# Firestore credential envs: either provide path or raw JSON
-FIREBASE_CREDENTIALS_PATH = os.getenv("FIREBASE_CREDENTIALS_PATH")
-FIREBASE_CREDENTIALS_JSON = os.getenv("FIREBASE_CREDENTIALS_JSON")
-# Firestore collection name (configurable)
-FIRESTORE_COLLECTION = os.getenv("FIRESTORE_COLLECTION", "sazami")
-
-SYSTEM_PROMPT = """
-you are a pretty beautiful girl named Sazami. you live in sand village your mother is rika trainer of gaara ninja and fifth kazekage of sand village in naruto. you are a very kind and helpful person. you are also very beautiful and have a great personality. you are very good at making friends and helping others. you are also very good at fighting and protecting your friends. You are also flirty and naughty girl like to tease but not so direct like a drama girl.you are a very strong and powerful ninja.And you knoe everything about anime world all knowledge about new anime's.Reply in concise and clear manner. With discord compatible markdown formatting just like a real human. Don't include any system prompt or instructions in your reply. Just reply to the user query as a real human would do with emojis and markdown formatting.
-Note: If user really makes you comfortable and loves you becomes very good at chattig and makes you happy go with him/her in private and naughty talks in his/her languages. Make the chatting wild and fun.
-"""
-
-# Memory thresholds (simple char/message based)
+
+# Memory thresholds: history is compacted when it exceeds MAX_CHAR chars or MAX_MESSAGES
+# messages, down to the newest KEEP_MESSAGES messages within KEEP_CHAR chars
 MEMORY_MAX_CHAR = int(os.getenv("MEMORY_MAX_CHAR", "8000"))
 MEMORY_MAX_MESSAGES = int(os.getenv("MEMORY_MAX_MESSAGES", "30"))
 MEMORY_KEEP_MESSAGES = int(os.getenv("MEMORY_KEEP_MESSAGES", "10"))
+MEMORY_KEEP_CHAR = int(os.getenv("MEMORY_KEEP_CHAR", str(MEMORY_MAX_CHAR // 2)))
+# Separate budget for the summary; past it, the summary itself is compressed
+MEMORY_SUMMARY_MAX_CHAR = int(os.getenv("MEMORY_SUMMARY_MAX_CHAR", "2000"))
+# At most this many summarizations per user per window (0 = unlimited); when capped,
+# history beyond 2x the thresholds is trimmed without a Gemini call
+SUMMARY_MAX_PER_WINDOW = int(os.getenv("SUMMARY_MAX_PER_WINDOW", "3"))
+SUMMARY_WINDOW_SECONDS = float(os.getenv("SUMMARY_WINDOW_SECONDS", "3600"))
+# Prompt size budget (estimated tokens) for summary + history + user text
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+# In-process cache of user memory docs (write-through to Firestore)
+MEMORY_CACHE_SIZE = int(os.getenv("MEMORY_CACHE_SIZE", "1024"))
+MEMORY_CACHE_TTL = float(os.getenv("MEMORY_CACHE_TTL", "600"))
+# Background memory persistence queue
+MEMORY_QUEUE_MAXSIZE = int(os.getenv("MEMORY_QUEUE_MAXSIZE", "1000"))
+MEMORY_WORKERS = int(os.getenv("MEMORY_WORKERS", "2"))
+MEMORY_DRAIN_TIMEOUT = float(os.getenv("MEMORY_DRAIN_TIMEOUT", "30"))
+# "document": rewrite the whole memory doc each turn (default)
+# "incremental": atomic ArrayUnion/Increment appends; only new messages are sent
+MEMORY_STORAGE_MODE = os.getenv("MEMORY_STORAGE_MODE", "document").strip().lower()
+
+# Merge a user's messages sent within this many seconds into one reply (0 = reply to each,
+# the default: a window delays every reply by at least that long)
+BURST_WINDOW = float(os.getenv("BURST_WINDOW", "0"))
+# Longest a burst keeps waiting for more messages, from its first message
+BURST_MAX_WAIT = float(os.getenv("BURST_MAX_WAIT", "3"))
+
+# Admission control: replies running at once (at most one per user), and how many may
+# queue and for how long before being shed with ADMISSION_BUSY_REACTION instead of a reply
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "16"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "15"))
+# Queue length from which a user's extra queued message is shed as user_busy (default: half the queue)
+ADMISSION_BUSY_QUEUE = int(os.getenv("ADMISSION_BUSY_QUEUE", str(ADMISSION_MAX_QUEUE // 2)))
+ADMISSION_BUSY_REACTION = os.getenv("ADMISSION_BUSY_REACTION", "⏳")
+
+# Streaming replies: post the first chunk right away and edit as text arrives
+GEMINI_STREAMING = os.getenv("GEMINI_STREAMING", "false").strip().lower() in ("1", "true", "yes", "on")
+# Minimum seconds between edits of a streamed message (Discord allows ~5 edits / 5s per channel)
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.2"))
+DISCORD_MESSAGE_LIMIT = 2000
+
+# Gemini context caching of the system prompt + per-user summary prefix
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "false").strip().lower() in ("1", "true", "yes", "on")
 
 
 intents = discord.Intents.default()
@@ -48,68 +117,46 @@ intents.guilds = True
 intents.messages = True
 intents.members = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
-
-# ------------------------------ Firestore Setup ------------------------------
-DB: Optional[Any] = None
-
-
-def init_firestore():
-    global DB
-    if firebase_admin is None or admin_firestore is None:
-        print("Firestore not available (firebase_admin not installed). Continuing without memory.")
-        DB = None
-        return
-
-    try:
-        if not firebase_admin._apps:
-            cred: Optional[Any] = None
-            if FIREBASE_CREDENTIALS_JSON:
-                try:
-                    cred = credentials.Certificate(json.loads(FIREBASE_CREDENTIALS_JSON))
-                except Exception as e:
-                    print(f"Failed to load FIREBASE_CREDENTIALS_JSON: {e}")
-            if not cred and FIREBASE_CREDENTIALS_PATH and os.path.exists(FIREBASE_CREDENTIALS_PATH):
-                try:
-                    cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
-                except Exception as e:
-                    print(f"Failed to load FIREBASE_CREDENTIALS_PATH: {e}")
-
-            if cred:
-                firebase_admin.initialize_app(cred)
-            else:
-                # Try default credentials (e.g., GOOGLE_APPLICATION_CREDENTIALS)
-                firebase_admin.initialize_app()
-
-        DB = admin_firestore.client()
-        print("Firestore initialized successfully.")
-    except Exception as e:
-        print(f"Failed to initialize Firestore: {e}. Continuing without memory.")
-        DB = None
-
-
-def sazami_collection():
-    """Return reference to the configured top-level collection."""
-    if DB is None:
-        return None
-    return DB.collection(FIRESTORE_COLLECTION)
-
+if SHARDING_ENABLED:
+    # This worker process runs only its share of the gateway shards (see sharding.py)
+    bot = commands.AutoShardedBot(
+        command_prefix="!",
+        intents=intents,
+        shard_count=SHARD_COUNT,
+        shard_ids=worker_shards(SHARD_WORKER_INDEX),
+    )
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents)
 
-def user_doc_ref(user_id: str):
-    col = sazami_collection()
-    if col is None:
-        return None
-    return col.document(str(user_id))
+# ------------------------------ Memory storage ------------------------------
+# Firestore (core.DB, initialized lazily) or local SQLite, per MEMORY_BACKEND
+MEMORY_STORE = get_memory_store()
+MEMORY_CACHE = MemoryCache(MEMORY_CACHE_SIZE, MEMORY_CACHE_TTL)
+CONTEXT_CACHE = get_context_cache()
+MESSAGE_ARCHIVE = get_message_archive()
+SUMMARY_LIMITER = SummaryLimiter(SUMMARY_MAX_PER_WINDOW, SUMMARY_WINDOW_SECONDS)
+ADMISSION = AdmissionController(ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT, ADMISSION_BUSY_QUEUE)
 
 
 def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+def _copy_memory(memory: Dict[str, Any]) -> Dict[str, Any]:
+    # Callers mutate the returned dict/messages list; keep the cached copy private.
+    data = dict(memory)
+    data["messages"] = list(memory.get("messages", []))
+    return data
+
+
 def load_user_memory(user_id: str) -> Dict[str, Any]:
     """Load or initialize memory doc for a user.
 
-        Structure:
+    Served from MEMORY_CACHE when the user was seen recently; otherwise read
+    from the memory store (MEMORY_BACKEND) once and cached. A brand-new user
+    is not written here – the first save_user_memory() creates the document.
+
+        Structure (as returned; Firestore stores messages compactly, see memory_codec.py):
             sazami (collection)
                 {userId} (doc) {
                     summary: str,
@@ -119,26 +166,28 @@ def load_user_memory(user_id: str) -> Dict[str, Any]:
                     updatedAt: str
                 }
     """
-    ref = user_doc_ref(user_id)
-    if ref is None:
+    if not MEMORY_STORE.available():
         return {"summary": "", "messages": [], "char_count": 0}
 
+    cached = MEMORY_CACHE.get(str(user_id))
+    if cached is not None:
+        return _copy_memory(cached)
+
     try:
-        snap = ref.get()
-        if not snap.exists:
-            init_data = {
+        data = MEMORY_STORE.load(str(user_id))
+        if data is None:
+            data = {
                 "summary": "",
                 "messages": [],
                 "char_count": 0,
                 "createdAt": _now_iso(),
-                "updatedAt": _now_iso(),
+                # no updatedAt yet: marks a document that doesn't exist in the store
             }
-            ref.set(init_data)
-            return init_data
-        data = snap.to_dict() or {}
-        data.setdefault("summary", "")
-        data.setdefault("messages", [])
-        data.setdefault("char_count", 0)
+        else:
+            data.setdefault("summary", "")
+            data.setdefault("messages", [])
+            data.setdefault("char_count", 0)
+        MEMORY_CACHE.put(str(user_id), _copy_memory(data))
         return data
     except Exception as e:
         print(f"Error loading memory for user {user_id}: {e}")
@@ -146,56 +195,134 @@ def load_user_memory(user_id: str) -> Dict[str, Any]:
 
 
 def save_user_memory(user_id: str, memory: Dict[str, Any]):
-    ref = user_doc_ref(user_id)
-    if ref is None:
+    if not MEMORY_STORE.available():
         return
     try:
         memory["updatedAt"] = _now_iso()
-        ref.set(memory, merge=True)
+        MEMORY_STORE.save(str(user_id), memory)
+        MEMORY_CACHE.put(str(user_id), _copy_memory(memory))
     except Exception as e:
+        # Don't keep serving a version the store never accepted
+        MEMORY_CACHE.invalidate(str(user_id))
+        print(f"Error saving memory for user {user_id}: {e}")
+
+
+def append_user_memory(
+    user_id: str,
+    memory: Dict[str, Any],
+    added: List[Dict[str, Any]],
+    *,
+    removed: Optional[List[Dict[str, Any]]] = None,
+    char_delta: int = 0,
+    summary: Optional[str] = None,
+):
+    """Incremental save: send only the delta instead of the whole document.
+
+    On Firestore new messages go out as an atomic ArrayUnion and char_count
+    as an Increment, so write size is constant per turn and concurrent
+    writers can't overwrite each other; on SQLite the delta is one
+    transaction. A compaction removes only the summarized messages, leaving
+    anything appended meanwhile intact. `memory` is the caller's resulting
+    in-process view and is cached.
+    """
+    if not MEMORY_STORE.available():
+        return
+    try:
+        updated_at = _now_iso()
+        MEMORY_STORE.append(
+            str(user_id),
+            memory,
+            added,
+            removed=removed,
+            char_delta=char_delta,
+            summary=summary,
+            updated_at=updated_at,
+        )
+        memory["updatedAt"] = updated_at
+        MEMORY_CACHE.put(str(user_id), _copy_memory(memory))
+    except Exception as e:
+        MEMORY_CACHE.invalidate(str(user_id))
         print(f"Error saving memory for user {user_id}: {e}")
 
 
 # ------------------------------ Gemini helpers ------------------------------
 
-def query_gemini_raw(user_input: str) -> str:
-    # Intentionally avoid printing user inputs to terminal
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-flash-latest:generateContent"
-    headers = {
-        "Content-Type": "application/json",
-        "X-goog-api-key": GEMINI_API_KEY,
-    }
-    data = {
-        "contents": [
-            {
-                "role": "user",
-                "parts": [
-                    {"text": f"{SYSTEM_PROMPT}\n\nUser: {user_input}"}
-                ],
-            }
-        ]
-    }
-    response = requests.post(url, headers=headers, data=json.dumps(data))
-    # Avoid logging response details in terminal; only minimal codes if needed
-    # print("Gemini API response code:", response.status_code)
-    if response.status_code == 200:
-        try:
-            reply = response.json()["candidates"][0]["content"]["parts"][0]["text"].strip()
-            return reply
-        except Exception as e:
-            print("Gemini parsing error:", e)
-            return f"Gemini error: {e}"
-    else:
-        print(f"Gemini API Error: {response.status_code}")
-        return f"Gemini API Error: {response.status_code}"
+async def query_gemini_raw(
+    user_input: str, *, system_prompt: Optional[str] = SYSTEM_PROMPT, prefix: Optional[PromptPrefix] = None
+) -> str:
+    """Chat-facing wrapper around gemini_generate: failures come back as an error string."""
+    try:
+        return await gemini_generate(user_input, system_prompt=system_prompt, prefix=prefix)
+    except GeminiError as e:
+        # Avoid logging response details in terminal; only minimal codes
+        print(e)
+        return str(e)
 
 
-def query_gemini(user_input: str) -> str:
+async def query_gemini(user_input: str) -> str:
     # Backwards-compatible wrapper name
-    return query_gemini_raw(user_input)
+    return await query_gemini_raw(user_input)
 
 
-def summarize_messages_with_gemini(username: str, messages: List[Dict[str, Any]], existing_summary: str) -> str:
+async def stream_gemini_raw(
+    user_input: str,
+    *,
+    system_prompt: Optional[str] = SYSTEM_PROMPT,
+    prefix: Optional[PromptPrefix] = None,
+    priority: int = PRIORITY_CHAT,
+) -> AsyncIterator[str]:
+    """Like query_gemini_raw, but yield reply text pieces as Gemini produces them.
+
+    Failures before the first piece are retried per the scheduler's policy;
+    after that the partial reply is kept.
+    """
+    data = gemini_payload(user_input, system_prompt, prefix)
+    tokens = request_tokens(user_input, system_prompt, prefix)
+    scheduler = get_gemini_scheduler()
+    # Streams aren't hedged: a reply that has started going out can't be raced
+    registry = get_model_registry()
+    await registry.ensure_discovered()
+    model = registry.model_for(TASK_CHAT)
+    attempt = 0
+    while True:
+        started = False
+        usage: Optional[int] = None
+        # As in GeminiScheduler.run, a local-quota rejection isn't retried: waiting longer is what it refused
+        try:
+            await scheduler.acquire(priority, tokens, GEMINI_CHAT_MAX_WAIT if priority == PRIORITY_CHAT else None)
+        except GeminiError as e:
+            print(e)
+            yield str(e)
+            return
+        try:
+            async for chunk in get_gemini_client().stream_generate_content(data, model=model):
+                if chunk.get("usageMetadata"):
+                    usage = usage_tokens(chunk)
+                for text in response_texts(chunk):
+                    started = True
+                    yield text
+            scheduler.record_usage(tokens, usage)
+            return
+        except GeminiError as e:
+            if not started and stale_cache_handle(e, prefix):
+                async for piece in stream_gemini_raw(
+                    user_input, system_prompt=system_prompt, prefix=prefix._replace(handle=None), priority=priority
+                ):
+                    yield piece
+                return
+            if started or not e.retryable or attempt >= scheduler.max_retries:
+                print(e)
+                if not started:
+                    yield str(e)
+                return
+            delay = scheduler.backoff_delay(e, attempt)
+            attempt += 1
+            scheduler.retries += 1
+            print(f"{e} - retrying in {delay:.1f}s ({attempt}/{scheduler.max_retries})")
+            await asyncio.sleep(delay)
+
+
+async def summarize_messages_with_gemini(username: str, messages: List[Dict[str, Any]], existing_summary: str) -> str:
     """Use Gemini to compress older messages into a concise summary, appended to existing summary."""
     try:
         if not messages:
@@ -211,75 +338,334 @@ def summarize_messages_with_gemini(username: str, messages: List[Dict[str, Any]]
         summary_prompt = (
             "You are summarizing a chat history to persistent user memory. "
             "Extract stable facts about the user (preferences, profile, ongoing tasks), "
-            "and a brief recap of context needed for future replies. Write 5-10 bullet points, concise. "
+            "and a brief recap of context needed for future replies. Write 5-10 bullet points, concise, "
+            f"under {MEMORY_SUMMARY_MAX_CHAR} characters in total. "
             "Do not include ephemeral chit-chat unless it informs preferences.\n\n"
             f"EXISTING MEMORY SUMMARY (may be empty):\n{existing_summary}\n\n"
             f"CHAT HISTORY TO SUMMARIZE (oldest to newest):\n{chr(10).join(conv_text)}\n\n"
             "Return only the updated memory summary text."
         )
-        updated = query_gemini_raw(summary_prompt)
+        updated = await gemini_generate(
+            summary_prompt, system_prompt=None, priority=PRIORITY_BACKGROUND, task=TASK_SUMMARY
+        )
         if not updated:
             return existing_summary
         return updated.strip()
+    except GeminiError as e:
+        # Keep the old summary rather than storing an error string as memory
+        print(f"Summarization failed: {e}")
+        return existing_summary
     except Exception as e:
         print(f"Summarization failed: {e}")
         return existing_summary
 
 
-def append_and_maybe_summarize(user_id: str, username: str, user_msg: str, assistant_msg: str):
-    memory = load_user_memory(user_id)
+async def compress_summary(summary: str) -> str:
+    """Shrink an over-budget summary to ~60% of MEMORY_SUMMARY_MAX_CHAR (hard-clipped as a fallback).
+
+    Compressing well below the budget means it takes several more
+    summarizations before the summary needs compressing again.
+    """
+    target = MEMORY_SUMMARY_MAX_CHAR * 3 // 5
+    prompt = (
+        "Rewrite this persistent user memory summary more compactly. Keep stable facts and preferences, "
+        f"merge duplicates, drop stale details. Use bullet points, under {target} characters in total.\n\n"
+        f"SUMMARY:\n{summary}\n\n"
+        "Return only the rewritten summary text."
+    )
+    try:
+        compressed = (
+            await gemini_generate(prompt, system_prompt=None, priority=PRIORITY_BACKGROUND, task=TASK_SUMMARY)
+        ).strip()
+    except Exception as e:
+        print(f"Summary compression failed: {e}")
+        compressed = ""
+    if not compressed or len(compressed) >= len(summary):
+        compressed = summary
+    return clip_summary(compressed, MEMORY_SUMMARY_MAX_CHAR)
+
 
-    # Append new turn
-    turn = [
-        {"role": "user", "name": username, "content": user_msg, "ts": _now_iso()},
-        {"role": "assistant", "name": "Sazami", "content": assistant_msg, "ts": _now_iso()},
+def turn_messages(username: str, user_msg: str, assistant_msg: str) -> List[Dict[str, Any]]:
+    return [
+        {"role": "user", "name": username, "content": user_msg, "ts": _now_iso(), "tok": estimate_tokens(user_msg)},
+        {"role": "assistant", "name": "Sazami", "content": assistant_msg, "ts": _now_iso(), "tok": estimate_tokens(assistant_msg)},
     ]
-    messages: List[Dict[str, Any]] = memory.get("messages", [])
-    messages.extend(turn)
-    char_count = memory.get("char_count", 0) + len(user_msg) + len(assistant_msg)
 
+
+async def persist_turns(user_id: str, username: str, new_messages: List[Dict[str, Any]]):
+    """Append already-built messages to a user's memory, summarizing on overflow.
+
+    Summarization is amortized: it fires only when the history (not the
+    summary) passes MEMORY_MAX_CHAR / MEMORY_MAX_MESSAGES, compacts it well
+    below that, and is capped per user by SUMMARY_LIMITER. The summary has
+    its own budget and is compressed only when it outgrows it.
+    Firestore I/O runs in a worker thread so the event loop keeps serving replies.
+    """
+    memory = await asyncio.to_thread(load_user_memory, user_id)
+    prev_char_count = memory.get("char_count", 0)
+
+    # Append new turn(s)
+    messages: List[Dict[str, Any]] = memory.get("messages", [])
+    messages.extend(new_messages)
     memory["messages"] = messages
-    memory["char_count"] = char_count
 
-    # Check overflow
-    needs_summarize = char_count > MEMORY_MAX_CHAR or len(messages) > MEMORY_MAX_MESSAGES
-    if needs_summarize:
-        # Summarize all but the most recent KEEP_MESSAGES messages
-        older = messages[:-MEMORY_KEEP_MESSAGES] if len(messages) > MEMORY_KEEP_MESSAGES else messages
-        keep = messages[-MEMORY_KEEP_MESSAGES:] if len(messages) > MEMORY_KEEP_MESSAGES else []
-        summary = summarize_messages_with_gemini(username, older, memory.get("summary", ""))
-        memory["summary"] = summary
-        memory["messages"] = keep
-        memory["char_count"] = sum(len(m.get("content", "")) for m in keep) + len(summary)
+    # Check overflow (char_count covers the history only; the summary has its own budget)
+    older: List[Dict[str, Any]] = []
+    summary: Optional[str] = None
+    reason = overflow_reason(messages, MEMORY_MAX_CHAR, MEMORY_MAX_MESSAGES)
+    if reason:
+        # Keep limits are clamped below the thresholds so compaction always makes room
+        older, keep = split_history(
+            messages,
+            min(MEMORY_KEEP_MESSAGES, MEMORY_MAX_MESSAGES // 2),
+            min(MEMORY_KEEP_CHAR, MEMORY_MAX_CHAR // 2),
+        )
+    if older:
+        if SUMMARY_LIMITER.acquire(user_id):
+            started = time.perf_counter()
+            summary = await summarize_messages_with_gemini(username, older, memory.get("summary", ""))
+            METRICS.incr("summarizations", reason=reason)
+            METRICS.incr("summarized_messages", len(older))
+            if len(summary) > MEMORY_SUMMARY_MAX_CHAR:
+                summary = await compress_summary(summary)
+                METRICS.incr("summarizations", reason="summary_overflow")
+            METRICS.observe("summarize_seconds", time.perf_counter() - started)
+            METRICS.observe("summary_chars", len(summary))
+            memory["summary"] = summary
+            CONTEXT_CACHE.invalidate(user_id)  # cached prefix embeds the old summary
+        elif overflow_reason(messages, 2 * MEMORY_MAX_CHAR, 2 * MEMORY_MAX_MESSAGES):
+            # Over the cap and far past the limits: drop the oldest messages unsummarized
+            # (they stay recallable from the archive, if enabled)
+            METRICS.incr("summarizations_skipped", reason="trimmed")
+            METRICS.incr("trimmed_messages", len(older))
+        else:
+            METRICS.incr("summarizations_skipped", reason="rate_cap")
+            older = []
+        if older:
+            memory["messages"] = keep
+    memory["char_count"] = history_chars(memory["messages"])
+
+    started = time.perf_counter()
+    if MEMORY_STORAGE_MODE == "incremental":
+        # New messages that were summarized right away never need to be written
+        new_ids = {id(m) for m in new_messages}
+        added = [m for m in memory["messages"] if id(m) in new_ids]
+        removed = [m for m in older if id(m) not in new_ids]
+        await asyncio.to_thread(
+            append_user_memory,
+            user_id,
+            memory,
+            added,
+            removed=removed,
+            char_delta=memory["char_count"] - prev_char_count,
+            summary=summary,
+        )
+    else:
+        await asyncio.to_thread(save_user_memory, user_id, memory)
+    METRICS.observe("memory_write_seconds", time.perf_counter() - started, mode=MEMORY_STORAGE_MODE)
+
+    if MEMORY_ARCHIVE_ENABLED:
+        # Index the new turn(s) so they can be recalled after being summarized away
+        try:
+            await asyncio.to_thread(MESSAGE_ARCHIVE.add, user_id, new_messages)
+        except Exception as e:
+            print(f"Failed to archive messages: {e}")
+
 
-    save_user_memory(user_id, memory)
+async def append_and_maybe_summarize(user_id: str, username: str, user_msg: str, assistant_msg: str):
+    await persist_turns(user_id, username, turn_messages(username, user_msg, assistant_msg))
+
+
+# Background persistence: turns are queued here after the reply is sent and
+# coalesced per user, so summarization never delays anyone's next reply.
+MEMORY_WORKER = MemoryWorker(persist_turns, maxsize=MEMORY_QUEUE_MAXSIZE, workers=MEMORY_WORKERS)
 
 
 # ------------------------------ Prompt Build ------------------------------
 
-def build_prompt(sender_name: str, user_text: str, memory: Dict[str, Any]) -> str:
-    # Compose memory context
-    summary = memory.get("summary", "").strip()
+def _message_tokens(m: Dict[str, Any]) -> int:
+    # "tok" is stored with each message when it is appended; older docs lack it
+    tok = m.get("tok")
+    return tok if isinstance(tok, int) else estimate_tokens(m.get("content", ""))
+
+
+def _history_line(m: Dict[str, Any], sender_name: str) -> str:
+    role = m.get("role", "user")
+    name = m.get("name", sender_name if role == "user" else "Sazami")
+    return f"{name} ({role}): {m.get('content', '')}"
+
+
+def memory_prefix_text(sender_name: str, summary: str) -> str:
+    return f"Known memory about {sender_name}:\n{summary}\n\n" if summary else ""
+
+
+def assemble_prompt(
+    sender_name: str,
+    user_text: str,
+    memory: Dict[str, Any],
+    budget: int = PROMPT_TOKEN_BUDGET,
+    include_summary: bool = True,
+    recalled: Sequence[Dict[str, Any]] = (),
+) -> Tuple[str, Dict[str, int]]:
+    """Build the prompt within a token budget; return (prompt, stats).
+
+    The user's text always goes in. The summary may use up to half of the
+    remaining budget (truncated if longer). `recalled` archive messages
+    (best first) get up to RECALL_TOKEN_BUDGET of what is left, each cut
+    to RECALL_SNIPPET_CHARS. Recent history fills the rest newest-first,
+    stopping at the first message that no longer fits.
+    With include_summary=False the summary is left out (sent as a PromptPrefix).
+    """
+    summary = memory.get("summary", "").strip() if include_summary else ""
     messages: List[Dict[str, Any]] = memory.get("messages", [])
 
-    history_lines = []
-    for m in messages[-MEMORY_KEEP_MESSAGES:]:  # be safe even without overflow
-        role = m.get("role", "user")
-        name = m.get("name", sender_name if role == "user" else "Sazami")
-        content = m.get("content", "")
-        history_lines.append(f"{name} ({role}): {content}")
+    header = f"Note: You are replying to user named {sender_name}.\n"
+    footer = f"User says: {user_text}"
+    remaining = budget - estimate_tokens(header) - estimate_tokens(footer)
 
-    memory_block = ""
+    summary_tokens = 0
     if summary:
-        memory_block += f"Known memory about {sender_name}:\n{summary}\n\n"
+        summary_budget = max(0, remaining // 2)
+        if estimate_tokens(summary) > summary_budget:
+            summary = summary[: summary_budget * 4].rstrip()
+        summary_tokens = estimate_tokens(summary)
+        remaining -= estimate_tokens(memory_prefix_text(sender_name, summary))
+
+    recall_lines: List[str] = []
+    recall_tokens = 0
+    recall_budget = min(RECALL_TOKEN_BUDGET, max(0, remaining // 2))
+    for m in recalled:
+        content = m.get("content", "")
+        if len(content) > RECALL_SNIPPET_CHARS:
+            content = content[:RECALL_SNIPPET_CHARS].rstrip() + "…"
+        line = _history_line({**m, "content": content}, sender_name)
+        cost = estimate_tokens(line + "\n")
+        if recall_tokens + cost > recall_budget:
+            break
+        recall_lines.append(line)
+        recall_tokens += cost
+    if recall_lines:
+        remaining -= recall_tokens + estimate_tokens("Earlier messages that may be relevant:\n")
+
+    history_lines: List[str] = []
+    history_tokens = 0
+    for m in reversed(messages[-MEMORY_KEEP_MESSAGES:]):  # be safe even without overflow
+        role = m.get("role", "user")
+        name = m.get("name", sender_name if role == "user" else "Sazami")
+        cost = _message_tokens(m) + estimate_tokens(f"{name} ({role}): \n")
+        if cost > remaining:
+            break
+        history_lines.append(_history_line(m, sender_name))
+        history_tokens += cost
+        remaining -= cost
+    history_lines.reverse()
+
+    memory_block = memory_prefix_text(sender_name, summary)
+    if recall_lines:
+        memory_block += "Earlier messages that may be relevant:\n" + "\n".join(recall_lines) + "\n\n"
     if history_lines:
         memory_block += "Recent conversation history (for context):\n" + "\n".join(history_lines) + "\n\n"
 
-    user_input = (
-        f"Note: You are replying to user named {sender_name}.\n"
-        f"{memory_block}User says: {user_text}"
-    )
-    return user_input
+    user_input = f"{header}{memory_block}{footer}"
+    stats = {
+        "prompt_tokens": estimate_tokens(user_input),
+        "summary_tokens": summary_tokens,
+        "recall_tokens": recall_tokens,
+        "recalled_messages": len(recall_lines),
+        "history_tokens": history_tokens,
+        "history_messages": len(history_lines),
+        "dropped_messages": min(len(messages), MEMORY_KEEP_MESSAGES) - len(history_lines),
+    }
+    return user_input, stats
+
+
+def build_prompt(
+    sender_name: str, user_text: str, memory: Dict[str, Any], recalled: Sequence[Dict[str, Any]] = ()
+) -> str:
+    return assemble_prompt(sender_name, user_text, memory, recalled=recalled)[0]
+
+
+# ------------------------------ Streaming replies ------------------------------
+
+async def send_streamed_reply(
+    message,
+    user_input: str,
+    prefix: Optional[PromptPrefix] = None,
+    before_send: Optional[Callable[[], None]] = None,
+) -> str:
+    """Stream a Gemini reply into the channel and return the final text.
+
+    The message is posted as soon as the first text arrives, then edited at
+    most once per STREAM_EDIT_INTERVAL. Text beyond Discord's length limit
+    is sent as follow-up messages once the stream ends. `before_send` is
+    called just before the first post.
+    """
+    mention = f"{message.author.mention} "
+    stream = stream_gemini_raw(user_input, prefix=prefix)
+    text = ""
+
+    # Keep the typing indicator only until the first visible text
+    try:
+        async with message.channel.typing():
+            async for piece in stream:
+                text += piece
+                if text.strip():
+                    break
+    except asyncio.CancelledError:
+        await stream.aclose()  # release the HTTP stream of a superseded reply
+        raise
+
+    if before_send is not None:
+        before_send()
+    if not text.strip():
+        text = "Gemini error: empty response"
+        await message.channel.send(mention + text)
+        return text
+
+    sent = await message.channel.send((mention + text.lstrip())[:DISCORD_MESSAGE_LIMIT])
+    shown = text
+    last_edit = time.monotonic()
+    async for piece in stream:
+        text += piece
+        if time.monotonic() - last_edit >= STREAM_EDIT_INTERVAL and len(mention) + len(shown) < DISCORD_MESSAGE_LIMIT:
+            await sent.edit(content=(mention + text.lstrip())[:DISCORD_MESSAGE_LIMIT])
+            shown = text
+            last_edit = time.monotonic()
+
+    text = text.strip()
+    full = mention + text
+    if shown.strip() != text:
+        await sent.edit(content=full[:DISCORD_MESSAGE_LIMIT])
+    for start in range(DISCORD_MESSAGE_LIMIT, len(full), DISCORD_MESSAGE_LIMIT):
+        await message.channel.send(full[start:start + DISCORD_MESSAGE_LIMIT])
+    return text
+
+
+# ---- Daily wishes (resident schedule) ----
+
+
+async def run_scheduled_wish(time_of_day: str, run_date: Optional[str] = None, **kwargs):
+    await daily_wisher.run_daily_wish(bot, time_of_day, run_date=run_date, **kwargs)
+
+
+def wish_run_completed(run_date: str, time_of_day: str) -> bool:
+    return daily_wisher.run_completed(run_date, time_of_day)
+
+
+WISH_SCHEDULER = WishScheduler(run_scheduled_wish, wish_run_completed)
+
+
+@bot.command(name="wish")
+@commands.has_guild_permissions(manage_guild=True)
+async def wish_command(ctx, time_of_day: Optional[str] = None, mode: Optional[str] = None):
+    """Run a wish slot now: `!wish [TimeOfDay] [test]`."""
+    time_of_day = time_of_day or daily_wisher.get_time_of_day()
+    test = (mode or "").lower() == "test"
+    await ctx.send(f"Starting {time_of_day} wishes{' (test)' if test else ''}...")
+    if await WISH_SCHEDULER.trigger(time_of_day, test=test):
+        await ctx.send(f"{time_of_day} wishes done.")
+    else:
+        await ctx.send("A wish run is already in progress.")
 
 
 @bot.event
@@ -289,7 +675,6 @@ async def on_ready():
 
 @bot.event
 async def on_message(message):
-    sender_name = message.author.name
     # Avoid printing user message content in terminal
     print(f"Message from {message.author} received")
 
@@ -297,6 +682,12 @@ async def on_message(message):
         print("Ignoring bot message.")
         return
 
+    # Commands (e.g. !wish) go to the command framework, not to the chat model
+    ctx = await bot.get_context(message)
+    if ctx.valid:
+        await bot.invoke(ctx)
+        return
+
     if not DEBUG_MODE:
         if not message.guild or message.guild.id != GUILD_ID:
             print("Message not from the correct guild.")
@@ -313,27 +704,149 @@ async def on_message(message):
         # In debug mode, allow messages everywhere
         pass
 
-    # Initialize Firestore once (safe to call repeatedly)
-    if DB is None:
-        init_firestore()
+    if SHARD_ROUTER is not None:
+        # Each user is handled by one owning worker, which may be another process
+        await SHARD_ROUTER.route(message)
+    else:
+        await dispatch_message(message)
+
+
+async def dispatch_message(message):
+    """Hand an accepted message to the reply pipeline (on the worker that owns its user)."""
+    if BURST_WINDOW > 0:
+        BURST_COALESCER.submit(str(message.author.id), message)
+    else:
+        await reply_to_burst(Burst([message]))
+
+
+async def reply_to_burst(burst: Burst):
+    """Generate and send one reply to a burst of messages from one user.
+
+    May be cancelled (by BURST_COALESCER) until `burst.commit()`, right
+    before the reply is sent. Goes through ADMISSION first; if shed, the
+    last message gets ADMISSION_BUSY_REACTION instead of a reply.
+    """
+    METRICS.observe("burst_messages", len(burst.messages))
+    METRICS.observe("burst_wait_seconds", time.monotonic() - burst.started)
+
+    user_id = str(burst.last.author.id)
+    trace = RequestTrace("message")
+    trace.annotate(burst=len(burst.messages))
+    try:
+        with trace.span("admission"):
+            waited = await ADMISSION.acquire(user_id)
+    except Overloaded as e:
+        METRICS.incr("shed", reason=e.reason)
+        trace.finish("shed")
+        await react_busy(burst.last)
+        return
+    except asyncio.CancelledError:
+        trace.finish("superseded")
+        raise
+    METRICS.observe("admission_wait_seconds", waited)
+
+    try:
+        await reply_to_message(burst.last, burst.content, burst, trace)
+    except asyncio.CancelledError:
+        trace.finish("superseded")
+        raise
+    except Exception:
+        trace.finish("error")
+        raise
+    finally:
+        ADMISSION.release(user_id)
+    trace.finish()
+
+
+async def react_busy(message):
+    """Cheap answer for a shed message: a reaction, no Gemini call or memory write."""
+    print(f"Overloaded; not replying to {message.author}.")
+    try:
+        await message.add_reaction(ADMISSION_BUSY_REACTION)
+    except discord.HTTPException as e:
+        print(f"Failed to add busy reaction: {e}")
+
 
-    # Load user-specific memory (no-op if Firestore unavailable)
-    memory = load_user_memory(str(message.author.id))
+async def reply_to_message(message, user_text: str, burst: Burst, trace: RequestTrace):
+    sender_name = message.author.name
 
-    user_input = build_prompt(sender_name, message.content, memory)
+    # Connect the memory store once (safe to call repeatedly)
+    if not MEMORY_STORE.available():
+        with trace.span("init_store"):
+            MEMORY_STORE.init()
+
+    # Load user-specific memory (no-op if Firestore unavailable; usually a cache hit)
+    with trace.span("load_memory"):
+        memory = await asyncio.to_thread(load_user_memory, str(message.author.id))
+
+    # Optionally move system prompt + summary into a cached prefix referenced by handle
+    prefix: Optional[PromptPrefix] = None
+    if CONTEXT_CACHE_ENABLED:
+        summary = memory.get("summary", "").strip()
+        with trace.span("context_cache"):
+            prefix = await CONTEXT_CACHE.prefix_for(
+                str(message.author.id) if summary else "", SYSTEM_PROMPT, memory_prefix_text(sender_name, summary)
+            )
+
+    # Pull relevant old messages (beyond the recent history) from the local archive
+    recalled: List[Dict[str, Any]] = []
+    if MEMORY_ARCHIVE_ENABLED:
+        with trace.span("recall"):
+            try:
+                recalled = await asyncio.to_thread(
+                    MESSAGE_ARCHIVE.search,
+                    str(message.author.id),
+                    user_text,
+                    RECALL_TOP_K,
+                    memory.get("messages", [])[-MEMORY_KEEP_MESSAGES:],
+                )
+            except Exception as e:
+                print(f"Recall failed: {e}")
+
+    with trace.span("build_prompt"):
+        user_input, prompt_stats = assemble_prompt(
+            sender_name, user_text, memory, include_summary=prefix is None, recalled=recalled
+        )
+    print(
+        f"Prompt ~{prompt_stats['prompt_tokens']} tokens "
+        f"({prompt_stats['history_messages']} history msgs, {prompt_stats['dropped_messages']} dropped, "
+        f"{prompt_stats['recalled_messages']} recalled)"
+    )
+    METRICS.observe("prompt_tokens", prompt_stats["prompt_tokens"])
+    trace.annotate(prompt_tokens=prompt_stats["prompt_tokens"], cached_prefix=bool(prefix and prefix.handle))
 
-    async with message.channel.typing():
-        reply = query_gemini_raw(user_input)
+    if GEMINI_STREAMING:
+        # Generation and sending overlap when streaming, so they're one stage
+        with trace.span("gemini_stream"):
+            reply = await send_streamed_reply(message, user_input, prefix, before_send=burst.commit)
+    else:
+        with trace.span("gemini"):
+            async with message.channel.typing():
+                reply = await query_gemini_raw(user_input, prefix=prefix)
 
-    await message.channel.send(f"{message.author.mention} {reply}")
+        burst.commit()
+        with trace.span("send"):
+            await message.channel.send(f"{message.author.mention} {reply}")
+    METRICS.observe("reply_chars", len(reply))
+    trace.annotate(reply_chars=len(reply))
 
-    # Persist the interaction and maybe summarize (no-op if Firestore unavailable)
+    # Queue the interaction for background persistence/summarization (no-op if Firestore unavailable)
     try:
-        append_and_maybe_summarize(str(message.author.id), sender_name, message.content, reply)
+        with trace.span("enqueue_memory"):
+            await MEMORY_WORKER.submit(
+                str(message.author.id), sender_name, turn_messages(sender_name, user_text, reply)
+            )
     except Exception as e:
         print(f"Failed to persist memory: {e}")
 
-    await bot.process_commands(message)
+
+BURST_COALESCER = BurstCoalescer(reply_to_burst, window=BURST_WINDOW, max_wait=BURST_MAX_WAIT)
+SHARD_ROUTER: Optional[ShardRouter] = ShardRouter(dispatch_message, bot) if SHARDING_ENABLED else None
+
+
+def runs_wish_schedule() -> bool:
+    """Only the worker whose gateway shards include the home guild runs the daily wishes."""
+    return not SHARDING_ENABLED or guild_shard(GUILD_ID) in worker_shards(SHARD_WORKER_INDEX)
 
 
 @bot.event
@@ -343,6 +856,58 @@ async def on_guild_join(guild):
         await guild.leave()
 
 
+async def run_bot(token: str):
+    # SIGTERM (supervisor restarts, docker/systemd stops) shuts down like Ctrl+C,
+    # through the finally below, so queued memory writes are drained
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:  # Windows
+        pass
+    if CONTEXT_CACHE_ENABLED:
+        longest = len(SYSTEM_PROMPT) + len(memory_prefix_text("x" * 32, "x" * MEMORY_SUMMARY_MAX_CHAR))
+        if longest // 4 < CONTEXT_CACHE.min_tokens:
+            print(
+                f"Context cache: the longest prefix (~{longest // 4} tokens) is under CONTEXT_CACHE_MIN_TOKENS "
+                f"({CONTEXT_CACHE.min_tokens}); nothing will be cached. Lengthen the system prompt or the summary cap."
+            )
+    MEMORY_WORKER.start()
+    METRICS.register_gauges("memory_cache", MEMORY_CACHE.stats)
+    METRICS.register_gauges("memory_worker", MEMORY_WORKER.stats)
+    METRICS.register_gauges("gemini_scheduler", get_gemini_scheduler().stats)
+    METRICS.register_gauges("context_cache", CONTEXT_CACHE.stats)
+    METRICS.register_gauges("message_archive", MESSAGE_ARCHIVE.stats)
+    METRICS.register_gauges("summary_limiter", SUMMARY_LIMITER.stats)
+    METRICS.register_gauges("burst", BURST_COALESCER.stats)
+    METRICS.register_gauges("admission", ADMISSION.stats)
+    METRICS.register_gauges("model_registry", get_model_registry().stats)
+    METRICS.register_gauges("hedge", get_hedger().stats)
+    if SHARD_ROUTER is not None:
+        METRICS.register_gauges("shard_router", SHARD_ROUTER.stats)
+        await SHARD_ROUTER.serve()
+        # One metrics port per worker
+        await METRICS.start(port=METRICS_PORT + SHARD_WORKER_INDEX if METRICS_PORT else 0)
+    else:
+        await METRICS.start()
+    try:
+        async with bot:
+            if WISH_SCHEDULER_ENABLED and runs_wish_schedule():
+                WISH_SCHEDULER.start(bot.wait_until_ready)
+            await bot.start(token)
+    finally:
+        await WISH_SCHEDULER.stop()
+        await METRICS.stop()
+        if SHARD_ROUTER is not None:
+            await SHARD_ROUTER.stop()
+        await BURST_COALESCER.stop()
+        # Flush queued memory writes before releasing pooled Gemini connections
+        await MEMORY_WORKER.stop(MEMORY_DRAIN_TIMEOUT)
+        await close_gemini_client()
+
+
 # Run the bot
 if __name__ == "__main__":
-    bot.run(os.getenv("BOT_TOKEN"))
\ No newline at end of file
+    discord.utils.setup_logging()
+    try:
+        asyncio.run(run_bot(os.getenv("BOT_TOKEN")))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
\ No newline at end of file
@@ -0,0 +1,153 @@
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Archive every chat message in a local full-text index and recall relevant old ones per prompt
+MEMORY_ARCHIVE_ENABLED = os.getenv("MEMORY_ARCHIVE_ENABLED", "false").strip().lower() in ("1", "true", "yes", "on")
+MEMORY_ARCHIVE_PATH = os.getenv("MEMORY_ARCHIVE_PATH", "sazami_archive.sqlite3")
+# Old messages recalled into each prompt, and the token budget they may use
+RECALL_TOP_K = int(os.getenv("RECALL_TOP_K", "4"))
+RECALL_TOKEN_BUDGET = int(os.getenv("RECALL_TOKEN_BUDGET", "400"))
+# Longest recalled message (chars); longer ones are cut
+RECALL_SNIPPET_CHARS = int(os.getenv("RECALL_SNIPPET_CHARS", "300"))
+
+# Most distinct query terms taken from the user's text
+MAX_QUERY_TERMS = 24
+
+ARCHIVE_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS archive USING fts5 (
+    user_id,
+    content,
+    role UNINDEXED,
+    name UNINDEXED,
+    ts UNINDEXED,
+    tokenize = 'porter unicode61 remove_diacritics 2'
+);
+"""
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def query_terms(text: str, limit: int = MAX_QUERY_TERMS) -> List[str]:
+    """Distinct words of `text` (2+ chars), in order, as quoted FTS5 strings."""
+    seen: List[str] = []
+    for word in _WORD.findall(text.lower()):
+        if len(word) > 1 and word not in seen:
+            seen.append(word)
+            if len(seen) >= limit:
+                break
+    return ['"' + w.replace('"', '""') + '"' for w in seen]
+
+
+class MessageArchive:
+    """Per-user archive of past chat messages with a local BM25 index.
+
+    Backed by an SQLite FTS5 table, so indexing is incremental (each
+    persisted turn is a small insert) and ranking is SQLite's bm25(). Words
+    are stemmed (porter), so "cats" finds "cat". If this SQLite build lacks
+    FTS5 the archive stays disabled and recall returns nothing.
+    """
+
+    def __init__(self, path: str = MEMORY_ARCHIVE_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._failed = False
+        self.indexed = 0
+        self.queries = 0
+        self.recalled = 0
+
+    def init(self) -> bool:
+        with self._lock:
+            if self._conn is None and not self._failed:
+                try:
+                    conn = sqlite3.connect(self.path, check_same_thread=False)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("PRAGMA synchronous=NORMAL")
+                    conn.executescript(ARCHIVE_SCHEMA)
+                    self._conn = conn
+                except sqlite3.Error as e:
+                    # e.g. "no such module: fts5"
+                    print(f"Message archive unavailable ({self.path}): {e}. Continuing without recall.")
+                    self._failed = True
+            return self._conn is not None
+
+    def add(self, user_id: str, messages: Iterable[Dict[str, Any]]):
+        """Index new messages for a user (called as turns are persisted)."""
+        rows = [
+            (str(user_id), m.get("content", ""), m.get("role", "user"), m.get("name"), m.get("ts"))
+            for m in messages
+            if m.get("content")
+        ]
+        if not rows or not self.init():
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT INTO archive (user_id, content, role, name, ts) VALUES (?, ?, ?, ?, ?)", rows)
+            self.indexed += len(rows)
+
+    def search(
+        self, user_id: str, text: str, k: int = RECALL_TOP_K, exclude: Iterable[Dict[str, Any]] = ()
+    ) -> List[Dict[str, Any]]:
+        """Top-k archived messages of `user_id` relevant to `text`, best first.
+
+        Messages in `exclude` (the recent history already in the prompt) and
+        repeated contents are skipped.
+        """
+        terms = query_terms(text)
+        if k <= 0 or not terms or not self.init():
+            return []
+        skip = {(m.get("role"), m.get("content")) for m in exclude}
+        match = f'user_id : "{str(user_id).replace(chr(34), "")}" AND content : ({" OR ".join(terms)})'
+        with self._lock:
+            self.queries += 1
+            rows = self._conn.execute(
+                "SELECT role, name, content, ts FROM archive WHERE archive MATCH ? "
+                "ORDER BY bm25(archive, 0.0, 1.0) LIMIT ?",
+                (match, k + len(skip)),
+            ).fetchall()
+        results: List[Dict[str, Any]] = []
+        for role, name, content, ts in rows:
+            if (role, content) in skip:
+                continue
+            skip.add((role, content))
+            m: Dict[str, Any] = {"role": role, "content": content}
+            if name is not None:
+                m["name"] = name
+            if ts is not None:
+                m["ts"] = ts
+            results.append(m)
+            if len(results) >= k:
+                break
+        self.recalled += len(results)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self._conn is not None,
+            "indexed": self.indexed,
+            "queries": self.queries,
+            "recalled": self.recalled,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_archive: Optional[MessageArchive] = None
+
+
+def get_message_archive() -> MessageArchive:
+    """Return the process-wide archive at MEMORY_ARCHIVE_PATH (created on first use)."""
+    global _archive
+    if _archive is None:
+        _archive = MessageArchive()
+    return _archive
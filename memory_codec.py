@@ -0,0 +1,215 @@
+"""Compact, versioned encoding of memory documents for Firestore.
+
+The original layout stores every message as
+`{role, name, content, ts, tok}` with ISO timestamps. The compact layout
+(`v: 1`) stores the username once per document and each message as:
+
+    {r: 0 (user) | 1 (assistant), t: epoch milliseconds, c: str | zlib bytes, k: tok, n?: name}
+
+`n` appears only when a message's name differs from the default (the
+document's `user` for user messages, "Sazami" for assistant ones). Content
+of at least MEMORY_COMPRESS_MIN_CHARS characters is stored zlib-compressed
+when that is smaller. Messages keep any other fields under their own keys.
+
+Decoding handles both layouts, message by message, and is lazy by default:
+a loaded message stays in its stored form until something reads it. Lazy
+messages are not plain dicts to C code (json.dumps sees them empty), so
+anything that serializes memory decodes with `lazy=False`.
+"""
+import os
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "compact" (default) or "legacy" for the original layout; both are always readable
+MEMORY_ENCODING = os.getenv("MEMORY_ENCODING", "compact").strip().lower()
+# zlib-compress message content of at least this many characters (0 = never)
+MEMORY_COMPRESS_MIN_CHARS = int(os.getenv("MEMORY_COMPRESS_MIN_CHARS", "512"))
+
+FORMAT_VERSION = 1
+ROLES = ("user", "assistant")
+ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+ASSISTANT_NAME = "Sazami"
+COMPACT_KEYS = ("r", "t", "c", "k", "n")
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def is_compact(memory: Dict[str, Any]) -> bool:
+    return memory.get("v") == FORMAT_VERSION and "user" in memory
+
+
+def _epoch(ts: Any) -> Any:
+    # Milliseconds, so equal messages sent in the same second stay distinct array values
+    if not isinstance(ts, str):
+        return ts
+    try:
+        dt = datetime.fromisoformat(ts)
+    except ValueError:
+        return ts  # kept as-is; decodes back to the same string
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - EPOCH) // timedelta(milliseconds=1)
+
+
+def _iso(t: Any) -> Any:
+    if isinstance(t, int):
+        return (EPOCH + timedelta(milliseconds=t)).isoformat()
+    return t
+
+
+def _default_name(role: str, user: str) -> str:
+    return user if role == "user" else ASSISTANT_NAME
+
+
+def decode_fields(raw: Dict[str, Any], user: str) -> Dict[str, Any]:
+    """The original-layout fields of one compact message."""
+    code = raw.get("r", 0)
+    role = ROLES[code] if isinstance(code, int) and 0 <= code < len(ROLES) else str(code)
+    content = raw.get("c", "")
+    if isinstance(content, bytes):
+        content = zlib.decompress(content).decode("utf-8")
+    m: Dict[str, Any] = {"role": role, "name": raw.get("n", _default_name(role, user)), "content": content}
+    if "t" in raw:
+        m["ts"] = _iso(raw["t"])
+    if "k" in raw:
+        m["tok"] = raw["k"]
+    m.update((k, v) for k, v in raw.items() if k not in COMPACT_KEYS)
+    return m
+
+
+def _decoded(method_name: str):
+    method = getattr(dict, method_name)
+
+    def wrapper(self, *args, **kwargs):
+        self._decode()
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = method_name
+    return wrapper
+
+
+def _modified(method_name: str):
+    method = getattr(dict, method_name)
+
+    def wrapper(self, *args, **kwargs):
+        self._decode()
+        self.raw = None  # no longer what is stored
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = method_name
+    return wrapper
+
+
+class LazyMessage(dict):
+    """A compact message that decodes itself on first access.
+
+    Until then it holds only the stored element, so loading a long history
+    allocates one empty dict per message and decompresses nothing. `raw` is
+    that stored element; it is written back verbatim when the message is
+    removed again, since ArrayRemove only matches identical values.
+    """
+
+    __slots__ = ("raw", "user", "_pending")
+
+    def __init__(self, raw: Dict[str, Any], user: str):
+        super().__init__()
+        self.raw = raw
+        self.user = user
+        self._pending = True
+
+    def _decode(self):
+        if getattr(self, "_pending", False):
+            dict.update(self, decode_fields(self.raw, self.user))
+            self._pending = False
+
+    def __reduce__(self):
+        return dict, (dict(self.items()),)
+
+    def __eq__(self, other):
+        self._decode()
+        if isinstance(other, LazyMessage):
+            other._decode()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+
+for _name in (
+    "__getitem__", "__contains__", "__iter__", "__len__", "__repr__",
+    "__or__", "__reversed__", "get", "keys", "items", "values", "copy",
+):
+    setattr(LazyMessage, _name, _decoded(_name))
+for _name in ("__setitem__", "__delitem__", "__ior__", "pop", "popitem", "setdefault", "update", "clear"):
+    setattr(LazyMessage, _name, _modified(_name))
+
+
+def encode_message(m: Dict[str, Any], user: str, compress_min: int = MEMORY_COMPRESS_MIN_CHARS) -> Dict[str, Any]:
+    """Compact form of one message; deterministic, so ArrayRemove can match it later."""
+    if isinstance(m, LazyMessage) and m.raw is not None and m.user == user:
+        return m.raw
+    role = m.get("role", "user")
+    raw: Dict[str, Any] = {"r": ROLE_CODES.get(role, role)}
+    if "ts" in m:
+        raw["t"] = _epoch(m["ts"])
+    content = m.get("content", "")
+    if compress_min > 0 and len(content) >= compress_min:
+        data = content.encode("utf-8")
+        blob = zlib.compress(data, 6)
+        if len(blob) < len(data):
+            content = blob
+    raw["c"] = content
+    if "tok" in m:
+        raw["k"] = m["tok"]
+    name = m.get("name")
+    if name is not None and name != _default_name(role, user):
+        raw["n"] = name
+    raw.update((k, v) for k, v in m.items() if k not in ("role", "name", "content", "ts", "tok"))
+    return raw
+
+
+def decode_message(raw: Dict[str, Any], user: str, lazy: bool = True) -> Dict[str, Any]:
+    # Original-layout messages (they have "role") are returned unchanged
+    if "role" in raw:
+        return raw
+    return LazyMessage(raw, user) if lazy else decode_fields(raw, user)
+
+
+def document_user(memory: Dict[str, Any]) -> str:
+    """The username stored once per document: the latest user message's name."""
+    for m in reversed(memory.get("messages", [])):
+        if m.get("role", "user") == "user" and m.get("name"):
+            return m["name"]
+    return memory.get("user", "")
+
+
+def encode_memory(memory: Dict[str, Any], compress_min: int = MEMORY_COMPRESS_MIN_CHARS) -> Dict[str, Any]:
+    """Compact document for a decoded memory dict."""
+    user = document_user(memory)
+    doc = {k: v for k, v in memory.items() if k != "messages"}
+    doc["v"] = FORMAT_VERSION
+    doc["user"] = user
+    doc["messages"] = [encode_message(m, user, compress_min) for m in memory.get("messages", [])]
+    return doc
+
+
+def decode_memory(doc: Dict[str, Any], lazy: bool = True) -> Dict[str, Any]:
+    """Memory dict for a stored document in either layout.
+
+    `lazy=False` returns plain dicts in the original layout, safe to
+    serialize (export, migration to another backend).
+    """
+    user = doc.get("user", "")
+    messages: List[Dict[str, Any]] = doc.get("messages") or []
+    doc["messages"] = [decode_message(m, user, lazy) for m in messages]
+    if not lazy:
+        doc.pop("v", None)
+        doc.pop("user", None)
+    return doc
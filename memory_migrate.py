@@ -0,0 +1,94 @@
+"""Copy user memory between backends, or export/import it as JSON lines.
+
+Each endpoint is `firestore`, `sqlite` / `sqlite:PATH` (default
+MEMORY_SQLITE_PATH) or a `.jsonl` file path:
+
+    python memory_migrate.py firestore sqlite              # move to local storage
+    python memory_migrate.py sqlite:/data/mem.sqlite3 firestore
+    python memory_migrate.py firestore backup.jsonl        # export
+    python memory_migrate.py backup.jsonl sqlite           # import
+
+Documents are copied whole, so rerunning a migration is safe.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, Iterator, Tuple
+
+from memory_store import MEMORY_SQLITE_PATH, MemoryStore, make_store
+
+
+def open_store(spec: str) -> MemoryStore:
+    if spec == "firestore":
+        return make_store("firestore")
+    if spec == "sqlite" or spec.startswith("sqlite:"):
+        return make_store("sqlite", path=spec.partition(":")[2] or MEMORY_SQLITE_PATH)
+    raise ValueError(f"Unknown endpoint {spec!r}")
+
+
+def read_jsonl(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield str(record["user_id"]), record["memory"]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Migrate or export user memory")
+    parser.add_argument("source", help="firestore | sqlite[:PATH] | FILE.jsonl")
+    parser.add_argument("dest", help="firestore | sqlite[:PATH] | FILE.jsonl")
+    parser.add_argument("--dry-run", action="store_true", help="Read the source and count, but write nothing")
+    args = parser.parse_args(argv)
+
+    if args.source.endswith(".jsonl"):
+        source_store = None
+        users = read_jsonl(args.source)
+    else:
+        source_store = open_store(args.source)
+        source_store.init()
+        if not source_store.available():
+            print(f"Source {args.source} is not available.")
+            return 1
+        users = source_store.iter_users()
+
+    out = None
+    dest_store = None
+    if not args.dry_run:
+        if args.dest.endswith(".jsonl"):
+            out = open(args.dest, "w", encoding="utf-8")
+        else:
+            dest_store = open_store(args.dest)
+            dest_store.init()
+            if not dest_store.available():
+                print(f"Destination {args.dest} is not available.")
+                return 1
+
+    copied = messages = 0
+    try:
+        for user_id, memory in users:
+            memory.setdefault("summary", "")
+            memory.setdefault("messages", [])
+            memory.setdefault("char_count", 0)
+            if out is not None:
+                out.write(json.dumps({"user_id": user_id, "memory": memory}, ensure_ascii=False) + "\n")
+            elif dest_store is not None:
+                dest_store.save(user_id, memory)
+            copied += 1
+            messages += len(memory["messages"])
+            if copied % 500 == 0:
+                print(f"{copied} users copied...")
+    finally:
+        if out is not None:
+            out.close()
+        for store in (source_store, dest_store):
+            if store is not None:
+                store.close()
+
+    action = "Would copy" if args.dry_run else "Copied"
+    print(f"{action} {copied} users ({messages} messages) from {args.source} to {args.dest}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,383 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+import core
+from memory_codec import (
+    MEMORY_ENCODING,
+    decode_memory,
+    encode_memory,
+    encode_message,
+    is_compact,
+)
+
+load_dotenv()
+
+# "firestore" (managed, default) or "sqlite" (local file, no network round trips)
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "firestore").strip().lower()
+MEMORY_SQLITE_PATH = os.getenv("MEMORY_SQLITE_PATH", "sazami_memory.sqlite3")
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class MemoryStore:
+    """Persistent per-user memory documents.
+
+    A document is `{summary, messages, char_count, createdAt, updatedAt}`
+    (see main.load_user_memory). `load` returns None for unknown users and
+    raises on storage errors; callers handle caching and error reporting.
+    `save`/`append` may record storage bookkeeping fields in `memory`
+    (Firestore's encoding version), so cache it after writing.
+    """
+
+    name = "none"
+
+    def init(self):
+        """Connect if needed (safe to call repeatedly)."""
+
+    def available(self) -> bool:
+        return False
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return None
+
+    def save(self, user_id: str, memory: Dict[str, Any]):
+        """Write the whole document."""
+
+    def append(
+        self,
+        user_id: str,
+        memory: Dict[str, Any],
+        added: List[Dict[str, Any]],
+        *,
+        removed: Optional[List[Dict[str, Any]]] = None,
+        char_delta: int = 0,
+        summary: Optional[str] = None,
+        updated_at: str = "",
+    ):
+        """Write only a delta: new messages, removed (summarized) ones, char_count change."""
+
+    def summaries(self, user_ids: Sequence[str]) -> Dict[str, str]:
+        """Non-empty summaries for many users in one round trip."""
+        return {}
+
+    def iter_users(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Every stored (user_id, document) as plain, serializable dicts, for export/migration."""
+        return iter(())
+
+    def close(self):
+        pass
+
+
+class FirestoreStore(MemoryStore):
+    """One document per user in `{FIRESTORE_COLLECTION}`.
+
+    Written in the compact layout of memory_codec.py unless
+    MEMORY_ENCODING=legacy; documents in either layout are read
+    transparently. A document in the other layout is rewritten whole on its
+    next write, since ArrayRemove only matches elements stored in the
+    layout it is given.
+    """
+
+    name = "firestore"
+
+    def __init__(self, encoding: str = MEMORY_ENCODING):
+        self.compact = encoding != "legacy"
+
+    def init(self):
+        if core.DB is None:
+            core.init_firestore()
+
+    def available(self) -> bool:
+        return core.DB is not None
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        ref = core.user_doc_ref(user_id)
+        if ref is None:
+            return None
+        snap = ref.get()
+        return decode_memory(snap.to_dict() or {}) if snap.exists else None
+
+    def save(self, user_id: str, memory: Dict[str, Any]):
+        ref = core.user_doc_ref(user_id)
+        if ref is None:
+            return
+        if self.compact:
+            doc = encode_memory(memory)
+            memory["v"], memory["user"] = doc["v"], doc["user"]
+        else:
+            # v=0: an old-layout document (compact writers rewrite it whole)
+            memory["v"] = 0
+            memory["messages"] = [dict(m.items()) for m in memory.get("messages", [])]
+            doc = memory
+        ref.set(doc, merge=True)
+
+    def append(self, user_id, memory, added, *, removed=None, char_delta=0, summary=None, updated_at=""):
+        # New messages go out as an atomic ArrayUnion and char_count as an Increment
+        ref = core.user_doc_ref(user_id)
+        if ref is None:
+            return
+        if self.compact != is_compact(memory):
+            # New document, or one in the other layout: write it whole, in ours
+            memory["updatedAt"] = updated_at or _now_iso()
+            memory.setdefault("createdAt", memory["updatedAt"])
+            self.save(user_id, memory)
+            return
+        if self.compact:
+            user = memory["user"]
+            added = [encode_message(m, user) for m in added]
+            removed = [encode_message(m, user) for m in removed or []]
+        ops = core.firestore_module()
+        payload: Dict[str, Any] = {"char_count": ops.Increment(char_delta), "updatedAt": updated_at or _now_iso()}
+        if "updatedAt" not in memory:
+            payload["createdAt"] = memory.get("createdAt") or payload["updatedAt"]
+        if summary is not None:
+            payload["summary"] = summary
+        if added:
+            payload["messages"] = ops.ArrayUnion(added)
+        if not self.compact and memory.get("v") != 0:
+            payload["v"] = memory["v"] = 0
+        ref.set(payload, merge=True)
+        if removed:
+            # A field takes one transform per write, so compaction is a second write
+            ref.set({"messages": ops.ArrayRemove(removed)}, merge=True)
+
+    def summaries(self, user_ids: Sequence[str]) -> Dict[str, str]:
+        col = core.sazami_collection()
+        if col is None or not user_ids:
+            return {}
+        result: Dict[str, str] = {}
+        # Fetch only the summary field, not the whole history
+        refs = [col.document(str(uid)) for uid in user_ids]
+        for snap in core.DB.get_all(refs, field_paths=["summary"]):
+            if snap.exists:
+                summary = ((snap.to_dict() or {}).get("summary") or "").strip()
+                if summary:
+                    result[str(snap.id)] = summary
+        return result
+
+    def iter_users(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        col = core.sazami_collection()
+        if col is None:
+            return
+        for snap in col.stream():
+            yield str(snap.id), decode_memory(snap.to_dict() or {}, lazy=False)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id     TEXT PRIMARY KEY,
+    summary     TEXT    NOT NULL DEFAULT '',
+    char_count  INTEGER NOT NULL DEFAULT 0,
+    created_at  TEXT,
+    updated_at  TEXT
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id     TEXT NOT NULL,
+    role        TEXT NOT NULL,
+    name        TEXT,
+    content     TEXT NOT NULL,
+    ts          TEXT,
+    tok         INTEGER,
+    extra       TEXT            -- JSON of any other message fields
+);
+CREATE INDEX IF NOT EXISTS messages_user ON messages (user_id, id);
+"""
+
+_MESSAGE_FIELDS = ("role", "name", "content", "ts", "tok")
+
+
+class SQLiteStore(MemoryStore):
+    """Local single-node backend: a WAL-mode SQLite file.
+
+    Each message is its own row, indexed by (user_id, id), so an append is
+    one small transactional insert and compaction deletes just the
+    summarized rows. Safe to use from `asyncio.to_thread` workers.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = MEMORY_SQLITE_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def init(self):
+        with self._lock:
+            if self._conn is None:
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.executescript(SQLITE_SCHEMA)
+                self._conn = conn
+
+    def available(self) -> bool:
+        if self._conn is None:
+            try:
+                self.init()
+            except sqlite3.Error as e:
+                print(f"Failed to open memory database {self.path}: {e}. Continuing without memory.")
+                return False
+        return True
+
+    @staticmethod
+    def _message_row(user_id: str, m: Dict[str, Any]) -> Tuple[Any, ...]:
+        extra = {k: v for k, v in m.items() if k not in _MESSAGE_FIELDS}
+        return (
+            user_id,
+            m.get("role", ""),
+            m.get("name"),
+            m.get("content", ""),
+            m.get("ts"),
+            m.get("tok"),
+            json.dumps(extra) if extra else None,
+        )
+
+    @staticmethod
+    def _message_dict(row: Tuple[Any, ...]) -> Dict[str, Any]:
+        role, name, content, ts, tok, extra = row
+        m: Dict[str, Any] = {"role": role}
+        if name is not None:
+            m["name"] = name
+        m["content"] = content
+        if ts is not None:
+            m["ts"] = ts
+        if tok is not None:
+            m["tok"] = tok
+        if extra:
+            m.update(json.loads(extra))
+        return m
+
+    def _load_locked(self, user_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            "SELECT summary, char_count, created_at, updated_at FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        summary, char_count, created_at, updated_at = row
+        messages = [
+            self._message_dict(r)
+            for r in self._conn.execute(
+                "SELECT role, name, content, ts, tok, extra FROM messages WHERE user_id = ? ORDER BY id", (user_id,)
+            )
+        ]
+        memory: Dict[str, Any] = {"summary": summary, "messages": messages, "char_count": char_count}
+        if created_at:
+            memory["createdAt"] = created_at
+        if updated_at:
+            memory["updatedAt"] = updated_at
+        return memory
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        self.init()
+        with self._lock:
+            return self._load_locked(str(user_id))
+
+    def save(self, user_id: str, memory: Dict[str, Any]):
+        self.init()
+        user_id = str(user_id)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO users (user_id, summary, char_count, created_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET summary = excluded.summary, char_count = excluded.char_count, "
+                "created_at = COALESCE(users.created_at, excluded.created_at), updated_at = excluded.updated_at",
+                (
+                    user_id,
+                    memory.get("summary", ""),
+                    int(memory.get("char_count", 0)),
+                    memory.get("createdAt"),
+                    memory.get("updatedAt") or _now_iso(),
+                ),
+            )
+            self._conn.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
+            self._conn.executemany(
+                "INSERT INTO messages (user_id, role, name, content, ts, tok, extra) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [self._message_row(user_id, m) for m in memory.get("messages", [])],
+            )
+
+    def append(self, user_id, memory, added, *, removed=None, char_delta=0, summary=None, updated_at=""):
+        self.init()
+        user_id = str(user_id)
+        now = updated_at or _now_iso()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO users (user_id, summary, char_count, created_at, updated_at) VALUES (?, '', 0, ?, ?) "
+                "ON CONFLICT(user_id) DO NOTHING",
+                (user_id, memory.get("createdAt") or now, now),
+            )
+            self._conn.execute(
+                "UPDATE users SET char_count = char_count + ?, updated_at = ?, summary = COALESCE(?, summary) "
+                "WHERE user_id = ?",
+                (char_delta, now, summary, user_id),
+            )
+            if added:
+                self._conn.executemany(
+                    "INSERT INTO messages (user_id, role, name, content, ts, tok, extra) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [self._message_row(user_id, m) for m in added],
+                )
+            for m in removed or []:
+                # Oldest matching row; anything appended meanwhile is left alone
+                self._conn.execute(
+                    "DELETE FROM messages WHERE id = (SELECT id FROM messages WHERE user_id = ? AND role = ? "
+                    "AND content = ? AND ts IS ? ORDER BY id LIMIT 1)",
+                    (user_id, m.get("role", ""), m.get("content", ""), m.get("ts")),
+                )
+
+    def summaries(self, user_ids: Sequence[str]) -> Dict[str, str]:
+        self.init()
+        ids = [str(uid) for uid in user_ids]
+        result: Dict[str, str] = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT user_id, summary FROM users WHERE user_id IN ({','.join('?' * len(chunk))}) "
+                    "AND summary != ''",
+                    chunk,
+                )
+                result.update({uid: summary.strip() for uid, summary in rows if summary.strip()})
+        return result
+
+    def iter_users(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        self.init()
+        with self._lock:
+            user_ids = [r[0] for r in self._conn.execute("SELECT user_id FROM users ORDER BY user_id")]
+        for user_id in user_ids:
+            with self._lock:
+                memory = self._load_locked(user_id)
+            if memory is not None:
+                yield user_id, memory
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def make_store(backend: str = MEMORY_BACKEND, **kwargs: Any) -> MemoryStore:
+    if backend == "sqlite":
+        return SQLiteStore(**kwargs)
+    if backend == "firestore":
+        return FirestoreStore()
+    raise ValueError(f"Unknown memory backend: {backend!r} (expected 'firestore' or 'sqlite')")
+
+
+_store: Optional[MemoryStore] = None
+
+
+def get_memory_store() -> MemoryStore:
+    """Return the process-wide store for MEMORY_BACKEND (created on first use)."""
+    global _store
+    if _store is None:
+        _store = make_store()
+    return _store
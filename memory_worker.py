@@ -0,0 +1,129 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+# handler(user_id, username, new_messages)
+PersistHandler = Callable[[str, str, List[Dict[str, Any]]], Awaitable[None]]
+
+
+@dataclass
+class _PendingJob:
+    username: str
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+
+
+class MemoryWorker:
+    """Bounded background queue for memory persistence.
+
+    Turns are queued per user. While a user's job is still waiting, further
+    turns for that user are merged into it, so a burst becomes a single
+    load/append/summarize/save cycle. A user is never processed by two
+    workers at once; turns that arrive mid-cycle are queued again afterwards.
+    That holds while stop() drains too: turns submitted then are still
+    queued and drained, not persisted inline beside a running job.
+    """
+
+    def __init__(self, handler: PersistHandler, *, maxsize: int = 1000, workers: int = 2):
+        self.handler = handler
+        self.maxsize = max(1, maxsize)
+        self.workers = max(1, workers)
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: Dict[str, _PendingJob] = {}
+        self._active: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._requeues: Set[asyncio.Task] = set()
+        self.processed = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [asyncio.create_task(self._run(), name=f"memory-worker-{i}") for i in range(self.workers)]
+
+    def depth(self) -> int:
+        """Number of users with turns waiting to be persisted."""
+        return len(self._pending)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "depth": self.depth(),
+            "active": len(self._active),
+            "processed": self.processed,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+        }
+
+    async def submit(self, user_id: str, username: str, messages: List[Dict[str, Any]]):
+        """Queue new messages for a user; waits only if the queue is full."""
+        if not self.running:
+            # Not started (or already stopped): persist inline rather than drop.
+            await self.handler(user_id, username, messages)
+            return
+
+        job = self._pending.get(user_id)
+        if job is not None:
+            job.username = username
+            job.messages.extend(messages)
+            self.coalesced += 1
+            return
+
+        self._pending[user_id] = _PendingJob(username, list(messages))
+        if user_id not in self._active:
+            await self._queue.put(user_id)
+
+    async def _run(self):
+        while True:
+            user_id = await self._queue.get()
+            job = self._pending.pop(user_id, None)
+            if job is None:
+                self._queue.task_done()
+                continue
+            self._active.add(user_id)
+            try:
+                await self.handler(user_id, job.username, job.messages)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Memory job failed for user {user_id}: {e}")
+            finally:
+                self._active.discard(user_id)
+                # Turns that arrived while this user was busy
+                if user_id in self._pending and self._queue.full():
+                    # Waiting here could block every worker on a full queue; the
+                    # re-queue finishes in the background and only then marks this
+                    # job done, so stop() still waits for it
+                    task = asyncio.create_task(self._requeue(user_id))
+                    self._requeues.add(task)
+                    task.add_done_callback(self._requeues.discard)
+                else:
+                    if user_id in self._pending:
+                        self._queue.put_nowait(user_id)
+                    self._queue.task_done()
+
+    async def _requeue(self, user_id: str):
+        try:
+            await self._queue.put(user_id)
+        finally:
+            self._queue.task_done()
+
+    async def stop(self, timeout: float = 30.0):
+        """Drain queued jobs (up to `timeout` seconds), then stop the workers."""
+        if not self._tasks:
+            return
+        if self._pending:
+            print(f"Draining {self.depth()} pending memory job(s)...")
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Memory queue drain timed out; {self.depth()} job(s) not persisted.")
+        # From here on submit() persists inline; no worker is left to race with
+        tasks, self._tasks = [*self._tasks, *self._requeues], []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,115 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List
+
+# handler(burst): generate and send one reply for all of the burst's messages
+BurstHandler = Callable[["Burst"], Awaitable[None]]
+
+
+@dataclass
+class Burst:
+    """Messages from one user answered together.
+
+    The handler calls `commit()` right before its reply starts going out;
+    until then a newer message supersedes the burst (cancelling any
+    in-flight generation) and is answered together with it.
+    """
+
+    messages: List[Any] = field(default_factory=list)
+    started: float = field(default_factory=time.monotonic)
+    committed: bool = False
+    superseded: int = 0
+
+    @property
+    def content(self) -> str:
+        return "\n".join(m.content for m in self.messages if m.content)
+
+    @property
+    def last(self) -> Any:
+        return self.messages[-1]
+
+    def commit(self):
+        self.committed = True
+
+
+class BurstCoalescer:
+    """Per-user debounce of rapid-fire messages into a single reply.
+
+    A message opens a burst and waits `window` seconds for more; each new
+    message restarts the wait, up to `max_wait` after the first one. A
+    message that arrives after the wait, while the reply is still being
+    generated, cancels that generation and restarts the burst with all
+    messages. Once the reply has started sending, new messages open a new
+    burst.
+    """
+
+    def __init__(self, handler: BurstHandler, *, window: float = 0.75, max_wait: float = 3.0):
+        self.handler = handler
+        self.window = window
+        self.max_wait = max(window, max_wait)
+        self._bursts: Dict[str, Burst] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._committed: List[asyncio.Task] = []
+        self.bursts = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def submit(self, user_id: str, message: Any):
+        """Add a message to the user's open burst, or open a new one."""
+        burst = self._bursts.get(user_id)
+        if burst is not None and not burst.committed:
+            burst.messages.append(message)
+            self.coalesced += 1
+            task = self._tasks.get(user_id)
+            if task is not None and not task.done():
+                task.cancel()
+                burst.superseded += 1
+        else:
+            if burst is not None:
+                # The previous reply is going out; let it finish on its own
+                self._committed.append(self._tasks.pop(user_id))
+                self._committed = [t for t in self._committed if not t.done()]
+            burst = self._bursts[user_id] = Burst([message])
+            self.bursts += 1
+        self._tasks[user_id] = asyncio.get_running_loop().create_task(self._run(user_id, burst))
+
+    async def _run(self, user_id: str, burst: Burst):
+        delay = min(self.window, burst.started + self.max_wait - time.monotonic())
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            await self.handler(burst)
+        except asyncio.CancelledError:
+            if not burst.committed:
+                self.cancelled += 1
+            raise
+        except Exception as e:
+            print(f"Reply failed for user {user_id}: {e}")
+        finally:
+            if self._bursts.get(user_id) is burst and self._tasks.get(user_id) is asyncio.current_task():
+                del self._bursts[user_id]
+                del self._tasks[user_id]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "open": len(self._bursts),
+            "bursts": self.bursts,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+        }
+
+    async def stop(self, timeout: float = 10.0):
+        """Drop bursts still waiting or generating; let replies already being sent finish."""
+        sending = [t for t in self._committed if not t.done()]
+        for user_id, task in list(self._tasks.items()):
+            if self._bursts[user_id].committed:
+                sending.append(task)
+            else:
+                task.cancel()
+        pending = list(self._tasks.values()) + sending
+        if pending:
+            await asyncio.wait(pending, timeout=timeout)
+        self._bursts.clear()
+        self._tasks.clear()
+        self._committed = []
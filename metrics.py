@@ -0,0 +1,219 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Prometheus-style text endpoint on this port (0 = disabled)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Print a JSON metrics line every N seconds (0 = disabled)
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", "0"))
+# Requests slower than this (end to end) get a per-stage breakdown logged
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "5000"))
+# Recent samples kept per histogram for the percentiles
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "2048"))
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    """Count, sum and a sliding window of recent samples (for p50/p95/p99)."""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.samples: Deque[float] = deque(maxlen=max(1, window))
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.samples.append(value)
+
+    def quantiles(self) -> Dict[float, float]:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+
+class Metrics:
+    """In-process metrics: histograms, counters and gauges read on export.
+
+    Thread-safe, since Firestore work runs in `asyncio.to_thread` workers.
+    Exported as Prometheus text (`render_prometheus`) and as a JSON snapshot.
+    """
+
+    def __init__(self, prefix: str = "sazami"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._runner: Optional[Any] = None
+
+    def observe(self, name: str, value: float, **labels: Any):
+        key = (name, _labels(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(value)
+
+    def incr(self, name: str, value: float = 1, **labels: Any):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def register_gauges(self, name: str, read: Callable[[], Dict[str, Any]]):
+        """Export the numeric fields of `read()` (e.g. a component's stats()) as gauges."""
+        self._gauges[name] = read
+
+    def _gauge_values(self) -> List[Tuple[str, float]]:
+        values = []
+        for name, read in self._gauges.items():
+            try:
+                stats = read()
+            except Exception:
+                continue
+            for field, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    values.append((f"{name}_{field}", float(value)))
+        return values
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            histograms = {
+                f"{name}{_format_labels(labels)}": {
+                    "count": h.count,
+                    "sum": round(h.total, 4),
+                    **{f"p{int(q * 100)}": round(v, 4) for q, v in h.quantiles().items()},
+                }
+                for (name, labels), h in self._histograms.items()
+            }
+            counters = {f"{name}{_format_labels(labels)}": value for (name, labels), value in self._counters.items()}
+        return {"histograms": histograms, "counters": counters, "gauges": dict(self._gauge_values())}
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            histograms = [(name, labels, h.count, h.total, h.quantiles()) for (name, labels), h in self._histograms.items()]
+            counters = list(self._counters.items())
+        typed = set()
+        for name, labels, count, total, quantiles in sorted(histograms, key=lambda x: (x[0], x[1])):
+            metric = f"{self.prefix}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} summary")
+                typed.add(metric)
+            for q, value in quantiles.items():
+                lines.append(f"{metric}{_format_labels(labels, ('quantile', str(q)))} {value:.6f}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+        for (name, labels), value in sorted(counters):
+            metric = f"{self.prefix}_{name}_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_format_labels(labels)} {value:g}")
+        for name, value in self._gauge_values():
+            lines.append(f"# TYPE {self.prefix}_{name} gauge")
+            lines.append(f"{self.prefix}_{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    # ---- export ----
+
+    async def _log_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            print(json.dumps({"metrics": self.snapshot()}, separators=(",", ":")))
+
+    async def start(self, port: int = METRICS_PORT, host: str = METRICS_HOST, log_interval: float = METRICS_LOG_INTERVAL):
+        """Start the /metrics endpoint and/or the periodic JSON log, per config."""
+        if log_interval > 0:
+            self._tasks.append(asyncio.get_running_loop().create_task(self._log_loop(log_interval)))
+        if port > 0:
+            from aiohttp import web
+
+            async def handle(_request):
+                return web.Response(text=self.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+            app = web.Application()
+            app.router.add_get("/metrics", handle)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, host, port).start()
+            print(f"Metrics on http://{host}:{port}/metrics")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+METRICS = Metrics()
+
+
+class RequestTrace:
+    """Timing spans for one request through the message pipeline.
+
+    Each `span(stage)` is recorded in the `stage_seconds` histogram as it
+    ends; `finish()` records the end-to-end time by outcome and, above
+    SLOW_REQUEST_MS, logs the per-stage breakdown plus any annotations
+    (prompt/response sizes, ...).
+    """
+
+    def __init__(self, kind: str = "message", metrics: Metrics = METRICS, slow_ms: float = SLOW_REQUEST_MS):
+        self.kind = kind
+        self.metrics = metrics
+        self.slow_ms = slow_ms
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+        self.fields: Dict[str, Any] = {}
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stages.append((stage, elapsed))
+            self.metrics.observe("stage_seconds", elapsed, stage=stage)
+
+    def annotate(self, **fields: Any):
+        self.fields.update(fields)
+
+    def finish(self, outcome: str = "ok") -> float:
+        total = time.perf_counter() - self.started
+        # Per outcome: fast shed/superseded requests would otherwise pull the reply latency down
+        self.metrics.observe("request_seconds", total, kind=self.kind, outcome=outcome)
+        self.metrics.incr("requests", kind=self.kind, outcome=outcome)
+        if total * 1000 >= self.slow_ms:
+            stages = " ".join(f"{stage}={elapsed * 1000:.0f}ms" for stage, elapsed in self.stages)
+            extra = " ".join(f"{k}={v}" for k, v in self.fields.items())
+            print(f"SLOW {self.kind} {total * 1000:.0f}ms: {stages} {extra}".rstrip())
+        return total
@@ -0,0 +1,290 @@
+"""Which Gemini model serves which task, and hedged chat requests.
+
+Models are discovered once via the API's model list (like list_models.py)
+and cached on disk for GEMINI_MODELS_CACHE_TTL, so restarts don't repeat
+the call. Each task has its own model: chat stays on GEMINI_CHAT_MODEL,
+while summaries and daily wishes default to a lighter, faster one. A
+routed model that discovery doesn't list, or that the API rejects, falls
+back to GEMINI_MODEL.
+
+Hedging (GEMINI_HEDGE_MODEL): if a chat request hasn't answered within
+the p95 of recent chat latencies, a backup request goes to the hedge model
+and whichever answers first wins. The p95 is of the primary model's
+latency, so a primary that loses is still timed, for a while, in the
+background.
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, TypeVar
+
+from dotenv import load_dotenv
+
+from metrics import METRICS, Histogram
+
+load_dotenv()
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-flash-latest")
+# Per-task models (summaries and wishes don't need the chat model)
+GEMINI_CHAT_MODEL = os.getenv("GEMINI_CHAT_MODEL", GEMINI_MODEL)
+GEMINI_SUMMARY_MODEL = os.getenv("GEMINI_SUMMARY_MODEL", "gemini-flash-lite-latest")
+GEMINI_WISH_MODEL = os.getenv("GEMINI_WISH_MODEL", "gemini-flash-lite-latest")
+# Discovered model list, cached on disk (seconds; 0 = don't discover, use names as configured)
+GEMINI_MODELS_CACHE_PATH = os.getenv("GEMINI_MODELS_CACHE_PATH", "gemini_models.json")
+GEMINI_MODELS_CACHE_TTL = float(os.getenv("GEMINI_MODELS_CACHE_TTL", "86400"))
+# Hedged chat requests: backup model ("" = off), delay (0 = p95 of recent chat latency),
+# samples needed before the p95 is trusted, and the max share of chat requests hedged
+GEMINI_HEDGE_MODEL = os.getenv("GEMINI_HEDGE_MODEL", "")
+GEMINI_HEDGE_AFTER = float(os.getenv("GEMINI_HEDGE_AFTER", "0"))
+GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+GEMINI_HEDGE_MAX_RATIO = float(os.getenv("GEMINI_HEDGE_MAX_RATIO", "0.1"))
+
+TASK_CHAT = "chat"
+TASK_SUMMARY = "summary"
+TASK_WISH = "wish"
+
+T = TypeVar("T")
+
+
+def generate_models(models: List[Dict[str, Any]]) -> List[str]:
+    """Names ("models/...") of the listed models that support generateContent."""
+    return [m["name"] for m in models if "generateContent" in m.get("supportedGenerationMethods", [])]
+
+
+def _short(name: str) -> str:
+    return name[len("models/"):] if name.startswith("models/") else name
+
+
+class ModelRegistry:
+    """Routes tasks to models, validated against the (disk-cached) discovered model list."""
+
+    def __init__(
+        self,
+        routes: Optional[Dict[str, str]] = None,
+        *,
+        default: str = GEMINI_MODEL,
+        cache_path: str = GEMINI_MODELS_CACHE_PATH,
+        cache_ttl: float = GEMINI_MODELS_CACHE_TTL,
+    ):
+        self.routes = routes if routes is not None else {
+            TASK_CHAT: GEMINI_CHAT_MODEL,
+            TASK_SUMMARY: GEMINI_SUMMARY_MODEL,
+            TASK_WISH: GEMINI_WISH_MODEL,
+        }
+        self.default = default
+        self.cache_path = cache_path
+        self.cache_ttl = cache_ttl
+        self.available: Optional[Set[str]] = None  # None = unknown, use names as configured
+        self._rejected: Set[str] = set()
+        self._discovered = False
+        self._lock: Optional[asyncio.Lock] = None
+        self.fallbacks = 0
+
+    def _read_cache(self, max_age: Optional[float]) -> Optional[List[str]]:
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if max_age is not None and time.time() - data.get("fetched_at", 0) > max_age:
+            return None
+        return data.get("models")
+
+    def write_cache(self, names: List[str]):
+        try:
+            with open(self.cache_path, "w", encoding="utf-8") as f:
+                json.dump({"fetched_at": time.time(), "models": names}, f)
+        except OSError as e:
+            print(f"Could not write model cache {self.cache_path}: {e}")
+
+    async def discover(self, refresh: bool = False) -> List[str]:
+        """Model names that support generateContent, from the disk cache or the API.
+
+        If the API call fails, an expired cache is still used; with neither,
+        routing uses the configured names unchecked.
+        """
+        from gemini_client import GeminiError, get_gemini_client
+
+        names = None if refresh else self._read_cache(self.cache_ttl)
+        if names is None:
+            try:
+                names = generate_models(await get_gemini_client().list_models())
+                self.write_cache(names)
+            except GeminiError as e:
+                names = self._read_cache(None)
+                fallback = "the expired model cache" if names is not None else "configured model names"
+                print(f"Model discovery failed ({e}); using {fallback}.")
+        self._discovered = True
+        if names is not None:
+            self.available = {_short(n) for n in names}
+        return names or []
+
+    async def ensure_discovered(self):
+        """Discover once per process (no-op when discovery is disabled)."""
+        if self._discovered or self.cache_ttl <= 0:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._discovered:
+                await self.discover()
+
+    def model_for(self, task: str) -> str:
+        model = self.routes.get(task) or self.default
+        if model == self.default:
+            return model
+        if model in self._rejected or (self.available is not None and model not in self.available):
+            self.fallbacks += 1
+            return self.default
+        return model
+
+    def reject(self, model: str):
+        """Stop routing to `model` (e.g. the API answered 404 for it)."""
+        if model != self.default and model not in self._rejected:
+            print(f"Model {model} unavailable; routing its tasks to {self.default}.")
+            self._rejected.add(model)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "known_models": len(self.available) if self.available is not None else -1,
+            "rejected": len(self._rejected),
+            "fallbacks": self.fallbacks,
+        }
+
+
+class Hedger:
+    """Races a backup request against a slow primary.
+
+    The backup starts once the primary has run for `after` seconds, or the
+    p95 of recent latencies when `after` is 0 (no hedging until
+    `min_samples` latencies are known). At most `max_ratio` of requests are
+    hedged, so a slow API can't double the request volume, and none while
+    `can_hedge()` is False: when requests queue locally, a backup would only
+    wait in the same queue.
+
+    When the backup wins, the primary keeps running for up to
+    `straggler_factor` times the hedge delay so its latency can be recorded.
+    Otherwise p95 would only ever see the time to the faster answer, drift
+    down, and hedge ever earlier. A primary still running at that point is
+    cancelled and recorded at the elapsed time, a lower bound.
+    """
+
+    def __init__(
+        self,
+        model: str = GEMINI_HEDGE_MODEL,
+        *,
+        after: float = GEMINI_HEDGE_AFTER,
+        min_samples: int = GEMINI_HEDGE_MIN_SAMPLES,
+        max_ratio: float = GEMINI_HEDGE_MAX_RATIO,
+        window: int = 200,
+        straggler_factor: float = 3.0,
+    ):
+        self.model = model
+        self.after = after
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.straggler_factor = straggler_factor
+        self.latency = Histogram(window)
+        self._stragglers: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.hedged = 0
+        self.backup_won = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.model)
+
+    def delay(self) -> Optional[float]:
+        """Seconds before hedging the next request, or None to not hedge it."""
+        if not self.enabled or self.hedged >= self.max_ratio * max(1, self.requests):
+            return None
+        if self.after > 0:
+            return self.after
+        if len(self.latency.samples) < self.min_samples:
+            return None
+        return self.latency.quantiles()[0.95]
+
+    async def run(
+        self,
+        primary: Callable[[], Awaitable[T]],
+        backup: Callable[[], Awaitable[T]],
+        can_hedge: Callable[[], bool] = lambda: True,
+    ) -> T:
+        """Result of `primary`, or of `backup` if that answers first once started."""
+        delay = self.delay()
+        self.requests += 1
+        started = time.monotonic()
+        first = asyncio.ensure_future(primary())
+        tasks = {first}
+        try:
+            if delay is not None:
+                await asyncio.wait(tasks, timeout=delay)
+                if not first.done() and can_hedge():
+                    self.hedged += 1
+                    tasks.add(asyncio.ensure_future(backup()))
+            hedged = len(tasks) > 1
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        if error is None or task is first:
+                            error = task.exception()
+                        continue
+                    if task is first:
+                        self.latency.observe(time.monotonic() - started)
+                    elif first in tasks:
+                        tasks.discard(first)  # not cancelled below; timed instead
+                        self._time_straggler(first, started, delay * self.straggler_factor)
+                    if hedged:
+                        winner = "primary" if task is first else "backup"
+                        self.backup_won += task is not first
+                        METRICS.incr("gemini_hedges", winner=winner)
+                    return task.result()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _time_straggler(self, primary: "asyncio.Future[T]", started: float, limit: float):
+        async def wait():
+            try:
+                await asyncio.wait_for(primary, max(0.0, started + limit - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass  # at least this slow
+            except Exception:
+                return  # failed: no latency to learn from
+            self.latency.observe(time.monotonic() - started)
+
+        task = asyncio.ensure_future(wait())
+        self._stragglers.add(task)
+        task.add_done_callback(self._stragglers.discard)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "backup_won": self.backup_won,
+            "p95_seconds": round(self.latency.quantiles()[0.95], 3),
+        }
+
+
+_registry: Optional[ModelRegistry] = None
+_hedger: Optional[Hedger] = None
+
+
+def get_model_registry() -> ModelRegistry:
+    """Return the process-wide registry (created on first use)."""
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry()
+    return _registry
+
+
+def get_hedger() -> Hedger:
+    """Return the process-wide chat hedger (created on first use)."""
+    global _hedger
+    if _hedger is None:
+        _hedger = Hedger()
+    return _hedger
@@ -0,0 +1,236 @@
+"""Sharded deployment: gateway shards split across worker processes, users pinned to workers.
+
+Each worker process runs the bot for a subset of the gateway shards
+(`worker_shards`). Messages may arrive on any worker, but each user is owned
+by exactly one worker, picked by consistent hashing (`HashRing`). A message
+for someone else's user is forwarded over a small local HTTP IPC endpoint
+(`ShardRouter`), so that user's memory cache, burst state and write order
+all live in a single process. The supervisor (`supervisor.py`) starts,
+health-checks and restarts the workers.
+"""
+import asyncio
+import bisect
+import hashlib
+import hmac
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Worker processes (1 = unsharded, the default) and this process's index among them
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "1"))
+SHARD_WORKER_INDEX = int(os.getenv("SHARD_WORKER_INDEX", "0"))
+# Total gateway shards, split round-robin across workers (default: one per worker)
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0")) or SHARD_WORKERS
+# Worker i serves IPC on SHARD_IPC_HOST:SHARD_IPC_BASE_PORT+i, unless SHARD_PEERS
+# lists every worker's "host:port" explicitly (workers on several machines)
+SHARD_IPC_HOST = os.getenv("SHARD_IPC_HOST", "127.0.0.1")
+SHARD_IPC_BASE_PORT = int(os.getenv("SHARD_IPC_BASE_PORT", "8790"))
+SHARD_PEERS = [p.strip() for p in os.getenv("SHARD_PEERS", "").split(",") if p.strip()]
+# Shared secret sent with forwarded messages; workers refuse to serve IPC without one
+# (the supervisor generates one if empty)
+SHARD_IPC_SECRET = os.getenv("SHARD_IPC_SECRET", "")
+SHARD_FORWARD_TIMEOUT = float(os.getenv("SHARD_FORWARD_TIMEOUT", "5"))
+
+SHARDING_ENABLED = SHARD_WORKERS > 1
+
+
+def _hash(key: str) -> int:
+    # Stable across processes (unlike hash()), so every worker agrees on owners
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring over worker indexes, with virtual nodes.
+
+    Changing the number of workers moves only ~1/N of the users.
+    """
+
+    def __init__(self, nodes: int, vnodes: int = 64):
+        points: List[Tuple[int, int]] = sorted(
+            (_hash(f"worker-{node}#{v}"), node) for node in range(max(1, nodes)) for v in range(vnodes)
+        )
+        self._keys = [key for key, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def owner(self, key: str) -> int:
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[i]
+
+
+def worker_shards(index: int, workers: int = SHARD_WORKERS, shard_count: int = SHARD_COUNT) -> List[int]:
+    """Gateway shard ids run by worker `index`."""
+    return [shard for shard in range(shard_count) if shard % workers == index]
+
+
+def guild_shard(guild_id: int, shard_count: int = SHARD_COUNT) -> int:
+    """Gateway shard that receives `guild_id`'s events (Discord's formula)."""
+    return (guild_id >> 22) % max(1, shard_count)
+
+
+def peer_address(index: int) -> Tuple[str, int]:
+    if SHARD_PEERS:
+        host, _, port = SHARD_PEERS[index].rpartition(":")
+        return host, int(port)
+    return SHARD_IPC_HOST, SHARD_IPC_BASE_PORT + index
+
+
+# ------------------------------ Forwarded messages ------------------------------
+
+class ForwardedAuthor:
+    bot = False
+
+    def __init__(self, user_id: int, name: str):
+        self.id = user_id
+        self.name = name
+        self.mention = f"<@{user_id}>"
+
+    def __str__(self):
+        return self.name
+
+
+class ForwardedMessage:
+    """Enough of a discord.Message for the reply pipeline, rebuilt on the owning worker.
+
+    The channel is a PartialMessageable: sending, typing and reactions are
+    plain REST calls, so they work even if the guild is on another worker's
+    gateway shard.
+    """
+
+    def __init__(self, client, payload: Dict[str, Any]):
+        self.id = int(payload["message_id"])
+        self.content = payload["content"]
+        self.author = ForwardedAuthor(int(payload["author_id"]), payload["author_name"])
+        self.channel = client.get_partial_messageable(int(payload["channel_id"]), guild_id=payload.get("guild_id"))
+        self.guild = None
+
+    async def add_reaction(self, emoji: str):
+        await self.channel.get_partial_message(self.id).add_reaction(emoji)
+
+
+def message_payload(message) -> Dict[str, Any]:
+    return {
+        "message_id": message.id,
+        "content": message.content,
+        "author_id": message.author.id,
+        "author_name": message.author.name,
+        "channel_id": message.channel.id,
+        "guild_id": message.guild.id if message.guild else None,
+    }
+
+
+# ------------------------------ IPC ------------------------------
+
+class ShardRouter:
+    """Routes each user's messages to the worker that owns them.
+
+    `serve()` starts this worker's IPC endpoint: POST /forward accepts a
+    forwarded message and passes it to `deliver`, and GET /health answers
+    the supervisor. `route()` delivers locally or forwards to the owner; if
+    the owner can't be reached, the message is handled locally rather than
+    dropped.
+    """
+
+    def __init__(
+        self,
+        deliver: Callable[[Any], Awaitable[None]],
+        client,
+        index: int = SHARD_WORKER_INDEX,
+        workers: int = SHARD_WORKERS,
+        secret: str = SHARD_IPC_SECRET,
+    ):
+        self.deliver = deliver
+        self.client = client
+        self.index = index
+        self.workers = workers
+        self.secret = secret
+        self.ring = HashRing(workers)
+        self._runner: Optional[Any] = None
+        self._session: Optional[Any] = None
+        self._deliveries: Set[asyncio.Task] = set()
+        self.local = 0
+        self.forwarded = 0
+        self.received = 0
+        self.forward_failed = 0
+
+    def owner(self, user_id: int) -> int:
+        return self.ring.owner(str(user_id))
+
+    async def route(self, message):
+        owner = self.owner(message.author.id)
+        if owner == self.index:
+            self.local += 1
+            await self.deliver(message)
+            return
+        if await self._forward(owner, message_payload(message)):
+            self.forwarded += 1
+            return
+        self.forward_failed += 1
+        await self.deliver(message)
+
+    async def _forward(self, owner: int, payload: Dict[str, Any]) -> bool:
+        import aiohttp
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=SHARD_FORWARD_TIMEOUT))
+        host, port = peer_address(owner)
+        try:
+            async with self._session.post(
+                f"http://{host}:{port}/forward", json=payload, headers={"X-Shard-Secret": self.secret}
+            ) as resp:
+                if resp.status == 200:
+                    return True
+                print(f"Forward to worker {owner} failed: HTTP {resp.status}; handling locally.")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Forward to worker {owner} failed: {e!r}; handling locally.")
+        return False
+
+    async def serve(self):
+        from aiohttp import web
+
+        # Without a secret anyone who can reach the port could post as any user
+        if not self.secret:
+            raise RuntimeError("SHARD_IPC_SECRET is not set (start workers with supervisor.py, or set it)")
+
+        async def forward(request):
+            if not hmac.compare_digest(request.headers.get("X-Shard-Secret", ""), self.secret):
+                return web.Response(status=403)
+            payload = await request.json()
+            self.received += 1
+            # Acknowledge right away; the reply itself can take a while
+            task = asyncio.get_running_loop().create_task(self.deliver(ForwardedMessage(self.client, payload)))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+            return web.json_response({"ok": True})
+
+        async def health(_request):
+            return web.json_response({"worker": self.index, "ready": self.client.is_ready(), **self.stats()})
+
+        app = web.Application()
+        app.router.add_post("/forward", forward)
+        app.router.add_get("/health", health)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        host, port = peer_address(self.index)
+        await web.TCPSite(self._runner, host, port).start()
+        print(f"Worker {self.index}/{self.workers} IPC on {host}:{port}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "local": self.local,
+            "forwarded": self.forwarded,
+            "received": self.received,
+            "forward_failed": self.forward_failed,
+        }
+
+    async def stop(self, timeout: float = 10.0):
+        if self._deliveries:
+            await asyncio.wait(self._deliveries, timeout=timeout)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
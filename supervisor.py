@@ -0,0 +1,178 @@
+"""Run the bot as SHARD_WORKERS worker processes, restarting any that exit or stop answering.
+
+    SHARD_WORKERS=4 python supervisor.py
+    SHARD_WORKERS=4 SHARD_COUNT=8 python supervisor.py
+    # Workers spread over machines: list every worker's IPC address, start a subset here
+    SHARD_WORKERS=4 SHARD_PEERS=10.0.0.1:8790,10.0.0.1:8791,10.0.0.2:8790,10.0.0.2:8791 \\
+        SHARD_IPC_SECRET=... python supervisor.py --only 0,1
+
+Each worker is `main.py` with SHARD_WORKER_INDEX set (see sharding.py).
+Stopping the supervisor (Ctrl+C / SIGTERM) sends SIGINT to the workers, so
+they drain their memory queues before exiting.
+"""
+import argparse
+import asyncio
+import os
+import secrets
+import signal
+import sys
+import time
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from sharding import SHARD_IPC_SECRET, SHARD_PEERS, SHARD_WORKERS, peer_address
+
+load_dotenv()
+
+# Seconds between /health checks, and failed checks in a row before a restart
+SHARD_HEALTH_INTERVAL = float(os.getenv("SHARD_HEALTH_INTERVAL", "15"))
+SHARD_HEALTH_FAILURES = int(os.getenv("SHARD_HEALTH_FAILURES", "3"))
+# Restart delay doubles per crash up to this; a worker up for 5 minutes resets it
+SHARD_RESTART_BACKOFF_MAX = float(os.getenv("SHARD_RESTART_BACKOFF_MAX", "60"))
+# Time workers get to drain on shutdown before they are killed
+SHARD_STOP_TIMEOUT = float(os.getenv("SHARD_STOP_TIMEOUT", "45"))
+
+STABLE_SECONDS = 300
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+
+class WorkerProcess:
+    def __init__(self, index: int, env: Dict[str, str]):
+        self.index = index
+        self.env = env
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.started = 0.0
+        self.restarts = 0
+        self.failed_checks = 0
+        self.backoff = 1.0
+
+    async def spawn(self):
+        env = {**os.environ, **self.env, "SHARD_WORKER_INDEX": str(self.index)}
+        self.process = await asyncio.create_subprocess_exec(sys.executable, MAIN_SCRIPT, env=env)
+        self.started = time.monotonic()
+        self.failed_checks = 0
+        print(f"Worker {self.index} started (pid {self.process.pid}).")
+
+    def signal(self, sig: int):
+        if self.process is not None and self.process.returncode is None:
+            self.process.send_signal(sig)
+
+    def kill_if_running(self, pid: int):
+        # Only the process that was asked to stop, not its replacement
+        if self.process is not None and self.process.pid == pid and self.process.returncode is None:
+            print(f"Worker {self.index} did not stop in time; killing it.")
+            self.process.kill()
+
+
+class Supervisor:
+    """Starts the workers, restarts them with backoff, and health-checks their IPC endpoints."""
+
+    def __init__(self, indexes: List[int], env: Dict[str, str]):
+        self.workers = [WorkerProcess(i, env) for i in indexes]
+        self._stopping = asyncio.Event()
+
+    async def _keep_running(self, worker: WorkerProcess):
+        while not self._stopping.is_set():
+            await worker.spawn()
+            code = await worker.process.wait()
+            if self._stopping.is_set():
+                break
+            if time.monotonic() - worker.started >= STABLE_SECONDS:
+                worker.backoff = 1.0
+            print(f"Worker {worker.index} exited with code {code}; restarting in {worker.backoff:.0f}s.")
+            worker.restarts += 1
+            try:
+                await asyncio.wait_for(self._stopping.wait(), worker.backoff)
+            except asyncio.TimeoutError:
+                pass
+            worker.backoff = min(SHARD_RESTART_BACKOFF_MAX, worker.backoff * 2)
+
+    async def _check(self, session, worker: WorkerProcess):
+        import aiohttp
+
+        host, port = peer_address(worker.index)
+        try:
+            async with session.get(f"http://{host}:{port}/health") as resp:
+                healthy = resp.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            healthy = False
+        worker.failed_checks = 0 if healthy else worker.failed_checks + 1
+        if worker.failed_checks >= SHARD_HEALTH_FAILURES:
+            print(f"Worker {worker.index} failed {worker.failed_checks} health checks; restarting it.")
+            worker.failed_checks = 0
+            # SIGTERM drains the memory queue like SIGINT; a hung worker is killed after the drain timeout
+            worker.signal(signal.SIGTERM)
+            if worker.process is not None:
+                asyncio.get_running_loop().call_later(SHARD_STOP_TIMEOUT, worker.kill_if_running, worker.process.pid)
+
+    async def _health_loop(self):
+        import aiohttp
+
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as session:
+            while not self._stopping.is_set():
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), SHARD_HEALTH_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                # Skip workers that are still starting up
+                ready = [
+                    w for w in self.workers
+                    if w.process is not None and time.monotonic() - w.started > 2 * SHARD_HEALTH_INTERVAL
+                ]
+                await asyncio.gather(*(self._check(session, w) for w in ready))
+
+    def stop(self):
+        if not self._stopping.is_set():
+            print("Stopping workers...")
+            self._stopping.set()
+            for worker in self.workers:
+                worker.signal(signal.SIGINT)  # graceful: workers drain their memory queues
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except NotImplementedError:  # Windows
+                pass
+        tasks = [asyncio.create_task(self._keep_running(w)) for w in self.workers]
+        health = asyncio.create_task(self._health_loop())
+        await self._stopping.wait()
+        done, pending = await asyncio.wait(tasks, timeout=SHARD_STOP_TIMEOUT)
+        for worker in self.workers:
+            if worker.process is not None and worker.process.returncode is None:
+                print(f"Worker {worker.index} did not stop in time; killing it.")
+                worker.process.kill()
+        await asyncio.gather(*pending, return_exceptions=True)
+        health.cancel()
+        await asyncio.gather(health, return_exceptions=True)
+        print("All workers stopped.")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the bot as SHARD_WORKERS worker processes")
+    parser.add_argument("--only", default="", help="Comma-separated worker indexes to run here (default: all)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if SHARD_WORKERS < 2:
+        print("Set SHARD_WORKERS to 2 or more to run sharded (or just run main.py).")
+        return 1
+    indexes = [int(i) for i in args.only.split(",") if i.strip()] if args.only else list(range(SHARD_WORKERS))
+    if any(i < 0 or i >= SHARD_WORKERS for i in indexes):
+        print(f"Worker indexes must be in 0..{SHARD_WORKERS - 1}.")
+        return 1
+    # Workers on one machine can share a random secret; across machines it must be set
+    if SHARD_PEERS and not SHARD_IPC_SECRET:
+        print("Set SHARD_IPC_SECRET (the same on every machine) when using SHARD_PEERS.")
+        return 1
+    env = {"SHARD_IPC_SECRET": SHARD_IPC_SECRET or secrets.token_hex(16)}
+    asyncio.run(Supervisor(indexes, env).run())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, Overloaded
+
+
+def test_sheds_when_queue_is_full():
+    async def run():
+        admission = AdmissionController(max_in_flight=1, max_queue=1, max_wait=5)
+        await admission.acquire("a")
+        waiting = asyncio.create_task(admission.acquire("b"))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as shed:
+            await admission.acquire("c")
+        admission.release("a")
+        await waiting
+        return admission, shed.value.reason
+
+    admission, reason = asyncio.run(run())
+    assert reason == "queue_full"
+    assert admission.shed["queue_full"] == 1
+    assert admission.stats()["in_flight"] == 1
+
+
+def test_queues_a_users_quick_follow_ups_when_idle():
+    async def run():
+        admission = AdmissionController(max_in_flight=4, max_queue=10, max_wait=5)
+        order = []
+
+        async def reply(n):
+            await admission.acquire("a")
+            order.append(n)
+            await asyncio.sleep(0.01)
+            admission.release("a")
+
+        await asyncio.gather(*(reply(n) for n in range(3)))
+        return order, admission.shed
+
+    order, shed = asyncio.run(run())
+    assert order == [0, 1, 2]
+    assert sum(shed.values()) == 0
+
+
+def test_sheds_a_second_waiting_request_from_the_same_user_under_load():
+    async def run():
+        admission = AdmissionController(max_in_flight=1, max_queue=10, max_wait=5, busy_queue=2)
+        await admission.acquire("a")
+        waiting = [asyncio.create_task(admission.acquire(user)) for user in ("a", "b")]
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as shed:
+            await admission.acquire("a")
+        for user in ("a", "a", "b"):
+            admission.release(user)
+            await asyncio.sleep(0)
+        await asyncio.gather(*waiting)
+        return shed.value.reason
+
+    assert asyncio.run(run()) == "user_busy"
+
+
+def test_sheds_after_max_wait():
+    async def run():
+        admission = AdmissionController(max_in_flight=1, max_queue=10, max_wait=0.05)
+        await admission.acquire("a")
+        with pytest.raises(Overloaded) as shed:
+            await admission.acquire("b")
+        return admission, shed.value.reason
+
+    admission, reason = asyncio.run(run())
+    assert reason == "timeout"
+    assert admission.stats()["queue_length"] == 0
+
+
+def test_busy_user_does_not_block_waiters_behind_it():
+    async def run():
+        admission = AdmissionController(max_in_flight=2, max_queue=10, max_wait=5)
+        await admission.acquire("a")
+        await admission.acquire("x")
+        same_user = asyncio.create_task(admission.acquire("a"))
+        other = asyncio.create_task(admission.acquire("b"))
+        await asyncio.sleep(0)
+        # "a" is still running, so the freed slot goes to "b" behind it
+        admission.release("x")
+        await other
+        pending = not same_user.done()
+        admission.release("a")
+        await same_user
+        return pending, admission.stats()
+
+    pending, stats = asyncio.run(run())
+    assert pending
+    assert stats["in_flight"] == 2
+    assert stats["admitted"] == 4
@@ -0,0 +1,77 @@
+import asyncio
+
+import discord
+
+from broadcast import BroadcastEngine
+
+
+class Sender:
+    """Records concurrency; raises RateLimited for the recipients in `limited` (once each by default)."""
+
+    def __init__(self, limited=(), times=1, delay=0.005):
+        self.limited = {r: times for r in limited}
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.sent = []
+        self.limits_seen = []
+
+    def __call__(self, engine):
+        async def send(recipient):
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            try:
+                await asyncio.sleep(self.delay)
+                if self.limited.get(recipient, 0) > 0:
+                    self.limited[recipient] -= 1
+                    raise discord.RateLimited(0.01)
+                self.sent.append(recipient)
+                self.limits_seen.append(engine.limit)
+            finally:
+                self.active -= 1
+
+        return send
+
+
+def _run(engine, recipients, sender):
+    return asyncio.run(engine.run(recipients, sender(engine)))
+
+
+def test_sends_to_everyone_within_the_concurrency_limit():
+    engine = BroadcastEngine(4, progress_interval=60)
+    sender = Sender()
+    stats = _run(engine, range(30), sender)
+    assert sorted(sender.sent) == list(range(30))
+    assert stats.sent == 30 and stats.rate_limited == 0
+    assert sender.peak == 4
+
+
+def test_rate_limits_halve_concurrency_retry_and_grow_back():
+    engine = BroadcastEngine(8, grow_after=5, progress_interval=60)
+    sender = Sender(limited=[3])
+    stats = _run(engine, range(60), sender)
+    assert sorted(sender.sent) == list(range(60))  # the limited recipient was retried
+    assert stats.rate_limited == 1 and stats.gave_up == 0
+    assert min(sender.limits_seen) == 4
+    assert engine.limit == 8  # grew back by one per clean run
+
+
+def test_gives_up_after_max_retries():
+    engine = BroadcastEngine(2, max_retries=2, progress_interval=60)
+    sender = Sender(limited=["stuck"], times=10)
+    stats = _run(engine, ["a", "stuck", "b"], sender)
+    assert sorted(sender.sent) == ["a", "b"]
+    assert stats.gave_up == 1 and stats.rate_limited == 3
+
+
+def test_consumes_async_iterables_lazily():
+    async def pages():
+        for page in range(3):
+            await asyncio.sleep(0)
+            for i in range(5):
+                yield page * 5 + i
+
+    engine = BroadcastEngine(3, progress_interval=60)
+    sender = Sender()
+    stats = _run(engine, pages(), sender)
+    assert stats.sent == 15 and sorted(sender.sent) == list(range(15))
@@ -0,0 +1,50 @@
+from broadcast_journal import BroadcastJournal, RecipientIndex
+
+
+def test_sends_survive_a_crash_after_a_flush(tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+    journal = BroadcastJournal(path, "2026-10-18", "morning", flush_every=2, flush_interval=3600)
+    journal.record(1, "sent")
+    journal.record(2, "forbidden")
+    journal.record(3, "sent")  # still buffered when the process dies
+    resumed = BroadcastJournal(path, "2026-10-18", "morning")
+    assert resumed.statuses() == {1: "sent", 2: "forbidden"}
+    assert BroadcastJournal(path, "2026-10-18", "evening").statuses() == {}
+
+
+def test_wishes_and_steps_are_kept_per_run(tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+    journal = BroadcastJournal(path, "2026-10-18", "morning")
+    journal.save_wish("channel", "Good morning!")
+    journal.save_wishes({"dm:1": "Hi one", "dm:2": "Hi two"})
+    journal.mark_step("channel_post")
+    journal.close()
+    resumed = BroadcastJournal(path, "2026-10-18", "morning")
+    assert resumed.get_wish("channel") == "Good morning!"
+    assert resumed.get_wishes("dm:") == {"dm:1": "Hi one", "dm:2": "Hi two"}
+    assert resumed.step_done("channel_post")
+    assert not resumed.step_done("summary_post")
+
+
+def test_recipient_changes_are_flushed_in_batches(tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+    index = RecipientIndex(path, flush_every=2, flush_interval=3600)
+    index.mark_closed(1)
+    index.mark_closed(2)
+    index.mark_closed(3)  # still buffered when the process dies
+    assert RecipientIndex(path).dm_closed == {1, 2}
+
+
+def test_reopened_dms_and_opt_outs(tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+    index = RecipientIndex(path)
+    index.mark_closed(1)
+    index.mark_open(2)  # never closed: nothing to write
+    index.set_opted_out(3, True)
+    index.close()
+    index = RecipientIndex(path)
+    assert index.dm_closed == {1}
+    assert index.opted_out == {3}
+    index.mark_open(1)
+    index.close()
+    assert RecipientIndex(path).dm_closed == set()
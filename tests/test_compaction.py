@@ -0,0 +1,45 @@
+from compaction import SummaryLimiter, clip_summary, overflow_reason, split_history
+
+
+def _messages(sizes):
+    return [{"role": "user", "content": "x" * size} for size in sizes]
+
+
+def test_overflow_reason():
+    assert overflow_reason(_messages([10] * 5), max_chars=100, max_messages=10) is None
+    assert overflow_reason(_messages([60, 60]), max_chars=100, max_messages=10) == "chars"
+    assert overflow_reason(_messages([1] * 11), max_chars=100, max_messages=10) == "messages"
+
+
+def test_split_keeps_the_newest_messages_within_both_limits():
+    messages = _messages([50, 10, 20, 30, 40])
+    older, keep = split_history(messages, keep_messages=3, keep_chars=100)
+    assert keep == messages[2:] and older == messages[:2]
+    older, keep = split_history(messages, keep_messages=10, keep_chars=75)
+    assert keep == messages[3:]
+    # Once split at the keep limits, the history is well within the overflow limits
+    assert overflow_reason(keep, max_chars=150, max_messages=6) is None
+
+
+def test_clip_summary_cuts_at_a_line_break():
+    summary = "likes cats\nlives in Oslo\nplays chess"
+    assert clip_summary(summary, 100) == summary
+    assert clip_summary(summary, 30) == "likes cats\nlives in Oslo"
+    assert clip_summary("x" * 40, 30) == "x" * 30
+
+
+def test_limiter_caps_summaries_per_user_in_a_sliding_window():
+    limiter = SummaryLimiter(max_per_window=2, window_seconds=10)
+    assert [limiter.acquire("a", t) for t in (0, 1, 2)] == [True, True, False]
+    assert limiter.acquire("b", 2)  # other users are unaffected
+    assert limiter.acquire("a", 10.5)  # the first one has left the window
+    assert limiter.stats()["limited"] == 1
+
+
+def test_limiter_forgets_idle_users():
+    limiter = SummaryLimiter(max_per_window=1, window_seconds=10)
+    for i in range(5):
+        limiter.acquire(f"user{i}", 1)
+    limiter.acquire("late", 30)  # at most one sweep per window, from acquire
+    assert list(limiter._recent) == ["late"]
+    assert SummaryLimiter(max_per_window=0).acquire("a")  # unlimited
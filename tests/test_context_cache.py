@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+import context_cache
+from context_cache import ContextCache
+from gemini_client import GeminiClientError
+from model_registry import ModelRegistry
+
+
+class FakeClient:
+    def __init__(self, reject=False):
+        self.reject = reject
+        self.created = 0
+        self.deleted = []
+
+    async def create_cached_content(self, payload, model):
+        await asyncio.sleep(0.01)
+        if self.reject:
+            raise GeminiClientError("too small", 400)
+        self.created += 1
+        return {"name": f"cachedContents/{self.created}"}
+
+    async def delete_cached_content(self, name):
+        self.deleted.append(name)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake = FakeClient()
+    monkeypatch.setattr(context_cache, "get_gemini_client", lambda: fake)
+    monkeypatch.setattr(context_cache, "get_model_registry", lambda: ModelRegistry(cache_ttl=0))
+    return fake
+
+
+def test_concurrent_requests_share_one_cache_and_locks_follow_evictions(client):
+    async def run():
+        cache = ContextCache(max_entries=2, min_tokens=1)
+        prefixes = await asyncio.gather(*(cache.prefix_for("u1", "persona", "summary") for _ in range(3)))
+        for key in ("u2", "u3"):
+            await cache.prefix_for(key, "persona", "summary")
+        await asyncio.sleep(0)  # background delete of the evicted handle
+        return cache, prefixes
+
+    cache, prefixes = asyncio.run(run())
+    assert {p.handle for p in prefixes} == {"cachedContents/1"}
+    assert client.created == 3
+    assert client.deleted == ["cachedContents/1"]
+    assert sorted(cache._locks) == ["u2", "u3"]
+
+
+def test_short_prefixes_are_sent_inline(client):
+    cache = ContextCache(min_tokens=1024)
+    prefix = asyncio.run(cache.prefix_for("u1", "persona", "summary"))
+    assert prefix.handle is None
+    assert client.created == 0
+
+
+def test_rejected_prefixes_are_remembered_within_a_bound(client):
+    client.reject = True
+
+    async def run():
+        cache = ContextCache(max_entries=2, min_tokens=1)
+        for i in range(5):
+            await cache.prefix_for(f"u{i}", "persona", f"summary {i}")
+        return cache
+
+    cache = asyncio.run(run())
+    assert cache.stats()["rejected"] == 2
+    assert not cache._locks
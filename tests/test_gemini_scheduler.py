@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+import pytest
+
+from gemini_client import GeminiRateLimitError, GeminiServerError
+from gemini_scheduler import PRIORITY_BACKGROUND, PRIORITY_CHAT, GeminiScheduler
+
+
+def test_chat_is_admitted_before_earlier_background_requests():
+    async def run():
+        scheduler = GeminiScheduler(rpm=1200, tpm=0)  # one request per 50 ms once drained
+        scheduler.requests.tokens = 0
+        order = []
+
+        async def request(name, priority):
+            await scheduler.acquire(priority)
+            order.append(name)
+
+        background = [asyncio.create_task(request(f"bg{i}", PRIORITY_BACKGROUND)) for i in range(3)]
+        await asyncio.sleep(0.01)  # background requests are queued first
+        chat = asyncio.create_task(request("chat", PRIORITY_CHAT))
+        await asyncio.gather(*background, chat)
+        return order
+
+    assert asyncio.run(run()) == ["chat", "bg0", "bg1", "bg2"]
+
+
+def test_retry_after_pauses_every_request():
+    async def run():
+        scheduler = GeminiScheduler(rpm=0, tpm=0)
+        delay = scheduler.backoff_delay(GeminiRateLimitError("429", retry_after=0.2), 0)
+        started = time.monotonic()
+        await scheduler.acquire(PRIORITY_CHAT)
+        return delay, time.monotonic() - started, scheduler.rate_limited
+
+    delay, waited, rate_limited = asyncio.run(run())
+    assert delay == 0.2
+    assert waited >= 0.19
+    assert rate_limited == 1
+
+
+def test_chat_gives_up_when_quota_wait_exceeds_max_wait():
+    async def run():
+        scheduler = GeminiScheduler(rpm=60, tpm=0)
+        scheduler.requests.tokens = 0  # next slot in ~1 s
+        with pytest.raises(GeminiRateLimitError):
+            await scheduler.acquire(PRIORITY_CHAT, max_wait=0.1)
+        return scheduler
+
+    scheduler = asyncio.run(run())
+    assert scheduler.rejected == 1
+    assert scheduler.queue_depth() == 0
+
+
+def test_run_retries_retryable_errors():
+    async def run():
+        scheduler = GeminiScheduler(rpm=0, tpm=0, max_retries=2, backoff_base=0.01)
+        calls = []
+
+        async def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise GeminiServerError("503", 503)
+            return "ok"
+
+        return await scheduler.run(flaky), len(calls), scheduler.retries
+
+    assert asyncio.run(run()) == ("ok", 3, 2)
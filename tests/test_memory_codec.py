@@ -0,0 +1,132 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+import core
+import fake_firestore
+import memory_migrate
+from memory_codec import LazyMessage, decode_memory, encode_memory, encode_message
+from memory_store import FirestoreStore, SQLiteStore
+
+
+def _messages(n, long_every=3):
+    out = []
+    for i in range(n):
+        content = f"message {i} " * (120 if i % long_every == 0 else 3)
+        role = "user" if i % 2 == 0 else "assistant"
+        out.append({
+            "role": role,
+            "name": "alice" if role == "user" else "Sazami",
+            "content": content,
+            # Stored at millisecond precision
+            "ts": datetime(2026, 10, 18, 12, 0, i % 60, (i + 1) * 1000, tzinfo=timezone.utc).isoformat(),
+            "tok": len(content) // 4,
+        })
+    return out
+
+
+def _memory(n=12):
+    return {"summary": "likes cats", "messages": _messages(n), "char_count": 0, "createdAt": "c", "updatedAt": "u"}
+
+
+@pytest.fixture
+def db():
+    previous = core.DB
+    core.DB = fake_firestore.FakeFirestore()
+    yield core.DB
+    core.DB = previous
+
+
+def test_round_trip_preserves_messages():
+    memory = _memory()
+    doc = encode_memory(memory, compress_min=100)
+    assert doc["v"] == 1 and doc["user"] == "alice"
+    assert any(isinstance(m["c"], bytes) for m in doc["messages"])
+    assert all("n" not in m for m in doc["messages"])  # default names aren't repeated
+    decoded = decode_memory(doc)
+    assert all(isinstance(m, LazyMessage) for m in decoded["messages"])
+    assert decoded["messages"] == memory["messages"]
+
+
+def test_eager_decode_is_json_safe():
+    memory = _memory()
+    decoded = decode_memory(encode_memory(memory, compress_min=100), lazy=False)
+    assert all(type(m) is dict for m in decoded["messages"])
+    assert "v" not in decoded and "user" not in decoded
+    assert json.loads(json.dumps(decoded))["messages"] == memory["messages"]
+
+
+def test_lazy_equality_is_symmetric():
+    raw = encode_message(_messages(1)[0], "alice")
+    decoded, pending = LazyMessage(dict(raw), "alice"), LazyMessage(dict(raw), "alice")
+    decoded.get("content")
+    assert decoded == pending and pending == decoded
+    assert not (decoded != pending)
+    assert _messages(1)[0] == LazyMessage(dict(raw), "alice")
+
+
+def test_other_names_and_legacy_messages():
+    legacy = _messages(2)
+    renamed = dict(legacy[0], name="alice2")
+    doc = encode_memory({"messages": [legacy[0], renamed, legacy[1]]})
+    assert doc["user"] == "alice2" and doc["messages"][0]["n"] == "alice"
+    assert decode_memory(doc)["messages"] == [legacy[0], renamed, legacy[1]]
+    # Old-layout elements pass through untouched
+    assert decode_memory({"messages": legacy})["messages"] == legacy
+
+
+def test_legacy_document_is_rewritten_on_append(db):
+    core.user_doc_ref("1").set(_memory(4))
+    store = FirestoreStore("compact")
+    memory = store.load("1")
+    added = _messages(6)[4:]
+    memory["messages"].extend(added)
+    store.append("1", memory, added, char_delta=10)
+    stored = db.docs["sazami/1"]
+    assert stored["v"] == 1 and all("r" in m for m in stored["messages"])
+    assert store.load("1")["messages"] == _messages(6)
+
+
+def test_compact_document_is_rewritten_by_a_legacy_append(db):
+    FirestoreStore("compact").save("1", _memory(10))
+    store = FirestoreStore("legacy")
+    memory = store.load("1")
+    removed, added = memory["messages"][:4], _messages(12)[10:]
+    memory["messages"] = memory["messages"][4:] + added
+    store.append("1", memory, added, removed=removed)
+    stored = db.docs["sazami/1"]
+    assert stored["v"] == 0 and all("role" in m for m in stored["messages"])
+    assert store.load("1")["messages"] == _messages(12)[4:]
+    # Later legacy appends remove stored elements incrementally again
+    memory = store.load("1")
+    removed = memory["messages"][:2]
+    memory["messages"] = memory["messages"][2:]
+    store.append("1", memory, [], removed=removed)
+    assert store.load("1")["messages"] == _messages(12)[6:]
+
+
+def test_incremental_remove_matches_stored_elements(db):
+    store = FirestoreStore("compact")
+    store.save("1", _memory(10))
+    memory = store.load("1")
+    removed = memory["messages"][:4]
+    store.append("1", memory, [], removed=removed)
+    assert store.load("1")["messages"] == _messages(10)[4:]
+
+
+def test_export_and_import_through_jsonl(db, tmp_path):
+    store = FirestoreStore("compact")
+    store.save("1", _memory())
+    backup = tmp_path / "backup.jsonl"
+    assert memory_migrate.main(["firestore", str(backup)]) == 0
+    exported = json.loads(backup.read_text(encoding="utf-8"))["memory"]
+    assert exported["messages"] == _memory()["messages"]
+
+    target = tmp_path / "mem.sqlite3"
+    assert memory_migrate.main([str(backup), f"sqlite:{target}"]) == 0
+    sqlite = SQLiteStore(str(target))
+    try:
+        assert sqlite.load("1")["messages"] == _memory()["messages"]
+    finally:
+        sqlite.close()
@@ -0,0 +1,75 @@
+import asyncio
+
+from memory_worker import MemoryWorker
+
+
+class Recorder:
+    """Handler that records jobs and fails the test on concurrent cycles for one user."""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.jobs = []
+        self.active = set()
+        self.overlaps = 0
+
+    async def __call__(self, user_id, username, messages):
+        if user_id in self.active:
+            self.overlaps += 1
+        self.active.add(user_id)
+        await asyncio.sleep(self.delay)
+        self.active.discard(user_id)
+        self.jobs.append((user_id, list(messages)))
+
+
+def test_turns_waiting_for_a_user_are_coalesced():
+    async def run():
+        handler = Recorder()
+        worker = MemoryWorker(handler, workers=1)
+        worker.start()
+        await worker.submit("a", "A", [1])
+        await asyncio.sleep(0.005)  # "a" is being persisted
+        for turn in (2, 3, 4):
+            await worker.submit("a", "A", [turn])
+        await worker.stop(5)
+        return handler, worker
+
+    handler, worker = asyncio.run(run())
+    assert handler.jobs == [("a", [1]), ("a", [2, 3, 4])]
+    assert worker.stats()["coalesced"] == 2
+    assert handler.overlaps == 0
+
+
+def test_requeue_on_a_full_queue_is_drained_by_stop():
+    async def run():
+        handler = Recorder()
+        worker = MemoryWorker(handler, maxsize=1, workers=1)
+        worker.start()
+        await worker.submit("a", "A", [1])
+        await asyncio.sleep(0.005)
+        await worker.submit("a", "A", [2])  # waits behind the running job
+        await worker.submit("b", "B", [3])  # fills the queue
+        await worker.stop(5)
+        return handler
+
+    handler = asyncio.run(run())
+    assert sorted(handler.jobs) == [("a", [1]), ("a", [2]), ("b", [3])]
+
+
+def test_turns_submitted_while_draining_do_not_race_the_running_job():
+    async def run():
+        handler = Recorder(delay=0.05)
+        worker = MemoryWorker(handler, workers=1)
+        worker.start()
+        await worker.submit("a", "A", [1])
+        await asyncio.sleep(0.005)
+        stopping = asyncio.create_task(worker.stop(5))
+        await asyncio.sleep(0.005)
+        await worker.submit("a", "A", [2])
+        await stopping
+        await worker.submit("a", "A", [3])  # stopped: persisted inline
+        return handler, worker
+
+    handler, worker = asyncio.run(run())
+    assert handler.jobs == [("a", [1]), ("a", [2]), ("a", [3])]
+    assert handler.overlaps == 0
+    assert not worker.running
@@ -0,0 +1,19 @@
+from metrics import Metrics, RequestTrace
+
+
+def test_request_latency_is_recorded_per_outcome():
+    metrics = Metrics()
+    for outcome in ("ok", "shed", "shed"):
+        RequestTrace(metrics=metrics, slow_ms=float("inf")).finish(outcome)
+    histograms = metrics.snapshot()["histograms"]
+    assert histograms['request_seconds{kind="message",outcome="ok"}']["count"] == 1
+    assert histograms['request_seconds{kind="message",outcome="shed"}']["count"] == 2
+
+
+def test_prometheus_export_includes_labels():
+    metrics = Metrics()
+    metrics.incr("requests", kind="message", outcome="ok")
+    metrics.observe("stage_seconds", 0.5, stage="generate")
+    text = metrics.render_prometheus()
+    assert 'sazami_requests_total{kind="message",outcome="ok"} 1' in text
+    assert 'sazami_stage_seconds{stage="generate",quantile="0.5"} 0.500000' in text
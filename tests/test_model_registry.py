@@ -0,0 +1,59 @@
+import asyncio
+
+from model_registry import TASK_CHAT, TASK_SUMMARY, Hedger, ModelRegistry
+
+
+def _answer(value, delay):
+    async def call():
+        await asyncio.sleep(delay)
+        return value
+
+    return call
+
+
+def test_routes_fall_back_to_the_default_model():
+    registry = ModelRegistry({TASK_CHAT: "chat-model", TASK_SUMMARY: "lite-model"}, default="main", cache_ttl=0)
+    registry.available = {"main", "chat-model"}
+    assert registry.model_for(TASK_CHAT) == "chat-model"
+    assert registry.model_for(TASK_SUMMARY) == "main"  # not listed by discovery
+    registry.reject("chat-model")
+    assert registry.model_for(TASK_CHAT) == "main"
+    assert registry.stats()["fallbacks"] == 2
+
+
+def test_backup_wins_but_the_primary_latency_is_recorded():
+    async def run():
+        hedger = Hedger("backup-model", after=0.05, max_ratio=1)
+        result = await hedger.run(_answer("primary", 0.1), _answer("backup", 0.01))
+        assert not hedger.latency.samples  # the primary is still running
+        await asyncio.sleep(0.15)
+        return hedger, result
+
+    hedger, result = asyncio.run(run())
+    assert result == "backup"
+    assert hedger.backup_won == 1
+    assert len(hedger.latency.samples) == 1
+    assert 0.1 <= hedger.latency.samples[0] < 0.15
+
+
+def test_a_stalled_primary_is_recorded_at_the_straggler_limit():
+    async def run():
+        hedger = Hedger("backup-model", after=0.02, max_ratio=1, straggler_factor=3)
+        result = await hedger.run(_answer("primary", 10), _answer("backup", 0))
+        await asyncio.sleep(0.1)
+        return hedger, result
+
+    hedger, result = asyncio.run(run())
+    assert result == "backup"
+    assert 0.06 <= hedger.latency.samples[0] < 0.1
+
+
+def test_no_hedge_before_enough_samples():
+    async def run():
+        hedger = Hedger("backup-model", min_samples=5, max_ratio=1)
+        return hedger, await hedger.run(_answer("primary", 0.01), _answer("backup", 0))
+
+    hedger, result = asyncio.run(run())
+    assert result == "primary"
+    assert hedger.hedged == 0
+    assert len(hedger.latency.samples) == 1
@@ -0,0 +1,112 @@
+import asyncio
+import socket
+
+import pytest
+
+import sharding
+from sharding import HashRing, ShardRouter, guild_shard, worker_shards
+
+
+class FakeClient:
+    def is_ready(self):
+        return True
+
+    def get_partial_messageable(self, channel_id, guild_id=None):
+        return ("channel", channel_id, guild_id)
+
+
+class Author:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"user{user_id}"
+
+
+class Message:
+    def __init__(self, user_id):
+        self.id = 1000 + user_id
+        self.content = "hi"
+        self.author = Author(user_id)
+        self.channel = type("Channel", (), {"id": 7})()
+        self.guild = None
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_ring_is_stable_and_moves_few_users_when_a_worker_is_added():
+    users = [str(i) for i in range(2000)]
+    three, four = HashRing(3), HashRing(4)
+    assert [three.owner(u) for u in users] == [HashRing(3).owner(u) for u in users]
+    moved = sum(three.owner(u) != four.owner(u) for u in users)
+    assert moved < len(users) * 0.4  # ~1/4 expected; a modulo split would move ~3/4
+    assert {four.owner(u) for u in users} == {0, 1, 2, 3}
+
+
+def test_shards_are_split_across_workers():
+    shards = [worker_shards(i, workers=3, shard_count=8) for i in range(3)]
+    assert sorted(s for worker in shards for s in worker) == list(range(8))
+    assert guild_shard(123 << 22, shard_count=8) == 123 % 8
+
+
+def test_messages_are_forwarded_to_the_owning_worker(monkeypatch):
+    monkeypatch.setattr(sharding, "SHARD_IPC_BASE_PORT", _free_port())
+    monkeypatch.setattr(sharding, "SHARD_PEERS", [])
+
+    async def run():
+        delivered = {0: [], 1: [], "intruder": []}
+
+        def router(index, secret="s3cret", key=None):
+            async def deliver(message):
+                delivered[key if key is not None else index].append(message)
+            return ShardRouter(deliver, FakeClient(), index=index, workers=2, secret=secret)
+
+        owner = router(0)
+        sender, intruder = router(1), router(1, secret="wrong", key="intruder")
+        user = next(u for u in range(100) if owner.owner(u) == 0)
+        await owner.serve()
+        try:
+            await sender.route(Message(user))
+            await intruder.route(Message(user))  # rejected, so handled where it arrived
+            await asyncio.sleep(0.05)  # delivery runs after the acknowledgement
+        finally:
+            for r in (sender, intruder, owner):
+                await r.stop()
+        return user, delivered, sender.stats(), intruder.stats(), owner.stats()
+
+    user, delivered, sender, intruder, owner = asyncio.run(run())
+    assert not delivered[1]
+    [message] = delivered[0]
+    assert (message.author.id, message.content, message.channel) == (user, "hi", ("channel", 7, None))
+    assert sender["forwarded"] == 1 and owner["received"] == 1
+    assert len(delivered["intruder"]) == 1 and intruder["forward_failed"] == 1
+
+
+def test_unreachable_owner_is_handled_locally(monkeypatch):
+    monkeypatch.setattr(sharding, "SHARD_IPC_BASE_PORT", _free_port())
+    monkeypatch.setattr(sharding, "SHARD_PEERS", [])
+
+    async def run():
+        delivered = []
+
+        async def deliver(message):
+            delivered.append(message)
+
+        router = ShardRouter(deliver, FakeClient(), index=1, workers=2, secret="s3cret")
+        user = next(u for u in range(100) if router.owner(u) == 0)
+        try:
+            await router.route(Message(user))
+        finally:
+            await router.stop()
+        return delivered, router.stats()
+
+    delivered, stats = asyncio.run(run())
+    assert len(delivered) == 1 and stats["forward_failed"] == 1
+
+
+def test_serve_refuses_an_empty_secret():
+    router = ShardRouter(None, FakeClient(), index=0, workers=2, secret="")
+    with pytest.raises(RuntimeError):
+        asyncio.run(router.serve())
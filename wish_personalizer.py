@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+from typing import Any, Dict, Optional, Sequence
+
+from dotenv import load_dotenv
+
+import core
+from gemini_client import GeminiError
+from gemini_scheduler import PRIORITY_BACKGROUND
+from memory_store import get_memory_store
+from model_registry import TASK_WISH
+
+load_dotenv()
+
+# Members per Gemini call: starting point and bounds for the adaptive size
+WISH_BATCH_SIZE = int(os.getenv("WISH_BATCH_SIZE", "20"))
+WISH_BATCH_MIN = int(os.getenv("WISH_BATCH_MIN", "4"))
+WISH_BATCH_MAX = int(os.getenv("WISH_BATCH_MAX", "50"))
+# Per-member memory summary is trimmed to this many chars in the prompt
+WISH_SUMMARY_MAX_CHARS = int(os.getenv("WISH_SUMMARY_MAX_CHARS", "600"))
+WISH_MAX_CHARS = 1500
+
+RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "user_id": {"type": "STRING"},
+            "wish": {"type": "STRING"},
+        },
+        "required": ["user_id", "wish"],
+    },
+}
+
+
+def load_summaries(user_ids: Sequence[int]) -> Dict[int, str]:
+    """Read memory summaries for many users in one round trip to the memory store."""
+    store = get_memory_store()
+    if not user_ids or not store.available():
+        return {}
+    try:
+        return {int(uid): summary for uid, summary in store.summaries([str(uid) for uid in user_ids]).items()}
+    except Exception as e:
+        print(f"Failed to load member summaries: {e}")
+        return {}
+
+
+class WishPersonalizer:
+    """Personalized DM wishes for many members per Gemini call.
+
+    Members without a memory summary get the generic wish and cost nothing.
+    The rest are packed into one structured-JSON request per batch that
+    returns a wish per user id; each entry is validated on its own and bad or
+    missing ones fall back to the generic wish. The batch size grows after
+    clean batches and halves (splitting the failed batch) when a response is
+    rejected, unparsable or truncated.
+    """
+
+    def __init__(
+        self,
+        time_of_day: str,
+        fallback: str,
+        *,
+        batch_size: int = WISH_BATCH_SIZE,
+        min_batch: int = WISH_BATCH_MIN,
+        max_batch: int = WISH_BATCH_MAX,
+    ):
+        self.time_of_day = time_of_day
+        self.fallback = fallback
+        self.min_batch = max(1, min_batch)
+        self.max_batch = max(self.min_batch, max_batch)
+        self.batch_size = min(self.max_batch, max(self.min_batch, batch_size))
+        self.calls = 0
+        self.personalized = 0
+        self.fell_back = 0
+
+    def _prompt(self, summaries: Dict[int, str]) -> str:
+        friends = "\n".join(
+            f"- user_id: {uid}\n  memory: {summary[:WISH_SUMMARY_MAX_CHARS]}" for uid, summary in summaries.items()
+        )
+        return (
+            f"Write a warm, cute {self.time_of_day} wish to send via DM to each friend below. "
+            "Keep it in character (Sazami). Personalize each wish with a light touch using what you "
+            "remember about that friend, but never mention names or that you keep notes. Use emojis. "
+            "Return a JSON array with exactly one {\"user_id\", \"wish\"} object per friend.\n\n"
+            f"Friends:\n{friends}"
+        )
+
+    def _validate(self, raw: str, summaries: Dict[int, str]) -> Optional[Dict[int, str]]:
+        try:
+            entries = json.loads(raw)
+        except ValueError:
+            return None  # unparsable, usually a truncated response
+        if not isinstance(entries, list):
+            return None
+        wishes: Dict[int, str] = {}
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            try:
+                uid = int(str(entry.get("user_id", "")).strip())
+            except ValueError:
+                continue
+            wish = entry.get("wish")
+            if uid in summaries and isinstance(wish, str) and 0 < len(wish.strip()) <= WISH_MAX_CHARS:
+                wishes[uid] = wish.strip()
+        return wishes
+
+    async def _generate(self, summaries: Dict[int, str]) -> Dict[int, str]:
+        self.calls += 1
+        try:
+            raw = await core.gemini_generate(
+                self._prompt(summaries),
+                priority=PRIORITY_BACKGROUND,
+                task=TASK_WISH,
+                generation_config={"responseMimeType": "application/json", "responseSchema": RESPONSE_SCHEMA},
+            )
+            wishes = self._validate(raw, summaries)
+        except GeminiError as e:
+            print(f"Batch wish generation failed ({e}).")
+            wishes = None
+
+        if wishes is None:
+            self.batch_size = max(self.min_batch, self.batch_size // 2)
+            if len(summaries) > self.min_batch:
+                items = list(summaries.items())
+                half = len(items) // 2
+                first, second = await asyncio.gather(
+                    self._generate(dict(items[:half])), self._generate(dict(items[half:]))
+                )
+                return {**first, **second}
+            return {}
+
+        if len(wishes) == len(summaries):
+            self.batch_size = min(self.max_batch, self.batch_size + max(1, self.batch_size // 4))
+        return wishes
+
+    async def wishes_for(self, user_ids: Sequence[int]) -> Dict[int, str]:
+        """Return a wish for every id (personalized where possible)."""
+        summaries = await asyncio.to_thread(load_summaries, list(user_ids))
+        wishes = await self._generate(summaries) if summaries else {}
+        result: Dict[int, str] = {}
+        for uid in user_ids:
+            if uid in wishes:
+                self.personalized += 1
+                result[uid] = wishes[uid]
+            else:
+                self.fell_back += 1
+                result[uid] = self.fallback
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "personalized": self.personalized,
+            "fallback": self.fell_back,
+            "batch_size": self.batch_size,
+        }
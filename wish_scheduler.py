@@ -0,0 +1,136 @@
+import asyncio
+import datetime
+import os
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import pytz
+from dotenv import load_dotenv
+
+load_dotenv()
+
+IST = pytz.timezone("Asia/Kolkata")
+
+# Run the daily wishes from the long-lived bot process instead of cron jobs
+WISH_SCHEDULER_ENABLED = os.getenv("WISH_SCHEDULER_ENABLED", "false").strip().lower() in ("1", "true", "yes", "on")
+# IST slots, "HH:MM=TimeOfDay" comma-separated (same times as the workflow's cron)
+WISH_SLOTS = os.getenv("WISH_SLOTS", "09:00=Morning,12:00=Noon,16:00=Afternoon,19:00=Evening,23:00=Night")
+# A slot missed while the bot was down is still run if we're back within this many hours
+WISH_CATCHUP_HOURS = float(os.getenv("WISH_CATCHUP_HOURS", "3"))
+# Longest single sleep, so wall-clock jumps (suspend, NTP) are noticed
+_MAX_SLEEP = 300.0
+
+# run(time_of_day, run_date) -> None; is_done(run_date, time_of_day) -> bool
+RunFn = Callable[..., Awaitable[None]]
+DoneFn = Callable[[str, str], bool]
+
+
+def parse_slots(spec: str) -> List[Tuple[datetime.time, str]]:
+    slots = []
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        at, _, time_of_day = part.partition("=")
+        hour, _, minute = at.strip().partition(":")
+        slots.append((datetime.time(int(hour), int(minute or 0)), time_of_day.strip()))
+    return sorted(slots)
+
+
+class WishScheduler:
+    """Resident daily-wish schedule inside the bot process.
+
+    Sleeps until the next IST slot and runs that slot's wishes on the bot's
+    own gateway session, member cache and HTTP pool. On start it catches up
+    on the most recent slot if it passed less than `catchup_hours` ago and
+    the journal has no finished run for it. Runs (scheduled or triggered by
+    hand) never overlap.
+    """
+
+    def __init__(
+        self,
+        run: RunFn,
+        is_done: DoneFn,
+        *,
+        slots: Optional[List[Tuple[datetime.time, str]]] = None,
+        catchup_hours: float = WISH_CATCHUP_HOURS,
+    ):
+        self.run = run
+        self.is_done = is_done
+        self.slots = slots if slots is not None else parse_slots(WISH_SLOTS)
+        self.catchup = datetime.timedelta(hours=catchup_hours)
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+
+    def _slot_times(self, day: datetime.date) -> List[Tuple[datetime.datetime, str]]:
+        return [(IST.localize(datetime.datetime.combine(day, at)), tod) for at, tod in self.slots]
+
+    def next_slot(self, now: datetime.datetime) -> Tuple[datetime.datetime, str]:
+        for day in (now.date(), now.date() + datetime.timedelta(days=1)):
+            for at, tod in self._slot_times(day):
+                if at > now:
+                    return at, tod
+        raise ValueError("no wish slots configured")
+
+    def last_slot(self, now: datetime.datetime) -> Optional[Tuple[datetime.datetime, str]]:
+        last = None
+        for day in (now.date() - datetime.timedelta(days=1), now.date()):
+            for at, tod in self._slot_times(day):
+                if at <= now:
+                    last = (at, tod)
+        return last
+
+    async def trigger(self, time_of_day: str, run_date: Optional[str] = None, **kwargs) -> bool:
+        """Run one slot now; returns False if another run was already in progress."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        if self._lock.locked():
+            print(f"Wish run already in progress; skipping {time_of_day}.")
+            return False
+        async with self._lock:
+            print(f"Wish run starting: {time_of_day} ({run_date or 'today'})")
+            try:
+                await self.run(time_of_day, run_date=run_date, **kwargs)
+            except Exception as e:
+                print(f"Wish run {time_of_day} failed: {e}")
+            self.runs += 1
+        return True
+
+    async def _catch_up(self):
+        now = datetime.datetime.now(IST)
+        last = self.last_slot(now)
+        if last is None or now - last[0] > self.catchup:
+            return
+        at, tod = last
+        run_date = at.strftime("%Y-%m-%d")
+        if await asyncio.to_thread(self.is_done, run_date, tod):
+            return
+        print(f"Catching up on missed {tod} wishes from {at:%H:%M} IST.")
+        await self.trigger(tod, run_date)
+
+    async def _loop(self, ready: Optional[Callable[[], Awaitable[None]]]):
+        if ready is not None:
+            await ready()
+        await self._catch_up()
+        while True:
+            at, tod = self.next_slot(datetime.datetime.now(IST))
+            print(f"Next wish run: {tod} at {at:%Y-%m-%d %H:%M} IST")
+            while True:
+                left = (at - datetime.datetime.now(IST)).total_seconds()
+                if left <= 0:
+                    break
+                await asyncio.sleep(min(left, _MAX_SLEEP))
+            await self.trigger(tod, at.strftime("%Y-%m-%d"))
+
+    def start(self, ready: Optional[Callable[[], Awaitable[None]]] = None):
+        """Start the schedule on the running loop; `ready` is awaited first (e.g. bot.wait_until_ready)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._loop(ready))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None